@@ -16,28 +16,105 @@
 #
 
 from tokenType import tokType
+from mdownMarkup import tokenizeInline, collectReferences, matchDefinition
+from mdownTokens import inlineSpecialExp
+from mdownTree import containerNode
+from html import escape
+from operator import methodcaller
+
+# HTML tag of every text markup token
+markupTags = {
+    tokType.LBOLD: "strong",
+    tokType.RBOLD: "strong",
+    tokType.LITALIC: "em",
+    tokType.RITALIC: "em",
+    tokType.CROSS: "del",
+    tokType.ICODE: "code",
+}
+# Text written for every markup token which is not matched with a pair
+markupText = {
+    tokType.LBOLD: "**",
+    tokType.RBOLD: "**",
+    tokType.LITALIC: "*",
+    tokType.RITALIC: "*",
+    tokType.CROSS: "~~",
+    tokType.ICODE: "`",
+}
+# Markup tokens which can start or end a run of marked up text
+openingTypes = {tokType.LBOLD, tokType.LITALIC, tokType.CROSS}
+closingTypes = {tokType.RBOLD, tokType.RITALIC, tokType.CROSS}
+
+# Handler of every type of document token, see HTMLConverter.convertToken.
+# Built in handlers call the method of the converter so that subclasses and
+# instrumented converters are used. Tokens without a handler are skipped
+tokenHandlers = {
+    tokType.MHEADING: methodcaller("convertHeading"),
+    tokType.UHEADING: methodcaller("convertHeading"),
+    tokType.BULLET: methodcaller("convertListItem"),
+    tokType.NUMBULLET: methodcaller("convertListItem"),
+    tokType.CHECKMARK: methodcaller("convertListItem"),
+    tokType.HR: methodcaller("convertHR"),
+    tokType.CBLOCK: methodcaller("convertCodeBlock"),
+    tokType.LINK: methodcaller("convertLink"),
+    tokType.IMAGE: methodcaller("convertImage"),
+    tokType.BLANK: methodcaller("convertBlank"),
+}
+
+
+def registerHandler(tokenType, handler):
+    """ Make handler convert the document tokens of the given type. It is
+        called with the converter, whose currTok is the token, and writes the
+        HTML with converter.write """
+    tokenHandlers[tokenType] = handler
+
+
+def registerMarkup(tokenType, tag, text, opening=True, closing=True):
+    """ Make an inline markup token type convert to the given HTML tag when
+        it is paired, and to text when it is not. opening and closing tell
+        which side of a pair the token can stand on """
+    markupTags[tokenType] = tag
+    markupText[tokenType] = text
+    for types, allowed in ((openingTypes, opening), (closingTypes, closing)):
+        if allowed:
+            types.add(tokenType)
+        else:
+            types.discard(tokenType)
 
 
 class HTMLConverter:
     """ Convert a stream of tokens passed by \"tokenStream\" into a 
         valid HTML file which is saved in the file represented by 
-        \"outputFileHandle\" """
+        \"outputFileHandle\". Without a file handle, the HTML can be
+        retrieved with render() """
 
-    def __init__(self, tokenStream, outputFileHandle):
+    def __init__(
+        self, tokenStream, outputFileHandle=None, bufferSize=1 << 16, references=None
+    ):
         # File handle to the output file
         self.fileHandle = outputFileHandle
+        # Output which has not been written to the file yet
+        self.buffer = []
+        # Number of characters held by the buffer
+        self.bufferedChars = 0
+        # The buffer is written to the file once it holds this many characters
+        self.bufferSize = bufferSize
         # Holds the stream of tokens
         self.tokens = tokenStream
         # The index along the stream
         self.currIndex = 0
         # Holds the current token
         self.currTok = self.tokens[self.currIndex]
-        print(self.currTok)
+        # Tag of the list which is currently open in the output, if any
+        self.openList = None
+        # Reference link definitions of the document, see collectReferences.
+        # Collected from the tokens before converting them unless provided
+        self.references = references
 
     def nextTok(self):
         """ Increments the position, sets the next token and returns it"""
-        self.currTok = self.tokens[self.currIndex]
         self.currIndex += 1
+        if self.currIndex < len(self.tokens):
+            self.currTok = self.tokens[self.currIndex]
         return self.currTok
 
     def peekTok(self, n=1):
@@ -47,132 +124,330 @@ class HTMLConverter:
 
     def write(self, htmlString):
         """ Writes the provided HTML string to the output file 
-            which is represented by the var called fileHandle """
-        self.fileHandle.write(htmlString + "\n")
-
-    def isMatch(self, text, endTokType, singleLine):
-        """ Check if the provided token exists in the current line or 
-            the current block if no flag is provided """
-        # Get the next token
-        print(text)
-        textLen = len(text)
-        currIndex = 0
-        if singleLine and currIndex + 1 < textLen:
-            while currIndex < len(text):
-                currTok = text[currIndex]
-                if currTok["type"] == endTokType:
-                    return True
-                else:
-                    currIndex += 1
+            which is represented by the var called fileHandle. The output is
+            buffered and written in chunks of bufferSize characters """
+        self.buffer.append(htmlString)
+        self.buffer.append("\n")
+        self.bufferedChars += len(htmlString) + 1
+        if self.bufferedChars >= self.bufferSize and self.fileHandle is not None:
+            self.flush()
 
-            return False
+    def flush(self):
+        """ Write everything held by the buffer to the output file """
+        if len(self.buffer) != 0:
+            self.fileHandle.write("".join(self.buffer))
+            self.buffer = []
+            self.bufferedChars = 0
 
     def tokToString(self, token):
         """ Convert any type of text markup token(bold, italics...) to its
             text representation if it cannot be matched with a closing pair """
-        if token["type"] == tokType.RBOLD or token["type"] == tokType.LBOLD:
-            return "**"
-        elif token["type"] == tokType.ICODE:
-            return "`"
-        elif token["type"] == tokType.CROSS:
-            return "~~"
-        elif token["type"] == tokType.LITALIC or token["type"] == tokType.RITALIC:
-            return "*"
+        return markupText.get(token["type"])
 
     def tokToHtml(self, token, close):
         """ Return the HTML representation of the token. This can be either the
             opening or closing tag depending on whether the argument \"close\"
             is true or not """
+        tag = markupTags[token["type"]]
         if close is True:
-            if token["type"] == tokType.LBOLD:
-                return "</strong>"
-            elif token["type"] == tokType.LITALIC:
-                return "</em>"
-            elif token["type"] == tokType.CROSS:
-                return "</del>"
-            elif token["type"] == tokType.ICODE:
-                return "</code>"
-            else:
-                if token["type"] == tokType.RBOLD:
-                    return "<strong>"
-                elif token["type"] == tokType.RITALIC:
-                    return "<em>"
-                elif token["type"] == tokType.CROSS:
-                    return "<del>"
-                elif token["type"] == tokType.ICODE:
-                    return "<code>"
+            return "</{0}>".format(tag)
+        return "<{0}>".format(tag)
+
+    def convertCode(self, text, start, end):
+        """ Convert the tokens between two matching inline code tokens. Their
+            content is kept as is, including any markup """
+        pieces = ["<code>"]
+        for index in range(start + 1, end):
+            subTok = text[index]
+            if subTok["type"] == tokType.PLAIN:
+                pieces.append(escape(subTok["content"], quote=False))
+            elif subTok["type"] in markupTags:
+                pieces.append(self.tokToString(subTok))
+        pieces.append("</code>")
+        return "".join(pieces)
 
     def convertText(self, text, singleLine):
-        """ Converts text tokens to their HTML form. When a special token
-            such as bold or italic, they are converted only if a matching 
-            is found in the same block. Blocks are defined with spaces at 
-            their end. If a matching token is not found inside the block 
-            then the token is turned into its text representation """
+        """ Converts text tokens to their HTML form. Markup tokens such as bold
+            or italic are paired up in a single pass over the line, keeping a
+            stack of the opening tokens which still wait for a closing one,
+            in the style of the CommonMark emphasis algorithm. A closing token
+            pairs with the nearest waiting opener of its kind and any opener
+            above it on the stack is dropped. Tokens which are not matched on
+            the line are turned into their text representation """
+        pieces = []
+        # Position in pieces and tag of every opener waiting for a closer
+        openers = []
+        # Number of waiting openers of every tag
+        openCount = dict.fromkeys(markupTags.values(), 0)
+
+        # Inline code spans are paired up first since markup inside of them
+        # is not recognized
+        codeEnds = {}
+        codeStart = None
+        for index, subTok in enumerate(text):
+            if subTok["type"] == tokType.ICODE:
+                if codeStart is None:
+                    codeStart = index
+                else:
+                    codeEnds[codeStart] = index
+                    codeStart = None
 
-        markUpText = ""
         textLen = len(text)
+        index = 0
+        while index < textLen:
+            subTok = text[index]
+            tokenType = subTok["type"]
+            if tokenType == tokType.PLAIN:
+                pieces.append(escape(subTok["content"], quote=False))
+            elif tokenType == tokType.LINK:
+                pieces.append(self.linkHtml(subTok))
+            elif tokenType == tokType.IMAGE:
+                pieces.append(self.imageHtml(subTok))
+            elif index in codeEnds:
+                pieces.append(self.convertCode(text, index, codeEnds[index]))
+                index = codeEnds[index]
+            elif tokenType in markupTags:
+                tag = markupTags[tokenType]
+                pieces.append(self.tokToString(subTok))
+                # A left run right after a word may also close
+                canClose = tokenType in closingTypes or (
+                    tokenType in openingTypes
+                    and index != 0
+                    and text[index - 1]["type"] == tokType.PLAIN
+                    and not text[index - 1]["content"][-1:].isspace()
+                )
+                if canClose and openCount[tag] != 0:
+                    while True:
+                        openerPos, openerTag = openers.pop()
+                        openCount[openerTag] -= 1
+                        if openerTag == tag:
+                            break
+                    pieces[openerPos] = "<{0}>".format(tag)
+                    pieces[-1] = "</{0}>".format(tag)
+                elif tokenType in openingTypes:
+                    openers.append((len(pieces) - 1, tag))
+                    openCount[tag] += 1
 
-        if singleLine:
-            index = 0
-            while index < textLen:
-                subTok = text[index]
-                if subTok["type"] == tokType.PLAIN:
-                    markUpText += subTok["content"]
-                else:
-                    searchTokType = None
-                    if subTok["type"] == tokType.LBOLD:
-                        searchTokType = tokType.RBOLD
-                    elif subTok["type"] == tokType.LITALIC:
-                        searchTokType = tokType.RITALIC
-                    elif subTok["type"] == tokType.CROSS:
-                        searchTokType = tokType.CROSS
-                    elif subTok["type"] == tokType.ICODE:
-                        searchTokType = tokType.ICODE
-                    # check if the current token matches on the line
-                    if self.isMatch(text[index + 1 :], searchTokType, True):
-                        print("Match")
-                        return True
-                    else:
-                        return False
-
-                index += 1
-
-            return markUpText
+            index += 1
+
+        return "".join(pieces)
+
+    def convertInline(self, text, markup=None):
+        """ Convert the text held by a heading, bullet or plain text token
+            to HTML. markup tells if the text may hold any inline markup, as
+            recorded by the tokenizer on plain text tokens. Text without any,
+            nor any link, is only escaped """
+        if markup is None:
+            markup = inlineSpecialExp.search(text) is not None
+        if not markup and (self.references is None or "[" not in text):
+            return escape(text, quote=False)
+        return self.convertText(tokenizeInline(text, self.references), True)
+
+    def openListTag(self, tag):
+        """ Make sure a list with the given tag(ul or ol) is open before
+            writing a list item """
+        if self.openList != tag:
+            self.closeList()
+            self.write("<{0}>".format(tag))
+            self.openList = tag
+
+    def closeList(self):
+        """ Close the list which is currently open, if any """
+        if self.openList is not None:
+            self.write("</{0}>".format(self.openList))
+            self.openList = None
 
     def convertHeading(self):
         """ Convert a heading to html and add it to output file """
-        size = self.currTok["size"]
-        content = self.convertText(self.currTok["content"], True)
+        self.closeList()
+        # The tokenizer does not record the underline style of an
+        # underlined heading so those are all top level headings
+        size = self.currTok.get("size", 1)
+        content = self.convertInline(self.currTok["content"])
         outputString = "<h{0}>{1}</h{0}>".format(size, content)
         self.write(outputString)
 
+    def listItemContent(self, token):
+        """ Return the HTML of the text of a list item. A checklist item
+            starts with its check box """
+        content = self.convertInline(token["content"])
+        if token["type"] == tokType.CHECKMARK:
+            checked = " checked" if token["status"] else ""
+            content = '<input type="checkbox" disabled{0}> {1}'.format(
+                checked, content
+            )
+        return content
+
+    def convertListItem(self):
+        """ Convert a bullet, numbered bullet or checklist item to html and
+            add it to the output file """
+        tokenType = self.currTok["type"]
+        self.openListTag("ol" if tokenType == tokType.NUMBULLET else "ul")
+        self.write("<li>{0}</li>".format(self.listItemContent(self.currTok)))
+
+    def convertBlock(self, block):
+        """ Convert a block of plain text to html paragraphs and add them to
+            the output file. Blank lines separate the paragraphs """
+        lines = []
+        for token in block:
+            if token["type"] == tokType.PLAIN:
+                # Reference link definitions are not part of the output
+                if self.references is not None and matchDefinition(token["content"]):
+                    continue
+                lines.append(self.convertInline(token["content"], token.get("markup")))
+            elif token["type"] == tokType.BLANK and len(lines) != 0:
+                self.closeList()
+                self.write("<p>{0}</p>".format("\n".join(lines)))
+                lines = []
+
+        if len(lines) != 0:
+            self.closeList()
+            self.write("<p>{0}</p>".format("\n".join(lines)))
+
+    def convertCodeBlock(self):
+        """ Converts a code block to HTML and adds it to the output file in a
+            single write. The code is only escaped """
+        self.closeList()
+        lang = self.currTok.get("lang")
+        langClass = ' class="language-{0}"'.format(escape(lang)) if lang else ""
+        code = escape(self.currTok["content"], quote=False)
+        self.write("<pre><code{0}>{1}</code></pre>".format(langClass, code))
+
+    def convertHR(self):
+        """ Converts a horizontal rule to HTML and adds it to the output file """
+        self.closeList()
+        self.write("<hr>")
+
+    def convertBlank(self):
+        """ A blank line outside of a block only adds an empty line """
+        self.write("")
+
+    def linkHtml(self, token):
+        """ Return the HTML of a link token """
+        linkTitle = token["title"]
+        linkPath = token["path"]
+        return '<a href="{0}">{1}</a>'.format(
+            escape(linkPath), escape(linkTitle, quote=False)
+        )
+
+    def imageHtml(self, token):
+        """ Return the HTML of an image token """
+        imgAltText = token["desc"]
+        imgPath = token["url"]
+        return '<img src="{0}" alt="{1}" width="200" height="200">'.format(
+            escape(imgPath), escape(imgAltText)
+        )
+
     def convertLink(self):
         """ Converts a link to HTML and adds it to the output file """
-        linkTitle = self.currTok["title"]
-        linkPath = self.currTok["path"]
-        outputString = '<a href="{0}">{1}</a>'
-        self.write(outputString)
+        self.write(self.linkHtml(self.currTok))
 
     def convertImage(self):
         """ Converts an image link to HTML and adds it to the output file """
-        imgAltText = self.currtok["title"]
-        imgPath = self.currTok["path"]
-        outputString = '<img src="{0}" alt="{1}" width="200" height="200">'
+        self.write(self.imageHtml(self.currTok))
+
+    def prepareReferences(self):
+        """ Collect the reference link definitions of the tokens in a pre-pass,
+            unless they were provided """
+        if self.references is None:
+            self.references = collectReferences(self.tokens)
+
+    def convertToken(self):
+        """ Convert the current token to HTML and add it to the output. The
+            handler of the token is looked up in tokenHandlers by its type """
+        token = self.currTok
+        # Block of plain text
+        if isinstance(token, list):
+            self.convertBlock(token)
+            return
+        handler = tokenHandlers.get(token["type"])
+        if handler is not None:
+            handler(self)
 
     def convertTokens(self):
+        self.prepareReferences()
         streamLen = len(self.tokens)
         while self.currIndex < streamLen:
-            # Marked Heading
-            if self.currTok["type"] == tokType.MHEADING:
-                self.convertHeading()
-            # Regular link
-            elif self.currTok["type"] == tokType.LINK:
-                self.convertLink()
-            # Image link
-            elif self.currTok["type"] == tokType.IMAGE:
-                self.convertImage()
-            # Blank line
-            elif self.currTok["type"] == tokType.BLANK:
-                self.write("")
-
+            self.convertToken()
             self.nextTok()
+
+        self.closeList()
+        if self.fileHandle is not None:
+            self.flush()
+
+    def openContainer(self, node):
+        """ Write the opening tag of a container of the tree and return its
+            closing tag. None if the container is already closed """
+        if node.type == tokType.LIST:
+            tag = "ol" if node.ordered else "ul"
+            self.write("<{0}>".format(tag))
+            return "</{0}>".format(tag)
+        if node.type == tokType.LISTITEM:
+            content = self.listItemContent(node.token)
+            # Blank lines after the text of an item do not nest anything
+            if all(
+                isinstance(child, list)
+                and all(token["type"] == tokType.BLANK for token in child)
+                for child in node.children
+            ):
+                self.write("<li>{0}</li>".format(content))
+                return None
+            self.write("<li>{0}".format(content))
+            return "</li>"
+        if node.type == tokType.BLOCKQUOTE:
+            self.write("<blockquote>")
+            return "</blockquote>"
+        return ""
+
+    def convertTree(self):
+        """ Convert the tokens as a container tree, see mdownTree. Nested
+            lists and block quotes are written as the walk enters and leaves
+            them. The walk keeps its own stack of the children left in every
+            open container so every node is visited once and deep nesting
+            does not run into the recursion limit """
+        self.prepareReferences()
+        pending = [iter(self.tokens)]
+        # Closing tag of every open container
+        closing = [""]
+        while len(pending) != 0:
+            node = next(pending[-1], None)
+            if node is None:
+                pending.pop()
+                tag = closing.pop()
+                if tag:
+                    self.write(tag)
+            elif isinstance(node, containerNode):
+                tag = self.openContainer(node)
+                if tag is not None:
+                    pending.append(iter(node.children))
+                    closing.append(tag)
+            else:
+                self.currTok = node
+                self.convertToken()
+
+        if self.fileHandle is not None:
+            self.flush()
+
+    def render(self, encoding=None, nested=False):
+        """ Convert the tokens and return the HTML as a single string instead
+            of writing it to the output file. When an encoding such as
+            "utf-8" is provided, the HTML is returned as encoded bytes. With
+            nested=True the tokens are a container tree, see convertTree """
+        fileHandle = self.fileHandle
+        self.fileHandle = None
+        self.currIndex = 0
+        self.currTok = self.tokens[self.currIndex]
+        try:
+            if nested:
+                self.convertTree()
+            else:
+                self.convertTokens()
+            html = "".join(self.buffer)
+        finally:
+            self.fileHandle = fileHandle
+            self.buffer = []
+            self.bufferedChars = 0
+
+        if encoding is not None:
+            return html.encode(encoding)
+        return html
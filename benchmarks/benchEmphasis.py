@@ -0,0 +1,63 @@
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#     Copyright (C) 2019 Yavor Konstantinov
+#
+""" Checks that pairing markup tokens in HTMLConverter.convertText scales
+    linearly with the number of tokens on a line """
+
+from HtmlConverter import HTMLConverter
+from mdownMarkup import tokenizeInline
+import io
+import time
+
+# Lines of matched markup and of openers which are never closed. The second
+# one was the worst case for the old pairing, which rescanned the rest of the
+# line for every opener
+PATTERNS = {"matched": "*a* ", "unmatched": "*a "}
+
+
+def timeLine(converter, tokens, repeat=5):
+    """ Return the best time out of several conversions of a line """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        converter.convertText(tokens, True)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main():
+    converter = HTMLConverter([[]], io.StringIO())
+
+    for name, pattern in PATTERNS.items():
+        print(name)
+        perToken = []
+        for count in (1000, 2000, 4000, 8000, 16000, 32000):
+            tokens = tokenizeInline(pattern * count)
+            elapsed = timeLine(converter, tokens)
+            perToken.append(elapsed / len(tokens))
+            print(
+                "  {0:>6} delimiters  {1:8.2f} ms  {2:6.3f} us/token".format(
+                    count, elapsed * 1000, perToken[-1] * 1e6
+                )
+            )
+        # Linear scaling keeps the cost per token flat as the line grows
+        print("  growth of the cost per token: {0:.2f}x".format(perToken[-1] / perToken[0]))
+
+
+if __name__ == "__main__":
+    main()
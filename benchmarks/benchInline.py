@@ -0,0 +1,62 @@
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#     Copyright (C) 2019 Yavor Konstantinov
+#
+""" Compares the throughput of scanInline with the character by character
+    eatCharsMarkup on prose lines and on lines full of markup. Run it from
+    the root of the repository:
+
+        python -m benchmarks.benchInline """
+
+from benchmarks.corpus import markedUpWords, words
+from mdownMarkup import markupCursor, scanInline
+import random
+import time
+
+LINE_COUNT = 2000
+
+
+def timeLines(tokenize, lines, repeat=3):
+    """ Return the best time out of several runs over all the lines """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for line in lines:
+            tokenize(line)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main():
+    rng = random.Random(0)
+    samples = {
+        "prose": [words(rng, 10, 30) for _ in range(LINE_COUNT)],
+        "markup": [markedUpWords(rng, 10, 30) for _ in range(LINE_COUNT)],
+    }
+    for name, lines in samples.items():
+        size = sum(len(line) for line in lines) / (1 << 20)
+        old = timeLines(lambda line: markupCursor(line).eatCharsMarkup(), lines)
+        new = timeLines(scanInline, lines)
+        print(
+            "{0:>8}  eatCharsMarkup {1:7.2f} MB/s  scanInline {2:7.2f} MB/s  {3:5.1f}x".format(
+                name, size / old, size / new, old / new
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
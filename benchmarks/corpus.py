@@ -0,0 +1,141 @@
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#     Copyright (C) 2019 Yavor Konstantinov
+#
+""" Seeded generator of synthetic markdown documents. Documents can be
+    weighted toward any of the constructs recognized by the tokenizer """
+
+import random
+
+WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod "
+    "tempor incididunt ut labore et dolore magna aliqua enim ad minim veniam "
+    "quis nostrud exercitation ullamco laboris nisi aliquip ex ea commodo"
+).split()
+
+# Every construct the generator can emit
+CONSTRUCTS = (
+    "prose",
+    "blank",
+    "atxHeading",
+    "setextHeading",
+    "bullet",
+    "numBullet",
+    "checkItem",
+    "hr",
+    "indented",
+    "inline",
+)
+
+# Relative weight of every construct in a mixed document
+MIXED_WEIGHTS = {
+    "prose": 30,
+    "blank": 15,
+    "atxHeading": 4,
+    "setextHeading": 2,
+    "bullet": 10,
+    "numBullet": 6,
+    "checkItem": 4,
+    "hr": 2,
+    "indented": 6,
+    "inline": 21,
+}
+
+
+def profileWeights(profile):
+    """ Return the construct weights of a profile. "mixed" is a general
+        document, the name of a construct gives a document dominated by it """
+    if profile == "mixed":
+        return dict(MIXED_WEIGHTS)
+    if profile not in CONSTRUCTS:
+        raise ValueError("Unknown corpus profile: {0}".format(profile))
+    weights = dict.fromkeys(CONSTRUCTS, 1)
+    # Blank lines keep rules and underlined headings recognized
+    weights["blank"] = 5
+    weights[profile] = 60
+    return weights
+
+
+def words(rng, low, high):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+def markedUpWords(rng, low, high):
+    """ Words where some are wrapped in the markup handled by eatCharsMarkup """
+    pieces = []
+    for _ in range(rng.randint(low, high)):
+        word = rng.choice(WORDS)
+        markup = rng.randrange(8)
+        if markup == 0:
+            word = "*{0}*".format(word)
+        elif markup == 1:
+            word = "**{0}**".format(word)
+        elif markup == 2:
+            word = "_{0}_".format(word)
+        elif markup == 3:
+            word = "~~{0}~~".format(word)
+        elif markup == 4:
+            word = "`{0}`".format(word)
+        pieces.append(word)
+    return " ".join(pieces)
+
+
+def constructLines(rng, construct):
+    """ Return the lines of a single construct """
+    if construct == "prose":
+        return [words(rng, 5, 20)]
+    elif construct == "blank":
+        return [""]
+    elif construct == "atxHeading":
+        return ["#" * rng.randint(1, 6) + " " + words(rng, 1, 6)]
+    elif construct == "setextHeading":
+        return [words(rng, 1, 6), rng.choice("=-") * rng.randint(3, 20)]
+    elif construct == "bullet":
+        return [rng.choice("-+*") + " " + words(rng, 2, 10)]
+    elif construct == "numBullet":
+        return ["{0}. {1}".format(rng.randint(1, 99), words(rng, 2, 10))]
+    elif construct == "checkItem":
+        return ["- [{0}] {1}".format(rng.choice(" x"), words(rng, 2, 10))]
+    elif construct == "hr":
+        # Rules are only recognized after a blank line
+        return ["", rng.choice("-_*") * rng.randint(3, 10), ""]
+    elif construct == "indented":
+        return [" " * rng.choice((2, 4, 6, 8)) + rng.choice("-*") + " " + words(rng, 2, 8)]
+    elif construct == "inline":
+        return [markedUpWords(rng, 5, 20)]
+    raise ValueError("Unknown construct: {0}".format(construct))
+
+
+def generateCorpus(sizeBytes, profile="mixed", seed=0):
+    """ Generate a markdown document of about sizeBytes characters. The same
+        size, profile and seed always give the same document """
+    rng = random.Random(seed)
+    weights = profileWeights(profile)
+    constructs = list(weights)
+    cumWeights = []
+    total = 0
+    for construct in constructs:
+        total += weights[construct]
+        cumWeights.append(total)
+
+    lines = []
+    size = 0
+    while size < sizeBytes:
+        construct = rng.choices(constructs, cum_weights=cumWeights)[0]
+        for line in constructLines(rng, construct):
+            lines.append(line)
+            size += len(line) + 1
+    lines.append("")
+    return "\n".join(lines)
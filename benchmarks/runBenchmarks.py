@@ -0,0 +1,201 @@
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#     Copyright (C) 2019 Yavor Konstantinov
+#
+""" Times mdTokenizer.tokenize() and HTMLConverter.convertTokens() separately
+    on generated documents of increasing size and reports the results as
+    JSON, so runs of different versions can be compared. Run it from the root
+    of the repository:
+
+        python -m benchmarks.runBenchmarks --sizes 1K 1M --output bench.json """
+
+from benchmarks.corpus import CONSTRUCTS, generateCorpus
+from mdownStructure import mdTokenizer
+from mdownMapped import mdMappedTokenizer
+from mdownVector import mdVectorTokenizer
+from HtmlConverter import HTMLConverter
+import argparse
+import io
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+DEFAULT_SIZES = ["1K", "10K", "100K", "1M", "10M", "100M"]
+# Engines which tokenize the encoded text instead of a str
+BYTE_ENGINES = {"mmap": mdMappedTokenizer, "vector": mdVectorTokenizer}
+SIZE_UNITS = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+
+
+def parseSize(size):
+    """ Convert a size such as 100K or 10M to a number of bytes """
+    unit = size[-1:].upper()
+    if unit in SIZE_UNITS:
+        return int(float(size[:-1]) * SIZE_UNITS[unit])
+    return int(size)
+
+
+def countTokens(document):
+    """ Count the tokens of a document, including the ones inside blocks """
+    count = 0
+    for entry in document:
+        count += len(entry) if isinstance(entry, list) else 1
+    return count
+
+
+def tokenizeText(text, engine):
+    if engine in BYTE_ENGINES:
+        # The byte engines are handed the encoded text, as mapFile would
+        tokenizer = BYTE_ENGINES[engine](text)
+    else:
+        tokenizer = mdTokenizer(io.StringIO(text), engine=engine)
+    tokenizer.tokenize()
+    return tokenizer.returnTokenList()
+
+
+def convertDocument(document):
+    converter = HTMLConverter(document, io.StringIO())
+    converter.convertTokens()
+    return converter
+
+
+def measure(function, *args, repeat=1, memory=True):
+    """ Run function several times and return the result of the last run, the
+        best time and the peak memory allocated by a separate traced run """
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        function(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return (result, best, peak)
+
+
+def stageResult(sizeBytes, tokenCount, seconds, peak):
+    return {
+        "seconds": seconds,
+        "mbPerSec": sizeBytes / (1 << 20) / seconds if seconds else None,
+        "tokensPerSec": tokenCount / seconds if seconds else None,
+        "peakBytes": peak,
+    }
+
+
+def runBenchmarks(sizes, profiles, engine="char", seed=0, repeat=1, memory=True, log=None):
+    """ Benchmark every combination of size and profile and return the
+        results as a dict ready to be dumped as JSON """
+    results = []
+    for profile in profiles:
+        for size in sizes:
+            sizeBytes = parseSize(size)
+            text = generateCorpus(sizeBytes, profile, seed)
+            source = text.encode() if engine in BYTE_ENGINES else text
+
+            document, tokenizeTime, tokenizePeak = measure(
+                tokenizeText, source, engine, repeat=repeat, memory=memory
+            )
+            tokenCount = countTokens(document)
+            converter, convertTime, convertPeak = measure(
+                convertDocument, document, repeat=repeat, memory=memory
+            )
+
+            result = {
+                "profile": profile,
+                "size": size,
+                "bytes": len(text),
+                "lines": text.count("\n"),
+                "tokens": tokenCount,
+                "tokenize": stageResult(len(text), tokenCount, tokenizeTime, tokenizePeak),
+                "convert": stageResult(len(text), tokenCount, convertTime, convertPeak),
+            }
+            results.append(result)
+            if log is not None:
+                print(
+                    "{0:>14} {1:>6}  tokenize {2:8.3f} MB/s  convert {3:8.3f} MB/s".format(
+                        profile,
+                        size,
+                        result["tokenize"]["mbPerSec"],
+                        result["convert"]["mbPerSec"],
+                    ),
+                    file=log,
+                )
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "engine": engine,
+        "seed": seed,
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the tokenizer and the HTML converter on generated markdown"
+    )
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        default=DEFAULT_SIZES,
+        help="Document sizes to benchmark, such as 1K or 10M",
+    )
+    parser.add_argument(
+        "--profiles",
+        nargs="+",
+        default=["mixed"],
+        choices=["mixed"] + list(CONSTRUCTS),
+        help="Constructs the generated documents are weighted toward",
+    )
+    parser.add_argument("--engine", choices=["char", "line"] + sorted(BYTE_ENGINES), default="char")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--repeat", type=int, default=1, help="Runs per stage, the best time is kept"
+    )
+    parser.add_argument(
+        "--no-memory",
+        action="store_true",
+        help="Skip the traced run used to measure peak memory",
+    )
+    parser.add_argument("-o", "--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = runBenchmarks(
+        args.sizes,
+        args.profiles,
+        args.engine,
+        args.seed,
+        args.repeat,
+        not args.no_memory,
+        log=None if args.output is None else sys.stderr,
+    )
+    if args.output is None:
+        print(json.dumps(report, indent=2))
+    else:
+        with open(args.output, "w") as outputFile:
+            json.dump(report, outputFile, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#     Copyright (C) 2019 Yavor Konstantinov
+#
+
+import hashlib
+import os
+import shutil
+import uuid
+
+# Modules whose source decides the HTML produced for a markdown input: the
+# tokenizer engines and the converter along with everything they import
+OUTPUT_MODULES = (
+    "tokenType.py",
+    "mdownTokens.py",
+    "mdownStructure.py",
+    "mdownMapped.py",
+    "mdownVector.py",
+    "mdownTree.py",
+    "mdownMarkup.py",
+    "HtmlConverter.py",
+)
+
+
+def versionStamp():
+    """ Hash of the source of the modules in OUTPUT_MODULES. Any change to
+        the tokenizer or the converter gives a new stamp, which invalidates
+        all the entries made by the previous version """
+    digest = hashlib.sha256()
+    moduleDir = os.path.dirname(os.path.abspath(__file__))
+    for fileName in OUTPUT_MODULES:
+        with open(os.path.join(moduleDir, fileName), "rb") as moduleFile:
+            digest.update(fileName.encode() + b"\0" + moduleFile.read())
+    return digest.hexdigest()
+
+
+class conversionCache:
+    """ Content addressed store of converted HTML files. Entries are keyed by
+        a hash of the markdown input and of the converter version, so an
+        entry never has to be invalidated. Writes go through a temporary file
+        and a rename so several processes can share the same directory """
+
+    def __init__(self, directory, maxBytes=None, hardlink=False):
+        # Directory holding the entries
+        self.directory = directory
+        # Size the cache is trimmed down to by evict(). None for no limit
+        self.maxBytes = maxBytes
+        # Hardlink cached files into place instead of copying them. The
+        # output files then share their storage with the cache entries
+        self.hardlink = hardlink
+        # Hit and miss counts of this process
+        self.hits = 0
+        self.misses = 0
+        self.stamp = versionStamp()
+        os.makedirs(directory, exist_ok=True)
+
+    def keyFor(self, inputBytes, engine="char"):
+        """ Return the cache key for the provided markdown input """
+        digest = hashlib.sha256()
+        digest.update(self.stamp.encode())
+        digest.update(engine.encode() + b"\0")
+        digest.update(inputBytes)
+        return digest.hexdigest()
+
+    def entryPath(self, key):
+        """ Return the path of the entry for a key """
+        return os.path.join(self.directory, key[:2], key[2:] + ".html")
+
+    def placeFile(self, sourcePath, outputPath):
+        """ Put a copy or a hardlink of sourcePath at outputPath. The output
+            is replaced instead of being written over, so the cache entry is
+            never changed through an existing hardlink """
+        outputDir = os.path.dirname(outputPath)
+        if outputDir != "":
+            os.makedirs(outputDir, exist_ok=True)
+        if os.path.lexists(outputPath):
+            os.unlink(outputPath)
+        if self.hardlink:
+            try:
+                os.link(sourcePath, outputPath)
+                return
+            except OSError:
+                # Different file systems or no hardlink support
+                pass
+        shutil.copyfile(sourcePath, outputPath)
+
+    def fetch(self, key, outputPath):
+        """ Put the cached HTML for a key at outputPath. Returns False if
+            there is no entry for the key """
+        entry = self.entryPath(key)
+        try:
+            # Refresh the entry for the LRU eviction
+            os.utime(entry)
+            self.placeFile(entry, outputPath)
+        except FileNotFoundError:
+            # No entry, or it was evicted by another process in the meantime
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def store(self, key, html):
+        """ Atomically add the HTML for a key to the cache and return the path
+            of the entry """
+        entry = self.entryPath(key)
+        entryDir = os.path.dirname(entry)
+        os.makedirs(entryDir, exist_ok=True)
+        # The entry gets the permissions open() gives a regular file, the
+        # umask applies to the mode asked for here
+        while True:
+            tempPath = os.path.join(entryDir, uuid.uuid4().hex + ".tmp")
+            try:
+                fd = os.open(tempPath, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+                break
+            except FileExistsError:
+                continue
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as tempFile:
+                tempFile.write(html)
+            os.replace(tempPath, entry)
+        except BaseException:
+            os.unlink(tempPath)
+            raise
+        return entry
+
+    def evict(self):
+        """ Remove the least recently used entries until the cache is no
+            larger than maxBytes. Returns the number of entries removed """
+        if self.maxBytes is None:
+            return 0
+
+        entries = []
+        totalBytes = 0
+        for dirPath, dirNames, fileNames in os.walk(self.directory):
+            for fileName in fileNames:
+                if not fileName.endswith(".html"):
+                    continue
+                path = os.path.join(dirPath, fileName)
+                try:
+                    info = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((info.st_mtime, info.st_size, path))
+                totalBytes += info.st_size
+
+        removed = 0
+        entries.sort()
+        for mtime, size, path in entries:
+            if totalBytes <= self.maxBytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            totalBytes -= size
+            removed += 1
+        return removed
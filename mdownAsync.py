@@ -0,0 +1,201 @@
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#     Copyright (C) 2019 Yavor Konstantinov
+#
+
+from mdownStructure import mdTokenizer
+from HtmlConverter import HTMLConverter
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import asyncio
+import io
+import threading
+import weakref
+
+# Texts shorter than this many characters are converted right away on the
+# event loop. Converting them takes less time than handing them to a pool
+INLINE_LIMIT = 8 << 10
+
+# Default number of conversions which may be running in a pool at once
+MAX_IN_FLIGHT = 4
+
+
+def renderText(text, engine="line"):
+    """ Convert markdown text to HTML in the calling thread. The line engine
+        gives the same HTML as the char engine, only faster """
+    tokenizer = mdTokenizer(io.StringIO(text), engine=engine)
+    tokenizer.tokenize()
+    return HTMLConverter(tokenizer.returnTokenList()).render()
+
+
+class slotLimiter:
+    """ Counting semaphore for coroutines. Unlike asyncio.Semaphore it does
+        not keep a reference to the event loop it was used in once nothing
+        waits on it, so it can be kept for a loop without keeping the loop
+        alive. Slots are handed out in the order they were asked for """
+
+    def __init__(self, slots):
+        # Number of free slots
+        self.free = slots
+        # Futures of the coroutines waiting for a slot
+        self.waiters = deque()
+
+    async def acquire(self):
+        if self.free > 0 and len(self.waiters) == 0:
+            self.free -= 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            await waiter
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just before the cancellation
+                self.release()
+            else:
+                self.waiters.remove(waiter)
+            raise
+
+    def release(self):
+        """ Give a slot back, or hand it to the first waiting coroutine """
+        while len(self.waiters) != 0:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.free += 1
+
+
+class markdownRenderer:
+    """ Converts markdown to HTML from coroutines without blocking the event
+        loop. Short texts are converted in place while longer ones are sent
+        to an executor, a thread pool of its own unless one is provided. A
+        semaphore bounds the conversions running in the executor, so a flood
+        of large documents queues up instead of taking over every worker.
+        A slot is only given back once its conversion has really finished,
+        even if the caller was cancelled or timed out in the meantime. Worker
+        threads still compete with the loop for the GIL, a process pool
+        passed as executor keeps large conversions off it entirely """
+
+    def __init__(
+        self,
+        executor=None,
+        maxInFlight=MAX_IN_FLIGHT,
+        inlineLimit=INLINE_LIMIT,
+        timeout=None,
+        engine="line",
+    ):
+        # Executor used when none is passed to render()
+        self.executor = executor
+        # Thread pool created when no executor was provided at all
+        self.ownExecutor = None
+        self.maxInFlight = maxInFlight
+        self.inlineLimit = inlineLimit
+        # Default number of seconds a conversion may take, None for no limit
+        self.timeout = timeout
+        self.engine = engine
+        # Bounds the conversions running in the executor
+        self.semaphore = slotLimiter(maxInFlight)
+
+    def getExecutor(self, executor=None):
+        """ Return the executor a conversion is sent to """
+        if executor is not None:
+            return executor
+        if self.executor is not None:
+            return self.executor
+        if self.ownExecutor is None:
+            self.ownExecutor = ThreadPoolExecutor(
+                max_workers=self.maxInFlight, thread_name_prefix="markdownRenderer"
+            )
+        return self.ownExecutor
+
+    async def render(self, text, timeout=None, executor=None):
+        """ Return the HTML for a markdown text. Raises TimeoutError if the
+            conversion, including the wait for a free slot, takes longer than
+            timeout seconds. Cancelling the caller drops the conversion if it
+            has not started yet """
+        if len(text) < self.inlineLimit:
+            return renderText(text, self.engine)
+        if timeout is None:
+            timeout = self.timeout
+        return await asyncio.wait_for(self.offload(text, executor), timeout)
+
+    async def offload(self, text, executor=None):
+        """ Wait for a free slot and run the conversion in the executor """
+        loop = asyncio.get_running_loop()
+        semaphore = self.semaphore
+
+        await semaphore.acquire()
+        try:
+            future = self.getExecutor(executor).submit(renderText, text, self.engine)
+        except BaseException:
+            semaphore.release()
+            raise
+
+        def releaseSlot(done):
+            # Runs in the worker thread, or in the loop if the conversion
+            # was cancelled before it started
+            try:
+                loop.call_soon_threadsafe(semaphore.release)
+            except RuntimeError:
+                # The loop has been closed already
+                pass
+
+        future.add_done_callback(releaseSlot)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+
+    def close(self):
+        """ Shut down the thread pool created by the renderer, if any """
+        if self.ownExecutor is not None:
+            self.ownExecutor.shutdown(wait=False, cancel_futures=True)
+            self.ownExecutor = None
+
+
+# Renderer used by renderMarkdown for every event loop. A renderer only holds
+# its slots, which do not refer back to the loop, so an entry goes away
+# along with its loop
+defaultRenderers = weakref.WeakKeyDictionary()
+
+# Thread pool shared by the renderers of every loop, created on first use
+sharedExecutor = None
+sharedExecutorLock = threading.Lock()
+
+
+def getSharedExecutor():
+    """ Return the thread pool used by renderMarkdown """
+    global sharedExecutor
+    with sharedExecutorLock:
+        if sharedExecutor is None:
+            sharedExecutor = ThreadPoolExecutor(
+                max_workers=MAX_IN_FLIGHT, thread_name_prefix="renderMarkdown"
+            )
+        return sharedExecutor
+
+
+async def renderMarkdown(text, *, executor=None, timeout=None):
+    """ Convert markdown text to HTML from a coroutine using a renderer
+        kept for the running event loop. Conversions of every loop run in
+        the same thread pool. executor, such as a process pool, replaces
+        that thread pool for this call """
+    loop = asyncio.get_running_loop()
+    renderer = defaultRenderers.get(loop)
+    if renderer is None:
+        renderer = markdownRenderer(executor=getSharedExecutor())
+        defaultRenderers[loop] = renderer
+    return await renderer.render(text, timeout=timeout, executor=executor)
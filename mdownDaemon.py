@@ -0,0 +1,209 @@
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#     Copyright (C) 2019 Yavor Konstantinov
+#
+
+from HtmlConverter import HTMLConverter
+from yamd2html import BYTE_ENGINES, convertFile, outputPathFor, tokenizeFile
+from yamdClient import defaultSocketPath, privateSocketDir
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import io
+import json
+import os
+import signal
+import socket
+import socketserver
+import stat
+import threading
+
+
+def renderRequest(request):
+    """ Convert a single request and return the response for the client. A
+        request converts either the file at "input" or the markdown held by
+        "content". The HTML goes to "output", or next to the input file.
+        For content without an output, it is returned in the response """
+    try:
+        engine = request.get("engine", "char")
+        outputPath = request.get("output")
+        if "content" not in request:
+            inputPath = request["input"]
+            if outputPath is None:
+                outputPath = outputPathFor("", inputPath, None)
+            convertFile(inputPath, outputPath, engine)
+            return {"ok": True}
+
+        content = request["content"]
+        if engine in BYTE_ENGINES:
+            tokens = tokenizeFile(content.encode(), engine)
+        else:
+            tokens = tokenizeFile(io.StringIO(content), engine)
+        html = HTMLConverter(tokens).render()
+        if outputPath is None:
+            return {"ok": True, "html": html}
+        outputDir = os.path.dirname(outputPath)
+        if outputDir != "":
+            os.makedirs(outputDir, exist_ok=True)
+        with open(outputPath, "w", encoding="utf-8") as outputFile:
+            outputFile.write(html)
+        return {"ok": True}
+    except Exception as error:
+        return {"ok": False, "error": "{0}: {1}".format(type(error).__name__, error)}
+
+
+class renderHandler(socketserver.StreamRequestHandler):
+    """ Serves the requests of one client connection. Every request is a
+        line of JSON and is answered with a line of JSON """
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+            except ValueError as error:
+                response = {"ok": False, "error": "Bad request: {0}".format(error)}
+            else:
+                request.setdefault("engine", self.server.engine)
+                response = self.server.render(request)
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class renderDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """ Long running server which keeps the tokenizer and the converter
+        loaded. Connections are served by their own threads while the
+        conversions run in a pool of worker processes, which are forked once
+        all the modules have been imported """
+
+    daemon_threads = True
+
+    def __init__(self, socketPath=None, jobCount=None, engine="char"):
+        if socketPath is None:
+            socketPath = defaultSocketPath()
+            if os.path.dirname(socketPath) == privateSocketDir():
+                preparePrivateDir(privateSocketDir())
+        self.socketPath = socketPath
+        # Engine used by the requests which do not name one
+        self.engine = engine
+        removeStaleSocket(self.socketPath)
+        # Only the user running the daemon may connect to it. The socket is
+        # created with that mode rather than changed afterwards, so nobody
+        # can connect in between. No other thread runs yet which could
+        # create files under the changed umask
+        oldUmask = os.umask(0o177)
+        try:
+            socketserver.UnixStreamServer.__init__(self, self.socketPath, renderHandler)
+        finally:
+            os.umask(oldUmask)
+        self.jobCount = jobCount
+        # Guards replacing the pool once one of its workers died
+        self.poolLock = threading.Lock()
+        self.pool = self.createPool()
+
+    def createPool(self):
+        return ProcessPoolExecutor(max_workers=self.jobCount, initializer=resetWorkerSignals)
+
+    def replacePool(self, brokenPool):
+        """ Replace a pool which can no longer be used since one of its
+            workers died, unless another connection already did """
+        with self.poolLock:
+            if self.pool is brokenPool:
+                self.pool = self.createPool()
+        brokenPool.shutdown(wait=False)
+
+    def render(self, request):
+        """ Convert a request in the pool and return the response. When a
+            worker died, as when it was killed or ran out of memory, the pool
+            is replaced and the request tried once more. If that fails too,
+            the response tells the client so """
+        for attempt in range(2):
+            pool = self.pool
+            try:
+                return pool.submit(renderRequest, request).result()
+            except BrokenProcessPool as error:
+                self.replacePool(pool)
+                failure = error
+        return {"ok": False, "error": "Worker pool failed: {0}".format(failure)}
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        self.pool.shutdown()
+        if os.path.exists(self.socketPath):
+            os.unlink(self.socketPath)
+
+
+def resetWorkerSignals():
+    """ Leave stopping to the daemon. Workers die quietly when terminated
+        and ignore the interrupt the daemon receives from the terminal """
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def preparePrivateDir(path):
+    """ Create the directory holding the default socket, readable by its
+        owner only. Raises PermissionError if it already exists but is not
+        such a directory of the current user """
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(path)
+    if (
+        not stat.S_ISDIR(info.st_mode)
+        or info.st_uid != os.getuid()
+        or info.st_mode & 0o077 != 0
+    ):
+        raise PermissionError(
+            "{0} is not a private directory of the current user".format(path)
+        )
+
+
+def removeStaleSocket(socketPath):
+    """ Remove the socket left behind by a daemon which is no longer running.
+        Raises OSError if a daemon is still listening on it, and
+        PermissionError if the path is anything but a socket of the current
+        user """
+    try:
+        info = os.lstat(socketPath)
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(info.st_mode) or info.st_uid != os.getuid():
+        raise PermissionError(
+            "{0} is not a socket owned by the current user".format(socketPath)
+        )
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socketPath)
+    except ConnectionRefusedError:
+        os.unlink(socketPath)
+        return
+    finally:
+        probe.close()
+    raise OSError("A daemon is already listening on {0}".format(socketPath))
+
+
+def serve(socketPath=None, jobCount=None, engine="char"):
+    """ Run the render daemon until it is interrupted or terminated """
+
+    def terminate(signalNumber, frame):
+        raise KeyboardInterrupt
+
+    server = renderDaemon(socketPath, jobCount, engine)
+    signal.signal(signal.SIGTERM, terminate)
+    print("Listening on {0}".format(server.socketPath), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,146 @@
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#     Copyright (C) 2019 Yavor Konstantinov
+#
+
+from tokenType import tokType
+from mdownStructure import mdTokenizer
+import io
+
+# Types of the entries which hold a heading
+headingTypes = frozenset((tokType.MHEADING, tokType.UHEADING))
+
+
+def paragraphLines(block):
+    """ Return the lines of the first paragraph of a block and whether a blank
+        line after them ends it """
+    lines = []
+    for token in block:
+        if token["type"] == tokType.PLAIN:
+            lines.append(token["content"])
+        elif token["type"] == tokType.BLANK and len(lines) != 0:
+            return (lines, True)
+    return (lines, False)
+
+
+class mdDocument:
+    """ Token document which is only tokenized as far as it is read. Entries
+        are pulled from the iterTokens generator of a streaming tokenizer the
+        first time they are indexed or iterated over and are kept, so reading
+        them again costs nothing. The source can be a string, a file handle
+        or any tokenizer providing iterTokens, such as mdMappedTokenizer.
+        len() and negative indexes tokenize the whole document """
+
+    def __init__(self, source, engine="line", compact=False):
+        if isinstance(source, str):
+            source = io.StringIO(source)
+        if not hasattr(source, "iterTokens"):
+            source = mdTokenizer(source, streaming=True, engine=engine, compact=compact)
+        # Tokenizer the entries come from, whose block still being filled is
+        # looked at by firstParagraph
+        self.tokenizer = source
+        # Entries which have been tokenized so far
+        self.entries = []
+        # Generator handing out the rest of the entries, and None after every
+        # line. None once exhausted
+        self.pending = source.iterTokens(everyLine=True)
+
+    def advance(self):
+        """ Tokenize one more line of the document, keeping the entries it
+            finished. Returns False once the document has ended """
+        if self.pending is None:
+            return False
+        for entry in self.pending:
+            if entry is None:
+                return True
+            self.entries.append(entry)
+        self.pending = None
+        return False
+
+    def fillTo(self, index):
+        """ Tokenize until the entry at index is known or the document ends.
+            Returns False if the document has no such entry """
+        while len(self.entries) <= index:
+            if not self.advance():
+                return len(self.entries) > index
+        return True
+
+    def fillAll(self):
+        """ Tokenize the rest of the document """
+        if self.pending is not None:
+            self.entries.extend(entry for entry in self.pending if entry is not None)
+            self.pending = None
+
+    def isComplete(self):
+        """ Tell if the whole document has been tokenized """
+        return self.pending is None
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if (index.start or 0) < 0 or index.stop is None or index.stop < 0:
+                self.fillAll()
+            else:
+                self.fillTo(index.stop - 1)
+            return self.entries[index]
+        if index < 0:
+            self.fillAll()
+        elif not self.fillTo(index):
+            raise IndexError("document index out of range")
+        return self.entries[index]
+
+    def __len__(self):
+        self.fillAll()
+        return len(self.entries)
+
+    def __iter__(self):
+        index = 0
+        while self.fillTo(index):
+            yield self.entries[index]
+            index += 1
+
+    def firstHeading(self):
+        """ Return the first heading token of the document, or None. Stops
+            tokenizing as soon as it is found """
+        for entry in self:
+            if not isinstance(entry, list) and entry["type"] in headingTypes:
+                return entry
+        return None
+
+    def firstParagraph(self):
+        """ Return the text of the first paragraph, its lines joined by
+            newlines as they are in the HTML output, or None. Stops
+            tokenizing at the first blank line after it, looking at the block
+            the tokenizer is still filling since a block of plain text only
+            ends at the next entry which is not plain text """
+        index = 0
+        while True:
+            # Blocks which are finished hold the paragraph up to their end
+            while index < len(self.entries):
+                entry = self.entries[index]
+                index += 1
+                if isinstance(entry, list):
+                    lines, ended = paragraphLines(entry)
+                    if len(lines) != 0:
+                        return "\n".join(lines)
+            lines, ended = paragraphLines(self.tokenizer.currBlock)
+            if ended:
+                return "\n".join(lines)
+            if not self.advance() and index == len(self.entries):
+                return None
+
+    def returnTokenList(self):
+        """ Return the list of tokens which outlines the entire structure of the document"""
+        self.fillAll()
+        return self.entries
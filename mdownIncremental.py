@@ -0,0 +1,328 @@
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#     Copyright (C) 2019 Yavor Konstantinov
+#
+
+from mdownStructure import mdTokenizer
+
+# Placeholder put in front of the current block when tokenizing restarts in
+# the middle of a block. Stands for the tokens of the block which come before
+# the restart point and are left untouched
+BLOCK_PREFIX = object()
+
+
+def splitLines(text):
+    """ Split text into its lines, each keeping its newline. The last line is
+        the text after the last newline, which may be empty """
+    parts = text.split("\n")
+    lines = [part + "\n" for part in parts[:-1]]
+    lines.append(parts[-1])
+    return lines
+
+
+class lineListReader:
+    """ Minimal file-like object handing out the lines of a list of lines,
+        starting at a given column of a given line. Lets mdTokenizer stream
+        over part of the buffer without joining it up """
+
+    def __init__(self, lines, index=0, column=0):
+        self.lines = lines
+        self.index = index
+        self.column = column
+
+    def readline(self):
+        if self.index >= len(self.lines):
+            return ""
+        line = self.lines[self.index][self.column :]
+        self.index += 1
+        self.column = 0
+        return line
+
+
+class shiftedOffsets:
+    """ Sorted list of offsets into the buffer, or of indexes into the
+        document, which an edit shifts by the same amount from some point on.
+        Rather than being added to every value after the edit, the shift is
+        kept pending from that point on and only moved along to the next
+        edit. An edit then costs the number of values it replaces plus the
+        number of values between it and the edit before it """
+
+    def __init__(self, values):
+        self.values = values
+        # The values from this index on are shiftBy too small
+        self.shiftFrom = len(values)
+        self.shiftBy = 0
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        if index >= self.shiftFrom:
+            return self.values[index] + self.shiftBy
+        return self.values[index]
+
+    def bisectLeft(self, value):
+        """ Return the index of the first value which is not below value """
+        low, high = 0, len(self.values)
+        while low < high:
+            middle = (low + high) // 2
+            if self[middle] < value:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def bisectRight(self, value):
+        """ Return the index of the first value which is above value """
+        low, high = 0, len(self.values)
+        while low < high:
+            middle = (low + high) // 2
+            if self[middle] <= value:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def moveShift(self, index):
+        """ Make the pending shift start at index """
+        values = self.values
+        if self.shiftBy != 0:
+            for position in range(self.shiftFrom, index):
+                values[position] += self.shiftBy
+            for position in range(index, self.shiftFrom):
+                values[position] -= self.shiftBy
+        self.shiftFrom = index
+
+    def replace(self, start, end, newValues, shift):
+        """ Replace the values from start to end by newValues and shift the
+            values after them """
+        self.moveShift(end)
+        self.values[start:end] = newValues
+        self.shiftFrom = start + len(newValues)
+        self.shiftBy += shift
+        if self.shiftFrom == len(self.values):
+            self.shiftBy = 0
+
+
+class mdIncrementalTokenizer:
+    """ Keeps the token document of an in-memory buffer up to date while it
+        is being edited. The state of the tokenizer is recorded at the start
+        of every line so that an edit only re-tokenizes from the line before
+        it until the tokenizer is back in a state it was in before the edit.
+        The buffer is held as a list of lines and the offsets after an edit
+        are shifted lazily, so the work done for an edit depends on the size
+        of the edit and of the region re-tokenized, not on the whole buffer """
+
+    def __init__(self, text, engine="line"):
+        # The current contents of the buffer, line by line
+        self.lines = splitLines(text)
+        # Offset in the buffer of the start of every line
+        starts = []
+        offset = 0
+        for line in self.lines:
+            starts.append(offset)
+            offset += len(line)
+        self.lineStarts = shiftedOffsets(starts)
+        # The tokenizer engine used, see mdTokenizer
+        self.engine = engine
+
+        # Tokenizer state at the start of every line: position in the text,
+        # blankFlag, index of the document entry being built and the number
+        # of tokens already in the current block
+        self.checkPos = shiftedOffsets([])
+        self.checkFlag = []
+        self.checkEntry = shiftedOffsets([])
+        self.checkLen = []
+
+        closed, tail, checks, resync = self.tokenizeFrom(0, False, 0, 0)
+        # A list holding the structure of the document
+        self.document = closed
+        checkPos, self.checkFlag, checkEntry, self.checkLen = checks
+        self.checkPos = shiftedOffsets(checkPos)
+        self.checkEntry = shiftedOffsets(checkEntry)
+
+    @property
+    def text(self):
+        """ The current contents of the buffer. Joined up on every read """
+        return "".join(self.lines)
+
+    def lineOf(self, pos):
+        """ Return the index of the line holding the given offset """
+        return max(self.lineStarts.bisectRight(pos) - 1, 0)
+
+    def tokenizeFrom(self, start, blankFlag, entryIndex, blockLen, stopAt=None, delta=0):
+        """ Tokenize the text from the given position with the given tokenizer
+            state. Once past stopAt, tokenizing stops as soon as the state
+            matches the one recorded at the same spot before the edit, which
+            shifted everything after it by delta. Returns the finished
+            entries, the unfinished block, the new checkpoints and the index
+            of the old checkpoint which was reached(None at the end of text) """
+        line = self.lineOf(start)
+        reader = lineListReader(self.lines, line, start - self.lineStarts[line])
+        tokenizer = mdTokenizer(reader, streaming=True, engine=self.engine)
+        tokenizer.blankFlag = blankFlag
+        if blockLen != 0:
+            tokenizer.currBlock.append(BLOCK_PREFIX)
+
+        checkPos = []
+        checkFlag = []
+        checkEntry = []
+        checkLen = []
+        while True:
+            tokenizer.slideWindow()
+            if tokenizer.currIndex + 1 >= tokenizer.EOF:
+                break
+
+            pos = start + tokenizer.windowStart + tokenizer.currIndex
+            currLen = len(tokenizer.currBlock)
+            if len(tokenizer.document) == 0 and blockLen != 0:
+                currLen += blockLen - 1
+
+            # Check if the state matches the one from before the edit
+            if stopAt is not None and pos >= stopAt:
+                oldIndex = self.checkPos.bisectLeft(pos - delta)
+                if (
+                    oldIndex < len(self.checkPos)
+                    and self.checkPos[oldIndex] == pos - delta
+                    and self.checkFlag[oldIndex] == tokenizer.blankFlag
+                    and (self.checkLen[oldIndex] == 0) == (currLen == 0)
+                ):
+                    checks = (checkPos, checkFlag, checkEntry, checkLen)
+                    return (tokenizer.document, tokenizer.currBlock, checks, oldIndex)
+
+            checkPos.append(pos)
+            checkFlag.append(tokenizer.blankFlag)
+            checkEntry.append(entryIndex + len(tokenizer.document))
+            checkLen.append(currLen)
+
+            if tokenizer.currChar == "\n":
+                tokenizer.getNext()
+            tokenizer.tokenizeLine()
+
+        tokenizer.closeBlock()
+        # Add an EOF token to signify end of file
+        tokenizer.document.append(tokenizer.tokenFactory.eof())
+        checks = (checkPos, checkFlag, checkEntry, checkLen)
+        return (tokenizer.document, [], checks, None)
+
+    def applyEdit(self, start, removedLength, insertedText):
+        """ Replace removedLength characters at start with insertedText and
+            update the document. Only the blocks touched by the edit are
+            re-tokenized. Returns a tuple (index, removed, inserted): the
+            entries document[index:index + removed] from before the edit were
+            replaced by the entries document[index:index + inserted] """
+        delta = len(insertedText) - removedLength
+        # Start from the line before the edited one since the edit may turn
+        # the edited line into, or out of, a heading underline
+        first = self.lineOf(start)
+        prevStart = self.lineStarts[first - 1] if first > 0 else 0
+        self.replaceText(first, start, removedLength, insertedText)
+
+        restart = self.checkPos.bisectRight(prevStart) - 1
+        if restart < 0:
+            restart = 0
+            state = (0, False, 0, 0)
+        else:
+            state = (
+                self.checkPos[restart],
+                self.checkFlag[restart],
+                self.checkEntry[restart],
+                self.checkLen[restart],
+            )
+        entryIndex, blockLen = state[2], state[3]
+
+        closed, tail, checks, resync = self.tokenizeFrom(
+            *state, stopAt=start + len(insertedText), delta=delta
+        )
+
+        # Range of the old document which has been re-tokenized
+        if resync is None:
+            resync = len(self.checkPos)
+            endEntry, endLen = len(self.document), 0
+        else:
+            endEntry, endLen = self.checkEntry[resync], self.checkLen[resync]
+
+        if len(closed) == 0 and blockLen != 0 and endLen != 0 and entryIndex == endEntry:
+            # The edit stayed inside a single block which is patched in place
+            self.document[entryIndex][blockLen:endLen] = tail[1:]
+            lastLen = blockLen + len(tail) - 1
+            removed = inserted = 1
+        else:
+            newEntries = closed + ([tail] if len(tail) != 0 else [])
+            suffix = self.document[endEntry][endLen:] if endLen != 0 else None
+
+            # Put back the tokens in front of the restart point
+            if blockLen != 0:
+                head = self.document[entryIndex]
+                del head[blockLen:]
+                head.extend(newEntries[0][1:])
+                newEntries[0] = head
+
+            # Put back the tokens after the point where tokenizing stopped
+            lastLen = 0
+            if endLen != 0:
+                lastLen = len(newEntries[-1])
+                newEntries[-1].extend(suffix)
+
+            removed = endEntry - entryIndex + (1 if endLen != 0 else 0)
+            inserted = len(newEntries)
+            self.document[entryIndex : entryIndex + removed] = newEntries
+
+        # The checkpoints still in the block where tokenizing stopped have a
+        # different number of tokens in front of them
+        if endLen != 0:
+            index = resync
+            while index < len(self.checkLen) and self.checkEntry[index] == endEntry:
+                self.checkLen[index] += lastLen - endLen
+                index += 1
+
+        # Swap in the new checkpoints and shift the ones after them
+        newPos, newFlag, newEntry, newLen = checks
+        self.checkPos.replace(restart, resync, newPos, delta)
+        self.checkFlag[restart:resync] = newFlag
+        self.checkEntry.replace(restart, resync, newEntry, inserted - removed)
+        self.checkLen[restart:resync] = newLen
+
+        return (entryIndex, removed, inserted)
+
+    def replaceText(self, first, start, removedLength, insertedText):
+        """ Replace removedLength characters at start, which is on line first,
+            with insertedText. Only the lines touched by the edit are joined
+            up and split again """
+        end = start + removedLength
+        last = self.lineOf(end)
+        lineStart = self.lineStarts[first]
+        segment = "".join(self.lines[first : last + 1])
+        newLines = splitLines(
+            segment[: start - lineStart] + insertedText + segment[end - lineStart :]
+        )
+        # Unless it is the last line of the buffer, the edited segment still
+        # ends with a newline which leaves an empty piece behind
+        if last != len(self.lines) - 1:
+            newLines.pop()
+        self.lines[first : last + 1] = newLines
+
+        starts = []
+        offset = lineStart
+        for line in newLines:
+            starts.append(offset)
+            offset += len(line)
+        self.lineStarts.replace(
+            first, last + 1, starts, len(insertedText) - removedLength
+        )
+
+    def returnTokenList(self):
+        """ Return the list of tokens which outlines the entire structure of the document"""
+        return self.document
@@ -0,0 +1,417 @@
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#     Copyright (C) 2019 Yavor Konstantinov
+#
+
+from mdownStructure import mdTokenizer, findFenceClose, dedentExp
+from mdownTokens import dictTokens, compactTokens, spanTokens
+import codecs
+import mmap
+import os
+import re
+
+# Byte counterparts of the line expressions used by mdTokenizer. They are
+# matched against a single line, without its line ending
+indentBytesExp = re.compile(b" *")
+hashRunExp = re.compile(b"#*")
+underlineBytesExp = re.compile(b"-{3,}|={3,}")
+hrLineBytesExp = re.compile(b" *(?:-{3,}|_{3,}|\\*{3,})")
+numBulletBytesExp = re.compile(b"[0-9]+\\. ")
+digitRunExp = re.compile(b"[0-9]*")
+fenceOpenBytesExp = re.compile(b"(`{3,}|~{3,})([^\n]*)")
+codeEndBytesExp = re.compile(b"\n(?: *\r?\n)*(?: *\r?\\Z|(?! {4}| *\r?\n))")
+
+# Amount of consumed input after which the pages holding it are handed back
+# to the operating system
+RELEASE_BYTES = 1 << 26
+
+
+def mapFile(fileHandle):
+    """ Map a file opened in binary mode into memory, read only. The mapping
+        stays valid after the file is closed. An empty file can not be
+        mapped and gives an empty bytes object instead """
+    fileNo = fileHandle.fileno()
+    if os.fstat(fileNo).st_size == 0:
+        return b""
+    return mmap.mmap(fileNo, 0, access=mmap.ACCESS_READ)
+
+
+class mdMappedTokenizer(mdTokenizer):
+    """ Line engine tokenizer working on the raw bytes of a memory mapped
+        file(or any other bytes-like buffer). Lines are found with find(b"\\n")
+        and only the slices which end up as token content are decoded, so
+        the file is never decoded or copied as a whole. Lines may end in
+        "\\n" or "\\r\\n". With spans=True tokens keep their content as offsets
+        into the buffer and decode it when it is read """
+
+    def __init__(self, buffer, encoding="utf-8", compact=False, spans=False):
+
+        # Handle to the source buffer
+        self.src = buffer
+        self.text = buffer
+        self.encoding = encoding
+        self.utf8 = codecs.lookup(encoding).name == "utf-8"
+
+        # Builds the tokens. Span tokens hold (start, end) offsets into the
+        # buffer in place of their content
+        if spans:
+            self.tokenFactory = spanTokens(self)
+            self.content = self.spanOf
+            self.codeContent = self.codeSpanOf
+        else:
+            self.tokenFactory = compactTokens if compact else dictTokens
+            self.content = self.decodeSpan
+            self.codeContent = self.decodeCode
+
+        # Name of the engine, as passed to mdTokenizer
+        self.engine = "mmap"
+
+        # The whole buffer is available, nothing is ever streamed in
+        self.streaming = False
+        self.exhausted = True
+        self.windowStart = 0
+
+        # Index of the last byte in the buffer
+        self.EOF = len(buffer)
+
+        # Start, end and end without "\r" of the line being tokenized
+        self.currBounds = (0, 0, 0)
+
+        # Index of the line holding the current position. Lines are found as
+        # they are reached, there is no line table to index
+        self.currLine = 0
+
+        # Start of the input which has not been handed back with madvise
+        self.released = 0
+
+        # A list holding the structure of the document
+        self.document = []
+
+        # Nested container tree of the document, see tokenizeTree
+        self.tree = None
+
+        # The current block. Used for plaintext while headers and all others
+        # reside in their own block
+        self.currBlock = []
+
+        # Current index along the buffer. getNext moves it onto the newline
+        # of a leading "\r\n" the same way it does for every other line
+        self.currIndex = -1
+        self.getNext()
+
+        # Indicates if the previous line was a blank.
+        # used to recognize horizontal ruling vs plain - or =
+        self.blankFlag = False
+
+    def decodeSpan(self, start, end):
+        """ Decode the bytes between start and end """
+        return self.text[start:end].decode(self.encoding)
+
+    def spanOf(self, start, end):
+        """ Content passed to span tokens in place of the decoded text """
+        return (start, end)
+
+    def decodeCode(self, start, end, indented=False):
+        """ Decode the lines of a code block between start and end, with "\n"
+            line endings. The lines of an indented block are dedented """
+        if end > start and self.text[end - 1] == 13:
+            end -= 1
+        code = self.text[start:end].decode(self.encoding).replace("\r\n", "\n")
+        if indented:
+            return dedentExp.sub("", code)
+        return code
+
+    def codeSpanOf(self, start, end, indented=False):
+        """ Content passed to span tokens for a code block """
+        return (start, end, indented)
+
+    def close(self):
+        """ Close the mapping. Span tokens can no longer be read afterwards """
+        if isinstance(self.text, mmap.mmap):
+            self.text.close()
+
+    def getNext(self):
+        """ Move to the next byte. Only newlines and ASCII characters are ever
+            compared against, so currChar is just the byte as a character. The
+            "\\r" of a "\\r\\n" is stepped over so it reads as a single newline """
+        text = self.text
+        index = self.currIndex + 1
+        if index + 1 < self.EOF and text[index] == 13 and text[index + 1] == 10:
+            index += 1
+        self.currIndex = index
+        if index >= self.EOF or text[index] == 10:
+            self.currChar = "\n"
+        else:
+            self.currChar = chr(text[index])
+        return self.currChar
+
+    def skipChars(self, index, count):
+        """ Return the position count characters after index. Used where the
+            rules skip a fixed number of characters, which may run past the
+            end of a short line. "\r\n" and UTF-8 sequences count as one """
+        text = self.text
+        EOF = self.EOF
+        for step in range(count):
+            if index >= EOF:
+                return index + count - step
+            if text[index] == 13 and index + 1 < EOF and text[index + 1] == 10:
+                index += 1
+            index += 1
+            if self.utf8:
+                while index < EOF and 0x80 <= text[index] < 0xC0:
+                    index += 1
+        return index
+
+    def lineEnd(self, index):
+        """ Return the position of the newline ending the line holding index,
+            or EOF, along with the end of the line without its "\\r" """
+        end = self.text.find(b"\n", index)
+        if end == -1:
+            end = self.EOF
+        contentEnd = end
+        if end > 0 and self.text[end - 1] == 13:
+            contentEnd -= 1
+        return (end, contentEnd)
+
+    def eatLineFrom(self, index):
+        """ Consume the line from index up to its end, skipping any whitespace
+            in front of it. Returns the content of what was consumed """
+        self.currChar = "\n"
+        if index >= self.EOF:
+            self.currIndex = index
+            return self.content(index, index)
+
+        end, contentEnd = self.lineEnd(index)
+        self.currIndex = end
+        start = min(indentBytesExp.match(self.text, index).end(), contentEnd)
+        return self.content(start, max(start, contentEnd))
+
+    def isHR(self, char):
+        """ Check if the current line is a horizontal rule made of the
+            provided character """
+        if self.blankFlag != True or self.currChar != char:
+            return False
+        start, end, contentEnd = self.currBounds
+        return hrLineBytesExp.fullmatch(self.text, start, contentEnd) is not None
+
+    def numBulletDigits(self, pos, contentEnd):
+        """ Return the end of the digits of a numbered bullet starting at pos,
+            or None if the line is not a numbered bullet """
+        text = self.text
+        match = numBulletBytesExp.match(text, pos, contentEnd)
+        if match is not None:
+            return match.end() - 2
+        digitEnd = digitRunExp.match(text, pos, contentEnd).end()
+        if digitEnd == contentEnd or text[digitEnd] < 128:
+            return None
+
+        # Digits outside of ASCII, which str.isdigit accepts as well
+        line = self.decodeSpan(pos, contentEnd)
+        count = 0
+        while count < len(line) and line[count].isdigit():
+            count += 1
+        if count == 0 or line[count : count + 2] != ". ":
+            return None
+        return pos + len(line[:count].encode(self.encoding))
+
+    def isNumBullet(self):
+        """ Check if the current line is a numbered bullet """
+        contentEnd = self.currBounds[2]
+        return self.numBulletDigits(self.currIndex, contentEnd) is not None
+
+    def isUnderlinedHeading(self):
+        """ Check if the next line is an underlined heading """
+        text = self.text
+        start, end, contentEnd = self.currBounds
+        # A blank line can not be turned into a heading
+        if indentBytesExp.match(text, start, contentEnd).end() == contentEnd:
+            return False
+        # Cheap check of the first character of the next line, an underline
+        # is made of - or =
+        if end + 1 >= self.EOF or text[end + 1] not in (45, 61):
+            return False
+        nextEnd, nextContentEnd = self.lineEnd(end + 1)
+        # The underline has to be followed by a newline
+        return (
+            nextEnd < self.EOF
+            and underlineBytesExp.fullmatch(self.text, end + 1, nextContentEnd) is not None
+        )
+
+    def tokenizeWholeLine(self):
+        """ Byte counterpart of mdTokenizer.tokenizeWholeLine. Uses the same
+            table of rules, which call the byte versions of the methods below """
+        text = self.text
+        start = self.currIndex
+        end, contentEnd = self.lineEnd(start)
+        # Starting on the "\n" of a "\r\n" leaves nothing of the line
+        contentEnd = max(start, contentEnd)
+        # Bounds of the line used by the rule checks
+        self.currBounds = (start, end, contentEnd)
+
+        # Indentation in front of the line
+        pos = indentBytesExp.match(text, start, contentEnd).end()
+        indent = pos - start
+        # Indented code block, see mdTokenizer.tokenizeLine
+        if indent >= 4 and pos < contentEnd and self.blankFlag and len(self.currBlock) != 0:
+            self.tokenizeIndentedCode(start)
+            return
+        if indent != 0:
+            self.currBlock.append(self.tokenFactory.indent(indent))
+        self.currIndex = pos
+        self.currChar = chr(text[pos]) if pos < contentEnd else "\n"
+        firstChar = self.currChar
+
+        rule = self.wholeLineRules.leading.get(firstChar)
+        if rule is not None and rule(self) is not False:
+            return
+        # Underlined heading
+        if self.isUnderlinedHeading():
+            # The underline itself is skipped
+            self.currIndex = self.lineEnd(end + 1)[0]
+            self.currChar = "\n"
+            self.closeBlock()
+            self.document.append(
+                self.tokenFactory.underlinedHeading(self.content(pos, contentEnd))
+            )
+            return
+        rule = self.wholeLineRules.rules.get(firstChar)
+        if rule is None and firstChar >= "\x80":
+            # The first byte of a character which may be a digit
+            rule = self.wholeLineRules.rules.get("0")
+        # Case of plain text
+        if rule is None or rule(self) is False:
+            self.blankFlag = False
+            self.currIndex = end
+            self.currChar = "\n"
+            self.currBlock.append(self.tokenFactory.plain(self.content(pos, contentEnd)))
+
+    def tokenizeFencedCode(self):
+        """ Byte version of the rule for a line opening a fenced code block """
+        text = self.text
+        start, end, contentEnd = self.currBounds
+        opener = fenceOpenBytesExp.match(text, self.currIndex, contentEnd)
+        if opener is None:
+            return False
+        fence, info = opener.groups()
+        # Backticks followed by more of them on the line are inline code
+        if fence[0] == 96 and b"`" in info:
+            return False
+
+        bodyStart = end + 1
+        closer = findFenceClose(text, fence, bodyStart)
+        if closer is None:
+            end = bodyEnd = self.EOF
+            if bodyEnd > bodyStart and text[bodyEnd - 1] == 10:
+                bodyEnd -= 1
+        else:
+            closeStart, end = closer
+            bodyEnd = max(bodyStart, closeStart - 1)
+        self.currIndex = end
+        self.currChar = "\n"
+        info = info.split()
+        self.closeBlock()
+        self.document.append(
+            self.tokenFactory.codeBlock(
+                info[0].decode(self.encoding) if info else None,
+                self.codeContent(bodyStart, bodyEnd),
+            )
+        )
+        self.blankFlag = True
+
+    def tokenizeIndentedCode(self, start):
+        """ Byte version of the rule for an indented code block """
+        match = codeEndBytesExp.search(self.text, start)
+        end = self.EOF if match is None else match.start()
+        self.currIndex = end
+        self.currChar = "\n"
+        self.closeBlock()
+        self.document.append(self.tokenFactory.codeBlock(None, self.codeContent(start, end, True)))
+        self.blankFlag = True
+
+    def wholeMarkedHeading(self):
+        """ Byte version of the rule for a heading starting with # """
+        pos = self.currIndex
+        hashCount = hashRunExp.match(self.text, pos, self.currBounds[2]).end() - pos
+        headingText = self.eatLineFrom(pos + hashCount)
+        self.closeBlock()
+        self.document.append(self.tokenFactory.markedHeading(min(hashCount, 6), headingText))
+
+    def wholeRuleOrBullet(self):
+        """ Byte version of the rule for a horizontal rule, a bullet or a
+            checklist item """
+        firstChar = self.currChar
+        if self.isHR(firstChar) == True:
+            self.currIndex = self.currBounds[1]
+            self.currChar = "\n"
+            self.insertHR()
+            if firstChar == "-":
+                self.blankFlag = False
+            return
+        text = self.text
+        pos = self.currIndex
+        contentEnd = self.currBounds[2]
+        if firstChar == "_" or pos + 1 >= contentEnd or text[pos + 1] != 32:
+            return False
+
+        if firstChar == "-" and pos + 2 < contentEnd and text[pos + 2] == 91:
+            status = True if text[pos + 3 : pos + 4] == b"x" else None
+            # Skip over "- [", the status and the closing ]
+            checkItemContent = self.eatLineFrom(self.skipChars(pos, 5))
+            self.closeBlock()
+            self.document.append(self.tokenFactory.checkItem(status, checkItemContent))
+        else:
+            bulletText = self.eatLineFrom(pos + 1)
+            self.closeBlock()
+            self.document.append(self.tokenFactory.bullet(bulletText))
+
+    def wholeNumBullet(self):
+        """ Byte version of the rule for the lines starting with a digit """
+        if self.isNumBullet() != True:
+            return False
+        bulletText = self.eatLineFrom(self.numBulletDigits(self.currIndex, self.currBounds[2]) + 1)
+        self.closeBlock()
+        self.document.append(self.tokenFactory.numBullet(bulletText))
+
+    def wholeBlankLine(self):
+        """ Byte version of the rule for an empty line """
+        self.blankFlag = True
+        self.currIndex = self.currBounds[1]
+        self.currBlock.append(self.tokenFactory.blank())
+
+    # Every line goes through the byte engine
+    tokenizeLine = tokenizeWholeLine
+
+    def releaseConsumed(self):
+        """ Hand the pages holding input which has already been tokenized back
+            to the operating system, keeping the resident size of a mapping
+            bounded while iterating. Pages are mapped back in if read again """
+        if not isinstance(self.text, mmap.mmap) or not hasattr(self.text, "madvise"):
+            return
+        cut = self.currIndex - self.currIndex % mmap.PAGESIZE
+        if cut - self.released >= RELEASE_BYTES:
+            self.text.madvise(mmap.MADV_DONTNEED, self.released, cut - self.released)
+            self.released = cut
+
+    def tokenize(self):
+        """ Tokenize the whole buffer. Goes through iterTokens so that the
+            pages already tokenized are released on this path too """
+        self.document = list(self.iterTokens())
+
+    def iterTokens(self, everyLine=False):
+        """ Generator version of tokenize which also releases the consumed
+            part of the mapping as it goes """
+        for entry in mdTokenizer.iterTokens(self, everyLine):
+            self.releaseConsumed()
+            yield entry
@@ -15,68 +15,159 @@
 #     Copyright (C) 2019 Yavor Konstantinov
 #
 
-def tokenizeImage(self):
-    """ Tokenizes an image link """
-    imgDesc = ""
-    imgURL = ""
-    imgTitle = ""
+from tokenType import tokType
+from mdownStructure import mdTokenizer
+from mdownTree import containerNode
+import re
 
-    if self.currChar == "!":
-        self.getNext()
+# Characters which end a run of plain text, along with the backslash which
+# may escape one of them
+plainStopExp = re.compile(r"[*_\[`(~\\]")
 
-    # Skip over the opening [ bracket
-    self.getNext()
+# Characters which can be escaped with a backslash
+ESCAPABLE = frozenset("()[]\\_*.!-`")
 
-    # retrieve the description
-    while self.currChar != "]":
-        imgDesc += self.currChar
-        self.getNext()
+# Definition of a reference link such as [label]: url "title". The title
+# may also be in single quotes or in parentheses
+referenceDefExp = re.compile(
+    r" *\[([^\[\]\n]+)\]:[ \t]*<?([^\s<>]+)>?"
+    r"(?:[ \t]+(?:\"([^\"\n]*)\"|'([^'\n]*)'|\(([^()\n]*)\)))?[ \t\r]*$"
+)
 
-    # Skip over the closing ] bracket
-    self.getNext()
-    # Skip over the (
-    self.getNext()
 
-    # Retrieve the url
-    while self.currChar not in ['"', ")"]:
-        imgURL += self.currChar
-        self.getNext()
+def normalizeLabel(label):
+    """ Return the key a link label is looked up by. Labels match without
+        regard to case, with any run of white space taken as one space """
+    return " ".join(label.split()).casefold()
+
+
+def matchDefinition(content):
+    """ Return the match of referenceDefExp if a line of plain text defines a
+        reference link, None otherwise """
+    if content.lstrip(" ")[:1] != "[":
+        return None
+    return referenceDefExp.match(content)
+
+
+def collectReferences(document):
+    """ Collect the reference link definitions of a document structure, or
+        of a container tree, in a single pass over it. Returns a dict from
+        the normalized label to the (url, title) pair of the first definition
+        of that label, against which links are resolved in constant time """
+    references = {}
+    pending = [iter(document)]
+    while len(pending) != 0:
+        entry = next(pending[-1], None)
+        if entry is None:
+            pending.pop()
+        elif isinstance(entry, containerNode):
+            pending.append(iter(entry.children))
+        elif isinstance(entry, list):
+            for token in entry:
+                if token["type"] != tokType.PLAIN:
+                    continue
+                match = matchDefinition(token["content"])
+                if match is None:
+                    continue
+                label, url, *titles = match.groups()
+                title = next((title for title in titles if title is not None), "")
+                references.setdefault(normalizeLabel(label), (url, title))
+    references.pop("", None)
+    return references
+
 
-    # Retrieve the link title
-    if self.currChar == '"':
+def findFrom(text, char, start, found):
+    """ Return the index of the first char in text at or after start, or -1.
+        The last search made for every character is kept in found and reused
+        while start stays within what it covered, so the searches made for
+        all the brackets of a line add up to a single scan of it """
+    searchedFrom, pos = found.get(char, (None, None))
+    if searchedFrom is None or start < searchedFrom or (pos != -1 and start > pos):
+        pos = text.find(char, start)
+        found[char] = (start, pos)
+    return pos
+
+
+def matchLink(text, start, references, found, image=False):
+    """ Match the inline link [text](url "title") or the reference link
+        [text][label], [text][] or [label] whose [ is at start. References
+        are looked up in the dict returned by collectReferences, None to only
+        match inline links. With image=True an image token is made instead.
+        Returns the token and the index after the link, None if there is
+        no link. Nothing past the end of text is looked at """
+    close = findFrom(text, "]", start + 1, found)
+    if close == -1:
+        return None
+    # Brackets do not nest in link text
+    nested = findFrom(text, "[", start + 1, found)
+    if nested != -1 and nested < close:
+        return None
+    content = text[start + 1 : close]
+    after = close + 1
+    nextChar = text[after : after + 1]
+
+    if nextChar == "(":
+        end = findFrom(text, ")", after + 1, found)
+        if end == -1:
+            return None
+        parts = text[after + 1 : end].split(None, 1)
+        url = parts[0] if len(parts) != 0 else ""
+        title = parts[1].strip().strip("\"'") if len(parts) == 2 else ""
+    else:
+        if references is None:
+            return None
+        label = content
+        end = close
+        if nextChar == "[":
+            labelEnd = findFrom(text, "]", after + 1, found)
+            nested = findFrom(text, "[", after + 1, found)
+            if labelEnd != -1 and (nested == -1 or nested > labelEnd):
+                # A collapsed reference [text][] uses the text as its label
+                if labelEnd != after + 1:
+                    label = text[after + 1 : labelEnd]
+                end = labelEnd
+        reference = references.get(normalizeLabel(label))
+        if reference is None:
+            return None
+        url, title = reference
+
+    if image:
+        token = {"type": tokType.IMAGE, "desc": content, "url": url, "title": title}
+    else:
+        token = {"type": tokType.LINK, "title": content, "path": url}
+    return (token, end + 1)
+
+
+def tokenizeBracket(self, image, references):
+    """ Tokenize the link or image whose [ is the current character. Only
+        the rest of the current line is searched, so a missing bracket costs
+        O(line). Without a link, the brackets are added as plain text """
+    lineEnd = self.text.find("\n", self.currIndex)
+    if lineEnd == -1:
+        lineEnd = self.EOF
+    match = matchLink(self.text[self.currIndex : lineEnd], 0, references, {}, image)
+    if match is None:
+        self.tokens.append({"type": tokType.PLAIN, "content": "![" if image else "["})
+        length = 1
+    else:
+        token, length = match
+        self.tokens.append(token)
+    for _ in range(length):
         self.getNext()
-        while self.currChar != '"':
-            imgTitle += self.currChar
-            self.getNext()
 
-    # skip over the )
-    self.getNext()
-    self.getNext()
 
-    self.tokens.append(
-        {"type": tokType.IMAGE, "desc": imgDesc, "url": imgURL, "title": imgTitle}
-    )
+def tokenizeImage(self, references=None):
+    """ Tokenizes an image link """
+    if self.currChar == "!":
+        self.getNext()
+    tokenizeBracket(self, True, references)
+
 
-def tokenizeLink(self):
+def tokenizeLink(self, references=None):
     """Tokenizes a standard markdown link"""
-    linkTitle = ""
-    linkPath = ""
-    self.skipWhiteSpace()
-    self.getNext()
-    self.skipWhiteSpace()
-    while self.getNext() != "]":
-        linkTitle += self.currChar
-
-    # Skip over the ] character
-    self.getNext()
-    self.skipWhiteSpace()
-    # Skip over (
-    self.getNext()
     self.skipWhiteSpace()
-    while self.getNext() != ")":
-        linkPath += self.currChar
+    tokenizeBracket(self, False, references)
 
-    self.tokens.append({"type": tokType.LINK, "title": linkTitle, "path": linkPath})
 
 def eatCharsMarkup(self):
     """Consume characters which are using some type of markup such as * or **"""
@@ -86,11 +177,11 @@ def eatCharsMarkup(self):
         if (
             self.currChar == "*"
             and self.peekNext(1) == "*"
-            and self.peekNext(2) != " "
+            and self.peekNext(2) not in " \n"
         ) or (
             self.currChar == "_"
             and self.peekNext(1) == "_"
-            and self.peekNext(2) != " "
+            and self.peekNext(2) not in " \n"
         ):
 
             # Skip over * and *
@@ -112,11 +203,10 @@ def eatCharsMarkup(self):
             self.getNext()
             self.getNext()
             textArr.append({"type": tokType.RBOLD})
-            print("got rbold")
 
         # Case of italic text like *WORD*
-        elif (self.currChar == "*" and self.peekNext(1) != " ") or (
-            self.currChar == "_" and self.peekNext(1) != " "
+        elif (self.currChar == "*" and self.peekNext(1) not in " \n") or (
+            self.currChar == "_" and self.peekNext(1) not in " \n"
         ):
             # Skip over * to next character
             self.getNext()
@@ -144,10 +234,14 @@ def eatCharsMarkup(self):
             self.getNext()
             textArr.append({"type": tokType.CROSS})
 
-        # Default case for plain text
+        # Default case for plain text. The current character is always taken
+        # so that a lone special character can not stall the loop
         else:
             textContent = ""
-            while self.currChar not in ["\n", "*", "_", "[", "`", "("]:
+            if self.currChar != "\\":
+                textContent += self.currChar
+                self.getNext()
+            while self.currChar not in ["\n", "*", "_", "[", "`", "(", "~"]:
                 # Check for escape characters
                 if self.currChar == "\\" and self.peekNext() in [
                     "(",
@@ -177,3 +271,140 @@ def eatCharsMarkup(self):
 
     return textArr
 
+
+
+class markupCursor:
+    """ Position along a single line of text. Uses the same stepping methods
+        as mdTokenizer so that eatCharsMarkup can run on text which is not
+        part of a tokenizer, such as the content of a token """
+
+    getNext = mdTokenizer.getNext
+    peekNext = mdTokenizer.peekNext
+    peekPrev = mdTokenizer.peekPrev
+    eatCharsMarkup = eatCharsMarkup
+
+    def __init__(self, text):
+        self.text = text + "\n"
+        self.EOF = len(self.text)
+        self.currIndex = 0
+        self.currChar = self.text[0]
+
+
+def scanInline(text, references=None):
+    """ Split a line of text into markup tokens(bold, italics, ...) and plain
+        text tokens. Gives the same tokens as eatCharsMarkup, but jumps from
+        one special character to the next with plainStopExp and takes the
+        plain text in between as a single slice. When the reference link
+        definitions of the document are provided, as returned by
+        collectReferences, links and images are turned into their tokens """
+    # Nothing after the end of the line is tokenized
+    end = text.find("\n")
+    if end != -1:
+        text = text[:end]
+
+    # Line without any special character, the whole of it is plain text
+    if plainStopExp.search(text) is None:
+        return [{"type": tokType.PLAIN, "content": text}] if text != "" else []
+
+    length = len(text)
+    tokens = []
+    index = 0
+    # Searches made by matchLink, see findFrom
+    found = {}
+    # Tells if the text is inside of inline code, where links are kept as is
+    inCode = False
+    while index < length:
+        char = text[index]
+
+        # Delimiter runs. Whether a run opens or closes is decided by the
+        # characters on each side of it
+        if char == "*" or char == "_":
+            nextChar = text[index + 1] if index + 1 < length else "\n"
+            prevChar = text[index - 1] if index != 0 else None
+            if nextChar == char:
+                afterChar = text[index + 2] if index + 2 < length else "\n"
+                # Case of bold text like **WORD**
+                if afterChar != " " and afterChar != "\n":
+                    tokens.append({"type": tokType.LBOLD})
+                    index += 2
+                    continue
+                if prevChar != " ":
+                    tokens.append({"type": tokType.RBOLD})
+                    index += 2
+                    continue
+            # Case of italic text like *WORD*
+            if nextChar != " " and nextChar != "\n":
+                tokens.append({"type": tokType.LITALIC})
+                index += 1
+                continue
+            if prevChar != " ":
+                tokens.append({"type": tokType.RITALIC})
+                index += 1
+                continue
+        # Inline code
+        elif char == "`":
+            tokens.append({"type": tokType.ICODE})
+            inCode = not inCode
+            index += 1
+            continue
+        # Links and images, which start with ![
+        elif char == "[" and references is not None and not inCode:
+            # The ! is escaped by an odd run of backslashes in front of it,
+            # an even run only holds escaped backslashes
+            image = False
+            if index != 0 and text[index - 1] == "!":
+                start = index - 1
+                while start != 0 and text[start - 1] == "\\":
+                    start -= 1
+                image = (index - 1 - start) % 2 == 0
+            match = matchLink(text, index, references, found, image)
+            if match is not None:
+                token, index = match
+                if image:
+                    # The ! went into the plain text in front of the image
+                    content = tokens[-1]["content"][:-1]
+                    if content != "":
+                        tokens[-1]["content"] = content
+                    else:
+                        tokens.pop()
+                tokens.append(token)
+                continue
+        # Crossed out text like ~~WORD~~
+        elif char == "~" and text[index + 1 : index + 2] == "~":
+            tokens.append({"type": tokType.CROSS})
+            index += 2
+            continue
+
+        # Plain text up to the next special character. The current character
+        # is always taken so that a lone special character can not stall
+        parts = []
+        if char != "\\":
+            parts.append(char)
+            index += 1
+        while True:
+            match = plainStopExp.search(text, index)
+            if match is None:
+                parts.append(text[index:])
+                index = length
+                break
+            stop = match.start()
+            parts.append(text[index:stop])
+            if text[stop] != "\\":
+                index = stop
+                break
+            # Escaped characters are added as normal ones
+            if text[stop + 1 : stop + 2] in ESCAPABLE:
+                parts.append(text[stop + 1])
+                index = stop + 2
+            else:
+                parts.append("\\")
+                index = stop + 1
+        tokens.append({"type": tokType.PLAIN, "content": "".join(parts)})
+
+    return tokens
+
+
+def tokenizeInline(text, references=None):
+    """ Split a line of text into markup tokens(bold, italics, ...) and
+        plain text tokens, along with links when references are provided """
+    return scanInline(text, references)
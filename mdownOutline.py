@@ -0,0 +1,258 @@
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#     Copyright (C) 2019 Yavor Konstantinov
+#
+
+from tokenType import tokType
+from mdownMapped import (
+    mdMappedTokenizer,
+    mapFile,
+    indentBytesExp,
+    hashRunExp,
+    hrLineBytesExp,
+    fenceOpenBytesExp,
+    codeEndBytesExp,
+)
+from mdownStructure import findFenceClose, hrLineExp
+import codecs
+import itertools
+import re
+
+# Lines the outline depends on: lines starting with #, heading underlines,
+# lines which may open a code fence and checklist items too short to hold
+# "- [x]", which swallow part of the line after them. The expression
+# matches the newline in front of such a line, which the regex engine
+# searches for much faster than it tries ^ at every position. The first
+# line is matched on its own
+outlineLineExp = re.compile(
+    rb"\n(?: *(?:(?P<hash>#)|(?P<fence>```|~~~)|(?P<check>- \[(?=[^\n]{0,5}\n)))|(?P<underline>(?:-{3,}|={3,})(?=\r?\n)))"
+)
+firstLineExp = re.compile(
+    rb"(?: *(?:(?P<hash>#)|(?P<fence>```|~~~)|(?P<check>- \[(?=[^\n]{0,5}\n)))|(?P<underline>(?:-{3,}|={3,})(?=\r?\n)))"
+)
+blankBytesExp = re.compile(rb" *\r?")
+indentExp = re.compile(" *")
+
+# Kinds of lines recorded by scanOutline
+LINE_ATX = 1
+LINE_CHECK = 2
+LINE_UNDERLINED = 4
+LINE_FENCE = 8
+
+# Kind of every line group of outlineLineExp
+lineKinds = {"hash": LINE_ATX, "check": LINE_CHECK, "fence": LINE_FENCE}
+
+
+def skipChars(text, index, count, utf8=True):
+    """ Return the position count characters after index, counting "\\r\\n"
+        and UTF-8 sequences as one character like mdMappedTokenizer does """
+    EOF = len(text)
+    for step in range(count):
+        if index >= EOF:
+            return index + count - step
+        if text[index] == 13 and index + 1 < EOF and text[index + 1] == 10:
+            index += 1
+        index += 1
+        if utf8:
+            while index < EOF and 0x80 <= text[index] < 0xC0:
+                index += 1
+    return index
+
+
+def inIndentedCode(text, start, consumed):
+    """ Tell if the line at start, which is indented by four spaces or more,
+        is part of an indented code block. Such a block starts on an
+        indented line right after a line the tokenizer took as a blank line
+        and goes on over indented and blank lines. Nothing in front of
+        consumed is looked at. Returns None when it depends on whether an
+        earlier line was a horizontal rule, which swallows an empty line.
+        Works on str as well as on bytes-like buffers """
+    if isinstance(text, str):
+        newline, carriageReturn, indentLineExp, ruleLineExp = "\n", "\r", indentExp, hrLineExp
+    else:
+        newline, carriageReturn = b"\n", b"\r"
+        indentLineExp, ruleLineExp = indentBytesExp, hrLineBytesExp
+    lineStart = start
+    lineBlank = False
+    while lineStart > consumed:
+        prevStart = text.rfind(newline, 0, lineStart - 1) + 1
+        prevEnd = lineStart - 1
+        if prevEnd > prevStart and text[prevEnd - 1 : prevEnd] == carriageReturn:
+            prevEnd -= 1
+        prevIndent = indentLineExp.match(text, prevStart, prevEnd).end() - prevStart
+        if prevStart + prevIndent != prevEnd:
+            # An indented line, the block may start further up
+            if prevIndent < 4:
+                return False
+        elif not lineBlank:
+            # A blank line in front of an indented one
+            if prevStart < consumed:
+                return False
+            if prevEnd != prevStart:
+                return True
+            # An empty line is skipped at the very start and after a rule
+            if prevStart == 0:
+                return False
+            ruleStart = text.rfind(newline, 0, prevStart - 1) + 1
+            ruleEnd = prevStart - 1
+            if ruleEnd > ruleStart and text[ruleEnd - 1 : ruleEnd] == carriageReturn:
+                ruleEnd -= 1
+            if ruleStart >= consumed and ruleLineExp.fullmatch(text, ruleStart, ruleEnd):
+                return None
+            return True
+        lineBlank = prevStart + prevIndent == prevEnd
+        lineStart = prevStart
+    return False
+
+
+def outlineByTokenizer(text, encoding="utf-8"):
+    """ Version of scanOutline which drives the tokenizer over the whole
+        buffer. Used for the few documents scanOutline can not tell apart
+        without tokenizing them """
+    tokenizer = mdMappedTokenizer(text, encoding, compact=True)
+    outline = []
+    lineNumber = 1
+    lineCountedTo = 0
+    while tokenizer.currIndex + 1 < tokenizer.EOF:
+        if tokenizer.currChar == "\n":
+            tokenizer.getNext()
+        start = tokenizer.currIndex
+        entryCount = len(tokenizer.document)
+        tokenizer.tokenizeLine()
+        for entry in tokenizer.document[entryCount:]:
+            if isinstance(entry, list):
+                continue
+            if entry["type"] == tokType.MHEADING or entry["type"] == tokType.UHEADING:
+                lineNumber += text[lineCountedTo:start].count(b"\n")
+                lineCountedTo = start
+                outline.append((entry.get("size", 1), entry["content"], start, lineNumber))
+    return outline
+
+
+def scanOutline(buffer, encoding="utf-8"):
+    """ Return the headings of a markdown buffer(bytes or a memory mapped
+        file) as (level, text, byte offset, line number) tuples, without
+        tokenizing anything else. The headings are the ones the tokenizer
+        finds: the offset is the start of the heading line and line numbers
+        start at 1. Underlined headings are converted to <h1> like every
+        underlined heading so their level is 1 whatever the underline """
+    text = buffer
+    EOF = len(text)
+    utf8 = codecs.lookup(encoding).name == "utf-8"
+    # The tokenizer driver never looks at a buffer of a single byte
+    if EOF <= 1:
+        return []
+
+    # Kind of every line which may start a heading or swallow one, by the
+    # offset where it starts
+    lines = {}
+    matches = outlineLineExp.finditer(text)
+    firstMatch = firstLineExp.match(text)
+    if firstMatch is not None:
+        matches = itertools.chain((firstMatch,), matches)
+    for match in matches:
+        # Offset of the line, past the newline in front of it
+        start = match.start() if match is firstMatch else match.start() + 1
+        if match.lastgroup == "underline":
+            if start != 0:
+                # The line in front of the underline is the candidate
+                prevStart = text.rfind(b"\n", 0, start - 1) + 1
+                lines[prevStart] = lines.get(prevStart, 0) | LINE_UNDERLINED
+        else:
+            lines[start] = lines.get(start, 0) | lineKinds[match.lastgroup]
+
+    outline = []
+    # Everything in front of this offset has been consumed by earlier lines
+    consumed = 0
+    lineNumber = 1
+    lineCountedTo = 0
+    for start in sorted(lines):
+        if start < consumed:
+            continue
+        kind = lines[start]
+        end = text.find(b"\n", start)
+        if end == -1:
+            end = EOF
+        contentEnd = end - 1 if end > 0 and text[end - 1] == 13 else end
+        pos = indentBytesExp.match(text, start, contentEnd).end()
+
+        # Same order of rules as the tokenizer: indented code first, then #
+        # and fences, then underlines
+        if pos - start >= 4 and pos < contentEnd:
+            code = inIndentedCode(text, start, consumed)
+            if code is None:
+                return outlineByTokenizer(text, encoding)
+            if code:
+                codeEnd = codeEndBytesExp.search(text, start)
+                consumed = EOF if codeEnd is None else codeEnd.start() + 1
+                continue
+        if kind & LINE_FENCE:
+            opener = fenceOpenBytesExp.match(text, pos, contentEnd)
+            fence, info = opener.groups()
+            # Backticks followed by more of them on the line are inline code
+            if fence[0] != 96 or b"`" not in info:
+                closer = findFenceClose(text, fence, end + 1)
+                consumed = EOF if closer is None else closer[1] + 1
+                continue
+        if kind & LINE_ATX:
+            hashEnd = hashRunExp.match(text, pos, contentEnd).end()
+            level = min(hashEnd - pos, 6)
+            content = text[hashEnd:contentEnd].lstrip(b" ")
+        elif kind & LINE_UNDERLINED:
+            if blankBytesExp.fullmatch(text, start, end) is not None:
+                continue
+            level = 1
+            content = text[pos:contentEnd]
+            # The underline itself is consumed along with the heading
+            underlineEnd = text.find(b"\n", end + 1)
+            consumed = EOF if underlineEnd == -1 else underlineEnd + 1
+        elif kind & LINE_CHECK:
+            # A checklist item takes the five characters of "- [x]" even if
+            # its line is shorter, and the rest of the line they end on
+            eatEnd = text.find(b"\n", skipChars(text, pos, 5, utf8))
+            consumed = EOF if eatEnd == -1 else eatEnd + 1
+            continue
+        else:
+            continue
+
+        lineNumber += text[lineCountedTo:start].count(b"\n")
+        lineCountedTo = start
+        outline.append((level, content.decode(encoding), start, lineNumber))
+
+    # After a horizontal rule the tokenizer driver skips a last line of a
+    # single character, which matters for a lone # at the very end. Whether
+    # the line before it is a rule depends on the blank lines in front of
+    # it, so this one case is left to the tokenizer
+    if len(outline) != 0 and outline[-1][2] == EOF - 1 and text[EOF - 2] == 10:
+        prevStart = text.rfind(b"\n", 0, EOF - 2) + 1
+        prevEnd = EOF - 3 if EOF > 2 and text[EOF - 3] == 13 else EOF - 2
+        if hrLineBytesExp.fullmatch(text, prevStart, prevEnd) is not None:
+            tokenizer = mdMappedTokenizer(text, encoding, compact=True)
+            tokenizer.tokenize()
+            if tokenizer.returnTokenList()[-2]["type"] == tokType.HR:
+                outline.pop()
+
+    return outline
+
+
+def outlineFile(path, encoding="utf-8"):
+    """ Return the outline of the markdown file at path, see scanOutline """
+    with open(path, "rb") as inputFile:
+        buffer = mapFile(inputFile)
+    try:
+        return scanOutline(buffer, encoding)
+    finally:
+        if not isinstance(buffer, bytes):
+            buffer.close()
@@ -0,0 +1,383 @@
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#     Copyright (C) 2019 Yavor Konstantinov
+#
+
+from mdownStructure import (
+    mdTokenizer,
+    hrLineExp,
+    findFenceClose,
+    fenceOpenExp,
+    codeEndExp,
+)
+from mdownSerial import dumps, loads
+from HtmlConverter import HTMLConverter
+from mdownMarkup import collectReferences, matchDefinition, normalizeLabel
+from mdownOutline import inIndentedCode, indentExp
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+import io
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+# Size of the chunks the text is cut into, unless it has to be cut into more
+# of them to keep every worker busy
+CHUNK_CHARS = 4 << 20
+# Chunks smaller than this are not worth sending to a worker
+MIN_CHUNK_CHARS = 1 << 20
+
+# A blank line between a line holding at least six characters after its
+# indentation and a line indented by less than four spaces, which can not
+# start an indented code block. The text can be cut after the blank line,
+# see safeSplitAfter
+splitCandidateExp = re.compile("\n *([^ \n][^\n]{5,})\n *\n(?= {0,3}[^ \n])")
+# Lines which decide where the fenced code blocks are, see
+# mdownOutline.outlineLineExp: lines which may open a fence, checklist items
+# too short to hold "- [x]", which swallow part of the line after them,
+# heading underlines, which take the line in front of them, and lines
+# starting with #, which are headings even when underlined. Lines which may
+# define a reference link, see mdownMarkup.referenceDefExp, are found along
+regionLineExp = re.compile(
+    "^(?: *(?:(?P<hash>#)|(?P<fence>```|~~~)|(?P<check>- \\[(?=[^\n]{0,5}\n))|(?P<definition>\\[[^\\[\\]\n]+\\]:))"
+    "|(?P<underline>(?:-{3,}|={3,})(?=\n)))",
+    re.M,
+)
+
+# Kinds of lines found by regionLineExp
+LINE_ATX = 1
+LINE_FENCE = 2
+LINE_CHECK = 4
+LINE_DEFINITION = 8
+LINE_UNDERLINED = 16
+
+# Kind of every line group of regionLineExp
+lineKinds = {
+    "hash": LINE_ATX,
+    "fence": LINE_FENCE,
+    "check": LINE_CHECK,
+    "definition": LINE_DEFINITION,
+}
+
+
+def fencedRegions(text, references=None):
+    """ Return the (start, end) offsets of the fenced code blocks of text and
+        the offset up to which they can be relied on. The lines which may
+        open a fence are classified one after the other the way
+        mdownOutline.scanOutline classifies the lines of an outline, so a
+        fence line inside of an indented code block or swallowed by a
+        checklist item does not open one. Only a fence line indented as code
+        whose block depends on an earlier horizontal rule is not classified
+        and nothing past it is relied on. When references is a dict, the
+        reference link definitions of the lines tokenized as plain text are
+        added to it the way collectReferences adds them """
+    EOF = len(text)
+    lines = {}
+    for match in regionLineExp.finditer(text):
+        start = match.start()
+        if match.lastgroup == "underline":
+            if start != 0:
+                # The line in front of the underline is the candidate
+                prevStart = text.rfind("\n", 0, start - 1) + 1
+                lines[prevStart] = lines.get(prevStart, 0) | LINE_UNDERLINED
+        else:
+            lines[start] = lines.get(start, 0) | lineKinds[match.lastgroup]
+
+    regions = []
+    # Everything in front of this offset has been consumed by earlier lines
+    consumed = 0
+    for start in sorted(lines):
+        if start < consumed:
+            continue
+        kind = lines[start]
+        end = text.find("\n", start)
+        if end == -1:
+            end = EOF
+        pos = indentExp.match(text, start, end).end()
+
+        # Same order of rules as the tokenizer: indented code first, then #
+        # and fences, then underlines and checklist items
+        if pos - start >= 4 and pos < end:
+            code = inIndentedCode(text, start, consumed)
+            if code is None:
+                return (regions, start)
+            if code:
+                codeEnd = codeEndExp.search(text, start)
+                consumed = EOF if codeEnd is None else codeEnd.start() + 1
+                continue
+        if kind & LINE_FENCE:
+            fence, info = fenceOpenExp.match(text, pos, end).groups()
+            # Backticks followed by more of them on the line are inline code
+            if fence[0] != "`" or "`" not in info:
+                closer = findFenceClose(text, fence, end + 1)
+                regionEnd = EOF if closer is None else closer[1]
+                regions.append((start, regionEnd))
+                consumed = regionEnd + 1
+                continue
+        if kind & LINE_ATX:
+            continue
+        if kind & LINE_UNDERLINED:
+            if pos != end:
+                # The underline itself is consumed along with the heading
+                underlineEnd = text.find("\n", end + 1)
+                consumed = EOF if underlineEnd == -1 else underlineEnd + 1
+                continue
+        if kind & LINE_CHECK:
+            # A checklist item takes the five characters of "- [x]" even if
+            # its line is shorter, and the rest of the line they end on
+            eatEnd = text.find("\n", pos + 5)
+            consumed = EOF if eatEnd == -1 else eatEnd + 1
+        elif kind & LINE_DEFINITION and references is not None:
+            match = matchDefinition(text[pos:end])
+            if match is not None:
+                label, url, *titles = match.groups()
+                title = next((title for title in titles if title is not None), "")
+                references.setdefault(normalizeLabel(label), (url, title))
+    if references is not None:
+        references.pop("", None)
+    return (regions, EOF)
+
+
+def safeSplitAfter(text, pos, regions=(), limit=None):
+    """ Return the first offset at or after pos where tokenizing can restart
+        from scratch, or None. The offset is the start of a line following a
+        blank line, so the tokenizer is between blocks there with blankFlag
+        set, which is how a chunk tokenizer is started. The blank line must
+        be tokenized as one, so the line in front of it can not be a rule,
+        which would swallow an empty line after it, nor so short that a
+        checklist item could reach past it. The line at the offset can not
+        be empty since a tokenizer skips an empty first line. Nothing
+        inside of the fenced code blocks in regions or past limit, as
+        returned by fencedRegions, is a candidate """
+    for match in splitCandidateExp.finditer(text, max(pos - 1, 0)):
+        if limit is not None and match.end() > limit:
+            return None
+        # The last fenced block starting in front of the candidate
+        index = bisect_left(regions, (match.end(),)) - 1
+        if index >= 0 and regions[index][1] > match.start():
+            continue
+        if hrLineExp.fullmatch(match.group(1)) is None:
+            return match.end()
+    return None
+
+
+def splitText(text, chunkCount, scan=None):
+    """ Return the offsets cutting text into about chunkCount chunks at safe
+        points, starting with 0 and ending with len(text). scan is what
+        fencedRegions returns for text, which is called when it is not given """
+    chunkSize = max(len(text) // chunkCount, MIN_CHUNK_CHARS)
+    regions, limit = fencedRegions(text) if scan is None else scan
+    bounds = [0]
+    while True:
+        split = safeSplitAfter(text, bounds[-1] + chunkSize, regions, limit)
+        # The tokenizer driver never looks at a text of a single character
+        if split is None or split >= len(text) - 1:
+            break
+        bounds.append(split)
+    if limit < len(text) and len(text) - bounds[-1] > chunkSize:
+        logger.info(
+            "Not cutting the text past offset %d, where an indented code block depends on a horizontal rule",
+            limit,
+        )
+    bounds.append(len(text))
+    return bounds
+
+
+def tokenizeChunk(chunk, engine="line", compact=False, first=True, last=True):
+    """ Tokenize one chunk of a document. Chunks other than the first start
+        after a blank line and the ones other than the last do not get the
+        EOF token """
+    tokenizer = mdTokenizer(io.StringIO(chunk), engine=engine, compact=compact)
+    if not first:
+        tokenizer.blankFlag = True
+    tokenizer.tokenize()
+    document = tokenizer.returnTokenList()
+    if not last:
+        document.pop()
+    return document
+
+
+def tokenizeChunkPacked(chunk, engine, compact, first, last):
+    """ tokenizeChunk run by the worker processes. Compact tokens are sent
+        back in the binary format of mdownSerial, which is cheaper to build
+        and to read than the pickled token objects """
+    document = tokenizeChunk(chunk, engine, compact, first, last)
+    return dumps(document) if compact else document
+
+
+def stitchDocuments(parts):
+    """ Join the documents of consecutive chunks. Every chunk but the last
+        ends with the block holding the blank line it was cut after, which is
+        continued by the block the next chunk may start with """
+    document = parts[0]
+    for part in parts[1:]:
+        if len(part) != 0 and isinstance(part[0], list) and isinstance(document[-1], list):
+            document[-1].extend(part[0])
+            document.extend(part[1:])
+        else:
+            document.extend(part)
+    return document
+
+
+def tokenizeParallel(text, jobCount=None, engine="line", compact=False, executor=None):
+    """ Tokenize a whole document held in memory using several worker
+        processes and return the same document structure as tokenize().
+        The text is cut into chunks at safe points, the chunks are tokenized
+        by the workers and their documents are joined back together. Small
+        texts are tokenized in the calling process. An executor, such as a
+        pool kept around for several documents, can be passed in place of
+        the pool created for every call """
+    if jobCount is None:
+        jobCount = os.cpu_count() or 1
+    chunkCount = max(jobCount, len(text) // CHUNK_CHARS)
+    bounds = splitText(text, chunkCount)
+    if jobCount == 1 or len(bounds) <= 2:
+        return tokenizeChunk(text, engine, compact)
+
+    chunks = len(bounds) - 1
+    args = (
+        [text[bounds[index] : bounds[index + 1]] for index in range(chunks)],
+        [engine] * chunks,
+        [compact] * chunks,
+        [index == 0 for index in range(chunks)],
+        [index == chunks - 1 for index in range(chunks)],
+    )
+    if executor is not None:
+        parts = list(executor.map(tokenizeChunkPacked, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=min(jobCount, chunks)) as pool:
+            parts = list(pool.map(tokenizeChunkPacked, *args))
+    if compact:
+        parts = [loads(part) for part in parts]
+    return stitchDocuments(parts)
+
+
+class chunkConverter(HTMLConverter):
+    """ Converter for one chunk of a document. The only state the output of
+        a chunk depends on is the list left open by the chunks before it,
+        so the position of the first list tag written or closed is recorded
+        and the list still open at the end is left open """
+
+    def __init__(self, tokenStream, references=None):
+        super().__init__(tokenStream, references=references)
+        # Offset in the output and tag(None when closing) of the first call
+        # to openListTag or closeList
+        self.firstListCall = None
+
+    def openListTag(self, tag):
+        if self.firstListCall is None:
+            self.firstListCall = (self.bufferedChars, tag)
+        super().openListTag(tag)
+
+    def closeList(self):
+        if self.firstListCall is None:
+            self.firstListCall = (self.bufferedChars, None)
+        super().closeList()
+
+    def renderChunk(self):
+        """ Return the HTML of the chunk, the first list call and the tag of
+            the list which is open at the end """
+        self.prepareReferences()
+        streamLen = len(self.tokens)
+        while self.currIndex < streamLen:
+            self.convertToken()
+            self.nextTok()
+        return ("".join(self.buffer), self.firstListCall, self.openList)
+
+
+def renderChunk(chunk, engine="line", first=True, last=True, references=None):
+    """ Tokenize and convert one chunk of a document inside a worker. Links
+        are resolved against the reference definitions of the whole document """
+    document = tokenizeChunk(chunk, engine, True, first, last)
+    return chunkConverter(document, references).renderChunk()
+
+
+def chunkReferences(chunk, engine="line", first=True, last=True):
+    """ Return the reference link definitions of one chunk of a document """
+    return collectReferences(tokenizeChunk(chunk, engine, True, first, last))
+
+
+def stitchHtml(parts):
+    """ Join the output of consecutive chunks, as returned by renderChunk.
+        Each chunk was converted as if no list was open before it, which is
+        corrected where it first opens or closes a list """
+    pieces = []
+    openList = None
+    for html, firstListCall, lastList in parts:
+        if firstListCall is None:
+            # Nothing in the chunk touched the list which is open
+            pieces.append(html)
+            continue
+        offset, tag = firstListCall
+        if openList is None:
+            pieces.append(html)
+        elif tag == openList:
+            # The chunk continues the open list instead of starting one
+            pieces.append(html[:offset])
+            pieces.append(html[offset + len("<{0}>\n".format(tag)) :])
+        else:
+            pieces.append(html[:offset])
+            pieces.append("</{0}>\n".format(openList))
+            pieces.append(html[offset:])
+        openList = lastList
+    if openList is not None:
+        pieces.append("</{0}>\n".format(openList))
+    return "".join(pieces)
+
+
+def chunkDefinitions(mapper, args):
+    """ Collect the reference link definitions of the chunks by tokenizing
+        them with mapper and return the definitions of the whole document
+        once for every chunk. Only used when fencedRegions could not collect
+        them from the text """
+    references = {}
+    for definitions in mapper(chunkReferences, *args):
+        for label, reference in definitions.items():
+            references.setdefault(label, reference)
+    return [references] * len(args[0])
+
+
+def convertParallel(text, jobCount=None, engine="line", executor=None):
+    """ Convert a whole document held in memory to HTML using several worker
+        processes. Unlike tokenizeParallel, the tokens never leave the
+        workers, only the HTML of every chunk is sent back and joined. Gives
+        the same HTML as converting the document serially. The reference
+        link definitions of the whole document are collected from the text
+        while looking for places to cut it """
+    if jobCount is None:
+        jobCount = os.cpu_count() or 1
+    chunkCount = max(jobCount, len(text) // CHUNK_CHARS)
+    references = {}
+    scan = fencedRegions(text, references)
+    bounds = splitText(text, chunkCount, scan)
+    chunks = len(bounds) - 1
+    args = (
+        [text[bounds[index] : bounds[index + 1]] for index in range(chunks)],
+        [engine] * chunks,
+        [index == 0 for index in range(chunks)],
+        [index == chunks - 1 for index in range(chunks)],
+    )
+    # Past the limit of fencedRegions the definitions are not known
+    definitions = [references] * chunks if scan[1] == len(text) else None
+    if jobCount == 1 or chunks == 1:
+        return stitchHtml(map(renderChunk, *args, definitions or chunkDefinitions(map, args)))
+    if executor is not None:
+        definitions = definitions or chunkDefinitions(executor.map, args)
+        return stitchHtml(executor.map(renderChunk, *args, definitions))
+    with ProcessPoolExecutor(max_workers=min(jobCount, chunks)) as pool:
+        definitions = definitions or chunkDefinitions(pool.map, args)
+        return stitchHtml(pool.map(renderChunk, *args, definitions))
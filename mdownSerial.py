@@ -0,0 +1,325 @@
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#     Copyright (C) 2019 Yavor Konstantinov
+#
+
+from tokenType import tokType
+from mdownTokens import (
+    PlainToken,
+    TextToken,
+    HeadingToken,
+    CheckToken,
+    CodeToken,
+    IndentToken,
+    EOL_TOKEN,
+    BLANK_TOKEN,
+    HR_TOKEN,
+    EOF_TOKEN,
+)
+
+# Binary token documents start with MAGIC followed by a version byte. The
+# version changes whenever the layout or the entry codes below change
+MAGIC = b"YMDT"
+FORMAT_VERSION = 2
+
+# Code written in front of every entry of a document and every token of a
+# block. Fields follow the code as varints and content as a reference into
+# the string table. The table is in the order of first use so a reference
+# of 0 stands for the next string which was not used yet and any other
+# reference n for the string at index n - 1. These values are part of the
+# format, unlike tokType values
+CODE_BLOCK = 0
+CODE_PLAIN = 1
+CODE_MARKUP_PLAIN = 2
+CODE_BLANK = 3
+CODE_INDENT = 4
+CODE_EOL = 5
+CODE_MHEADING = 6
+CODE_UHEADING = 7
+CODE_BULLET = 8
+CODE_NUMBULLET = 9
+CODE_CHECKED = 10
+CODE_UNCHECKED = 11
+CODE_HR = 12
+CODE_EOF = 13
+CODE_CBLOCK = 14
+
+# Codes of the tokens which are only made of a type and a line of text
+textCodes = {
+    tokType.UHEADING: CODE_UHEADING,
+    tokType.BULLET: CODE_BULLET,
+    tokType.NUMBULLET: CODE_NUMBULLET,
+}
+textTypes = {code: tokenType for tokenType, code in textCodes.items()}
+
+# Codes of the tokens which carry no payload and the token shared for them
+emptyCodes = {
+    tokType.BLANK: CODE_BLANK,
+    tokType.EOL: CODE_EOL,
+    tokType.HR: CODE_HR,
+    "EOF": CODE_EOF,
+}
+emptyTokens = {
+    CODE_BLANK: BLANK_TOKEN,
+    CODE_EOL: EOL_TOKEN,
+    CODE_HR: HR_TOKEN,
+    CODE_EOF: EOF_TOKEN,
+}
+
+
+def writeVarint(out, value):
+    """ Append an unsigned integer to a bytearray, 7 bits per byte with the
+        high bit set on every byte but the last """
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def readVarint(data, pos):
+    """ Read the varint at pos. Returns the value and the position after it """
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return (value, pos)
+        shift += 7
+
+
+class documentWriter:
+    """ Builds the binary form of a token document. Every distinct line of
+        text is stored once in the string table, the entries only refer to
+        it """
+
+    def __init__(self):
+        # Encoded entries, written after the string table
+        self.body = bytearray()
+        # Index of every string in the table
+        self.stringIndex = {}
+        self.strings = []
+
+    def writeString(self, text):
+        index = self.stringIndex.get(text)
+        if index is None:
+            self.stringIndex[text] = len(self.strings)
+            self.strings.append(text)
+            self.body.append(0)
+        else:
+            writeVarint(self.body, index + 1)
+
+    def writeToken(self, token):
+        """ Encode a single token, dict or compact """
+        body = self.body
+        tokenType = token["type"]
+        if tokenType == tokType.PLAIN:
+            markup = token.get("markup")
+            if markup is None:
+                # Made by a factory which did not record it
+                markup = PlainToken(token["content"]).markup
+            body.append(CODE_MARKUP_PLAIN if markup else CODE_PLAIN)
+            self.writeString(token["content"])
+        elif tokenType in emptyCodes:
+            body.append(emptyCodes[tokenType])
+        elif tokenType == tokType.INDENT:
+            body.append(CODE_INDENT)
+            writeVarint(body, token["count"])
+        elif tokenType in textCodes:
+            body.append(textCodes[tokenType])
+            self.writeString(token["content"])
+        elif tokenType == tokType.MHEADING:
+            body.append(CODE_MHEADING)
+            writeVarint(body, token["size"])
+            self.writeString(token["content"])
+        elif tokenType == tokType.CHECKMARK:
+            body.append(CODE_CHECKED if token["status"] else CODE_UNCHECKED)
+            self.writeString(token["content"])
+        elif tokenType == tokType.CBLOCK:
+            # A code block without a language is written with an empty one
+            body.append(CODE_CBLOCK)
+            self.writeString(token["lang"] or "")
+            self.writeString(token["content"])
+        else:
+            raise ValueError("Cannot serialize token of type {0}".format(tokenType))
+
+    def writeDocument(self, document):
+        writeVarint(self.body, len(document))
+        for entry in document:
+            if isinstance(entry, list):
+                self.body.append(CODE_BLOCK)
+                writeVarint(self.body, len(entry))
+                for token in entry:
+                    self.writeToken(token)
+            else:
+                self.writeToken(entry)
+
+    def getvalue(self):
+        """ Return the complete binary document """
+        out = bytearray(MAGIC)
+        out.append(FORMAT_VERSION)
+        # String table: the number of strings, the length of every one of
+        # them in characters and all of them as a single UTF-8 run
+        writeVarint(out, len(self.strings))
+        for text in self.strings:
+            writeVarint(out, len(text))
+        encoded = "".join(self.strings).encode("utf-8")
+        writeVarint(out, len(encoded))
+        out += encoded
+        out += self.body
+        return bytes(out)
+
+
+def dumps(document):
+    """ Return the binary form of a document as returned by
+        mdTokenizer.returnTokenList() """
+    writer = documentWriter()
+    writer.writeDocument(document)
+    return writer.getvalue()
+
+
+def dump(document, fileHandle):
+    """ Write the binary form of a document to a binary file """
+    fileHandle.write(dumps(document))
+
+
+def readStrings(data, pos):
+    """ Decode the string table at pos. Returns the strings and the position
+        after the table """
+    stringCount, pos = readVarint(data, pos)
+    lengths = []
+    for _ in range(stringCount):
+        length = data[pos]
+        pos += 1
+        if length >= 0x80:
+            length, pos = readVarint(data, pos - 1)
+        lengths.append(length)
+    byteCount, pos = readVarint(data, pos)
+    # The whole table is decoded at once and cut up afterwards
+    text = bytes(data[pos : pos + byteCount]).decode("utf-8")
+    strings = []
+    offset = 0
+    for length in lengths:
+        strings.append(text[offset : offset + length])
+        offset += length
+    return (strings, pos + byteCount)
+
+
+class documentReader:
+    """ Rebuilds a token document from its binary form """
+
+    def __init__(self, data):
+        if bytes(data[:4]) != MAGIC:
+            raise ValueError("Not a binary token document")
+        if data[4] != FORMAT_VERSION:
+            raise ValueError("Unsupported token document version {0}".format(data[4]))
+        self.data = data
+        self.strings, self.pos = readStrings(data, 5)
+        # Index of the next string which has not been referred to yet
+        self.nextString = 0
+
+    def readString(self):
+        ref, self.pos = readVarint(self.data, self.pos)
+        if ref != 0:
+            return self.strings[ref - 1]
+        self.nextString += 1
+        return self.strings[self.nextString - 1]
+
+    def readToken(self):
+        """ Decode the token at the current position """
+        code = self.data[self.pos]
+        self.pos += 1
+        if code in emptyTokens:
+            return emptyTokens[code]
+        if code == CODE_INDENT:
+            count, self.pos = readVarint(self.data, self.pos)
+            return IndentToken(count)
+        if code == CODE_MHEADING:
+            size, self.pos = readVarint(self.data, self.pos)
+            return HeadingToken(size, self.readString())
+        if code == CODE_PLAIN or code == CODE_MARKUP_PLAIN:
+            return PlainToken(self.readString(), code == CODE_MARKUP_PLAIN)
+        if code in textTypes:
+            return TextToken(textTypes[code], self.readString())
+        if code == CODE_CHECKED or code == CODE_UNCHECKED:
+            return CheckToken(True if code == CODE_CHECKED else None, self.readString())
+        if code == CODE_CBLOCK:
+            lang = self.readString()
+            return CodeToken(lang or None, self.readString())
+        raise ValueError("Unknown token code {0} at offset {1}".format(code, self.pos - 1))
+
+    def readBlock(self):
+        """ Decode the tokens of the block at the current position """
+        data = self.data
+        strings = self.strings
+        tokenCount, pos = readVarint(data, self.pos)
+        block = []
+        for _ in range(tokenCount):
+            code = data[pos]
+            # Plain lines seen for the first time make up most of a block so
+            # they are decoded in place, as are blank lines and indents
+            if code <= CODE_MARKUP_PLAIN and data[pos + 1] == 0:
+                block.append(PlainToken(strings[self.nextString], code == CODE_MARKUP_PLAIN))
+                self.nextString += 1
+                pos += 2
+            elif code == CODE_BLANK:
+                block.append(BLANK_TOKEN)
+                pos += 1
+            elif code == CODE_INDENT and data[pos + 1] < 0x80:
+                block.append(IndentToken(data[pos + 1]))
+                pos += 2
+            else:
+                self.pos = pos
+                block.append(self.readToken())
+                pos = self.pos
+        self.pos = pos
+        return block
+
+    def readDocument(self):
+        data = self.data
+        strings = self.strings
+        entryCount, self.pos = readVarint(data, self.pos)
+        document = []
+        for _ in range(entryCount):
+            pos = self.pos
+            code = data[pos]
+            if code == CODE_BLOCK:
+                self.pos = pos + 1
+                document.append(self.readBlock())
+            elif code in textTypes and data[pos + 1] == 0:
+                # Bullets and underlined headings seen for the first time
+                document.append(TextToken(textTypes[code], strings[self.nextString]))
+                self.nextString += 1
+                self.pos = pos + 2
+            elif code == CODE_MHEADING and data[pos + 2] == 0 and data[pos + 1] < 0x80:
+                document.append(HeadingToken(data[pos + 1], strings[self.nextString]))
+                self.nextString += 1
+                self.pos = pos + 3
+            else:
+                document.append(self.readToken())
+        return document
+
+
+def loads(data):
+    """ Rebuild a document from its binary form. The tokens are compact
+        tokens, which HTMLConverter reads like dicts, and are created with
+        their recorded fields so nothing is looked up in the text again """
+    return documentReader(data).readDocument()
+
+
+def load(fileHandle):
+    """ Read a document from a binary file written by dump() """
+    return loads(fileHandle.read())
@@ -0,0 +1,224 @@
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#     Copyright (C) 2019 Yavor Konstantinov
+#
+
+from tokenType import tokType
+from collections import Counter
+import json
+import time
+
+# Methods of mdTokenizer which are timed and counted when instrumented
+TOKENIZER_RULES = (
+    "tokenizeLine",
+    "tokenizeRuleOrBullet",
+    "tokenizeNumBullet",
+    "tokenizeFencedCode",
+    "tokenizeIndentedCode",
+    "tokenizeMarkedHeading",
+    "tokenizeUnmarkedHeading",
+    "tokenizeText",
+    "tokenizeCheckItem",
+    "tokenizeBullet",
+    "isUnderlinedHeading",
+    "isHR",
+    "insertHR",
+    "isNumBullet",
+    "isCheckItemOrBullet",
+)
+
+# Methods of HTMLConverter which are timed and counted when instrumented
+CONVERTER_PASSES = ("convertInline", "convertText", "flush")
+
+
+def tokenName(token):
+    """ Name used in the report for a document entry or a token """
+    if isinstance(token, list):
+        return "BLOCK"
+    tokenType = token["type"]
+    return getattr(tokenType, "name", tokenType)
+
+
+class statsCollector:
+    """ Collects call counts and timings of the tokenizer rules and of the
+        converter passes. Nothing is measured unless a tokenizer or converter
+        is passed to instrumentTokenizer or instrumentConverter, which wrap
+        the methods of that one instance. Uninstrumented instances run
+        exactly as before. With a trace file, the instrumented instances also
+        write what they tokenize and convert to it """
+
+    def __init__(self, trace=None):
+        # Number of calls and total time spent for every rule and pass
+        self.calls = Counter()
+        self.times = Counter()
+        # Number of characters tokenized, taken from the end offset of the
+        # source once tokenize returns so that every engine is measured alike
+        self.chars = 0
+        # Number of tokens emitted for every token type
+        self.tokens = Counter()
+        # File the debug trace is written to, None when not tracing
+        self.trace = trace
+
+    def log(self, *values):
+        """ Write values to the trace file, if any """
+        if self.trace is not None:
+            print(*values, file=self.trace)
+
+    def timed(self, name, function):
+        """ Wrap function so that its calls are counted and timed under name """
+        calls = self.calls
+        times = self.times
+        clock = time.perf_counter
+
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                calls[name] += 1
+                times[name] += clock() - start
+
+        return wrapper
+
+    def instrumentTokenizer(self, tokenizer):
+        """ Time the rules of a tokenizer and count the characters it
+            tokenizes. The line based engines only go through some of the
+            rules, and the vector engine only through tokenizeLine for the
+            lines it leaves to the byte engine, so tokenizer.tokenize holds
+            the total time of every engine """
+        for name in TOKENIZER_RULES:
+            setattr(
+                tokenizer,
+                name,
+                self.timed("tokenizer." + name, getattr(tokenizer, name)),
+            )
+
+        if self.trace is not None:
+            insertHR = tokenizer.insertHR
+
+            def tracedInsertHR():
+                self.log("Insert hr")
+                return insertHR()
+
+            tokenizer.insertHR = tracedInsertHR
+
+        tokenize = self.timed("tokenizer.tokenize", tokenizer.tokenize)
+
+        def countingTokenize():
+            tokenize()
+            # The whole source has been consumed once tokenize returns. A
+            # streaming tokenizer only holds its last window
+            self.chars += getattr(tokenizer, "windowStart", 0) + tokenizer.EOF
+
+        tokenizer.tokenize = countingTokenize
+        return tokenizer
+
+    def instrumentConverter(self, converter):
+        """ Time the conversion of every token type and the converter passes """
+        for name in CONVERTER_PASSES:
+            setattr(
+                converter,
+                name,
+                self.timed("converter." + name, getattr(converter, name)),
+            )
+
+        convertToken = converter.convertToken
+        calls = self.calls
+        times = self.times
+        clock = time.perf_counter
+
+        def timedConvertToken():
+            name = "converter." + tokenName(converter.currTok)
+            self.log(converter.currTok)
+            start = clock()
+            try:
+                return convertToken()
+            finally:
+                calls[name] += 1
+                times[name] += clock() - start
+
+        converter.convertToken = timedConvertToken
+
+        if self.trace is not None:
+            convertText = converter.convertText
+
+            def tracedConvertText(text, singleLine):
+                for subTok in text:
+                    if subTok["type"] == tokType.RBOLD:
+                        self.log("got rbold")
+                return convertText(text, singleLine)
+
+            converter.convertText = tracedConvertText
+        return converter
+
+    def countTokens(self, document):
+        """ Count the tokens of a document by type """
+        self.log(document)
+        for entry in document:
+            self.tokens[tokenName(entry)] += 1
+            if isinstance(entry, list):
+                for token in entry:
+                    self.tokens[tokenName(token)] += 1
+
+    def inlineFastPath(self):
+        """ Return the number of lines converted by HTMLConverter.convertInline
+            and how many of them took the fast path, being only escaped
+            because they hold no inline markup """
+        lines = self.calls["converter.convertInline"]
+        # convertText is only reached by the lines which hold markup
+        return (lines, lines - self.calls["converter.convertText"])
+
+    def asDict(self):
+        """ Return the collected numbers as a dict which can be dumped as
+            JSON or merged into another collector """
+        lines, fastLines = self.inlineFastPath()
+        return {
+            "calls": dict(self.calls),
+            "seconds": dict(self.times),
+            "chars": self.chars,
+            "tokens": dict(self.tokens),
+            "inlineFastPath": fastLines / lines if lines != 0 else None,
+        }
+
+    def merge(self, data):
+        """ Add the numbers of another collector, as returned by asDict """
+        self.calls.update(data["calls"])
+        self.times.update(data["seconds"])
+        self.chars += data["chars"]
+        self.tokens.update(data["tokens"])
+
+    def toJson(self):
+        return json.dumps(self.asDict(), indent=2, sort_keys=True)
+
+    def report(self):
+        """ Return a human readable report of the collected numbers """
+        lines = ["{0:<40} {1:>10} {2:>12}".format("Rule or pass", "Calls", "Total ms")]
+        for name, seconds in self.times.most_common():
+            lines.append(
+                "{0:<40} {1:>10} {2:>12.3f}".format(name, self.calls[name], seconds * 1000)
+            )
+        lines.append("")
+        lines.append("Characters tokenized: {0}".format(self.chars))
+        inlineLines, fastLines = self.inlineFastPath()
+        if inlineLines != 0:
+            lines.append(
+                "Lines without inline markup: {0} of {1} ({2:.1%})".format(
+                    fastLines, inlineLines, fastLines / inlineLines
+                )
+            )
+        lines.append("Tokens emitted:")
+        for name, count in self.tokens.most_common():
+            lines.append("  {0:<38} {1:>10}".format(name, count))
+        return "\n".join(lines)
@@ -16,36 +16,196 @@
 #
 
 from tokenType import tokType
+from mdownTokens import dictTokens, compactTokens
+from mdownTree import treeBuilder
+from array import array
+from bisect import bisect_right
+from operator import methodcaller
 import re
 
+# Classification bits stored for every line of the line table
+LINE_BLANK = 1
+LINE_UNDERLINE = 2
+LINE_HR = 4
+
+# Expressions used to classify all lines of the document at once
+newlineExp = re.compile("\n")
+blankLineExp = re.compile("^ *$", re.M)
+underlineExp = re.compile("^(?:-{3,}|={3,})\n", re.M)
+hrLineExp = re.compile("^ *(?:-{3,}|_{3,}|\\*{3,})$", re.M)
+
+# Code blocks. A fence is a run of at least three backticks or tildes. The
+# line closing it holds nothing but a run of the same character which is at
+# least as long. An indented block ends at the newline of its last indented
+# line, before any blank lines leading up to a line indented less than four
+# spaces. Each of its lines loses up to four spaces of indentation
+fenceOpenExp = re.compile("(`{3,}|~{3,})([^\n]*)")
+fenceCloseExp = re.compile(" *(`{3,}|~{3,}) *(?=\n|\\Z)")
+fenceCloseBytesExp = re.compile(b" *(`{3,}|~{3,}) *\\r?(?=\n|\\Z)")
+codeEndExp = re.compile("\n(?: *\n)*(?: *\\Z|(?! {4}| *\n))")
+dedentExp = re.compile("^ {1,4}", re.M)
+
+
+def findFenceClose(text, fence, start):
+    """ Return the start and end of the first line at or after start which
+        closes a code block opened by fence, or None. Candidates are found
+        with find and the lines holding them checked one at a time. Works on
+        str as well as on bytes-like buffers """
+    closeExp = fenceCloseExp if isinstance(text, str) else fenceCloseBytesExp
+    newline = "\n" if isinstance(text, str) else b"\n"
+    marker = fence[:3]
+    pos = start
+    while True:
+        hit = text.find(marker, pos)
+        if hit == -1:
+            return None
+        lineStart = text.rfind(newline, 0, hit) + 1
+        closer = closeExp.match(text, lineStart)
+        if closer is not None:
+            run = closer.group(1)
+            if run[0] == fence[0] and len(run) >= len(fence):
+                return (lineStart, closer.end())
+        # Only the first run of a line can close the block
+        pos = text.find(newline, hit)
+        if pos == -1:
+            return None
+
+
+class ruleTable:
+    """ Rules of a tokenizer engine by the first character of a line, once
+        its indentation has been skipped. A rule is called with the tokenizer
+        positioned on that character and returns False if the line is not
+        what it handles after all, which leaves it to the next rules and in
+        the end to plain text. Leading rules are tried before the check for
+        an underlined heading, like # is, the others after it. Keys are
+        strings of characters which all share the rule """
+
+    def __init__(self, leading=None, rules=None):
+        self.leading = {}
+        self.rules = {}
+        for chars, rule in (leading or {}).items():
+            self.leading.update(dict.fromkeys(chars, rule))
+        for chars, rule in (rules or {}).items():
+            self.rules.update(dict.fromkeys(chars, rule))
+        # Characters whose rule was registered after the table was built
+        self.custom = set()
+
+    def register(self, chars, rule, beforeUnderline=False):
+        """ Make rule handle the lines starting with any of chars, replacing
+            the rule they had """
+        table, other = (self.leading, self.rules) if beforeUnderline else (self.rules, self.leading)
+        for char in chars:
+            table[char] = rule
+            other.pop(char, None)
+            self.custom.add(char)
+
 
 class mdTokenizer:
     """Class which tokenizes a markdown file by iterating through it line
     by line"""
 
-    def __init__(self, source):
+    # Number of newlines which have to be buffered ahead of the current
+    # position when streaming. Covers the rest of the current line and the
+    # lines inspected by isUnderlinedHeading
+    lookaheadLines = 4
+
+    # Rules of the char engine, see tokenizeLine. Built in rules call the
+    # method of the tokenizer so that its instrumented version is used
+    charRules = ruleTable(
+        leading={
+            "#": methodcaller("tokenizeMarkedHeading"),
+            "`~": methodcaller("tokenizeFencedCode"),
+        },
+        rules={
+            "-+*_": methodcaller("tokenizeRuleOrBullet"),
+            "0123456789": methodcaller("tokenizeNumBullet"),
+        },
+    )
+
+    # Rules of the line engine, see tokenizeWholeLine. mdMappedTokenizer
+    # shares them through its own versions of the methods
+    wholeLineRules = ruleTable(
+        leading={
+            "#": methodcaller("wholeMarkedHeading"),
+            "`~": methodcaller("tokenizeFencedCode"),
+        },
+        rules={
+            "-+*_": methodcaller("wholeRuleOrBullet"),
+            "0123456789": methodcaller("wholeNumBullet"),
+            "\n": methodcaller("wholeBlankLine"),
+        },
+    )
+
+    @classmethod
+    def registerRule(cls, chars, rule, beforeUnderline=False):
+        """ Make rule handle the lines starting with any of chars in every
+            engine. The rule is called with the tokenizer on the first
+            character of the line. Rules written with eatLineFrom, closeBlock
+            and tokenFactory work the same in every engine """
+        cls.charRules.register(chars, rule, beforeUnderline)
+        cls.wholeLineRules.register(chars, rule, beforeUnderline)
+
+    def __init__(self, source, streaming=False, engine="char", compact=False):
 
         # Handle to the source file
         self.src = source
 
-        # The contents of the source file
-        self.text = self.src.read()
+        # Builds the tokens. Compact tokens use __slots__ classes and shared
+        # instances for tokens without a payload instead of dicts
+        self.tokenFactory = compactTokens if compact else dictTokens
 
-        # Index of the last character in the source file
-        self.EOF = len(self.text)
+        # Rule applied to every line. The "char" engine steps through a line
+        # one character at a time while the "line" engine classifies the
+        # whole line at once. Both produce the same document structure
+        if engine == "line":
+            self.tokenizeLine = self.tokenizeWholeLine
+        elif engine != "char":
+            raise ValueError("Unknown tokenizer engine: {0}".format(engine))
+        self.engine = engine
+
+        # When streaming, only a small window of the source is kept in memory
+        # instead of the whole file
+        self.streaming = streaming
+
+        # Indicates if the whole source has been read into self.text
+        self.exhausted = not streaming
 
         # Current index along the source
         self.currIndex = 0
 
+        # Index of the line holding the current position in the line table
+        self.currLine = 0
+
+        # Offset of self.text within the source. Only moves when streaming
+        self.windowStart = 0
+
+        # The contents of the source file. When streaming, this only holds
+        # the lines around the current position
+        if streaming:
+            self.text = ""
+            self.fillWindow()
+        else:
+            self.text = self.src.read()
+
+        # Index of the last character in the source file
+        self.EOF = len(self.text)
+
+        # Start offset and classification of every line in self.text
+        self.indexLines()
+
         # A list holding the structure of the document
         self.document = []
 
+        # Nested container tree of the document, see tokenizeTree
+        self.tree = None
+
         # The current block. Used for plaintext while headers and all others
         # reside in their own block
         self.currBlock = []
 
-        # The current character
-        self.currChar = self.text[self.currIndex]
+        # The current character. An empty source is treated as a single
+        # empty line
+        self.currChar = self.text[self.currIndex] if self.EOF != 0 else "\n"
 
         # Indicates if the previous line was a blank.
         # used to recognize horizontal ruling vs plain - or =
@@ -85,7 +245,7 @@ class mdTokenizer:
     def closeBlock(self):
         """ Adds the current block the the document structure. Used when another blocktype
             such as a bullet follows plain text."""
-        if len(self.currBlock) is not 0:
+        if self.currBlock:
             # Add the block to the document structure
             self.document.append(self.currBlock)
             # Create a new block
@@ -103,7 +263,8 @@ class mdTokenizer:
 
         # If the number of spaces is more than 0 then we have indented text
         if spaceNumberCount != 0:
-            self.currBlock.append({"type": tokType.INDENT, "count": spaceNumberCount})
+            self.currBlock.append(self.tokenFactory.indent(spaceNumberCount))
+        return spaceNumberCount
 
     def checkEmptyLine(self):
         """Check if the current line is an empty line"""
@@ -113,7 +274,7 @@ class mdTokenizer:
 
     def addEOL(self):
         """Adds an end of line token to the token list"""
-        self.currBlock.append({"type": tokType.EOL})
+        self.currBlock.append(self.tokenFactory.eol())
 
     def isRFlank(self):
         prevChar = self.peekPrev()
@@ -152,9 +313,7 @@ class mdTokenizer:
         self.closeBlock()
 
         # Append to token list
-        self.document.append(
-            {"type": tokType.MHEADING, "size": headingSize, "content": headingText}
-        )
+        self.document.append(self.tokenFactory.markedHeading(headingSize, headingText))
 
     def tokenizeUnmarkedHeading(self):
         """ Tokenize headings which are underlined """
@@ -165,20 +324,20 @@ class mdTokenizer:
 
         # Close off the block
         self.closeBlock()
-        self.document.append({"type": tokType.UHEADING, "content": textContent})
+        self.document.append(self.tokenFactory.underlinedHeading(textContent))
 
     def tokenizeText(self):
         """Tokenizes a line of marked up text"""
         # Case of an empty line
         if self.currChar == "\n":
             self.blankFlag = True
-            self.currBlock.append({"type": tokType.BLANK})
+            self.currBlock.append(self.tokenFactory.blank())
 
         # Case of any other text
         else:
             self.blankFlag = False
             textContent = self.eatChars()
-            self.currBlock.append({"type": tokType.PLAIN, "content": textContent})
+            self.currBlock.append(self.tokenFactory.plain(textContent))
 
 
     def tokenizeCheckItem(self):
@@ -204,9 +363,7 @@ class mdTokenizer:
 
         # Close off the block
         self.closeBlock()
-        self.document.append(
-            {"type": tokType.CHECKMARK, "status": status, "content": checkItemContent}
-        )
+        self.document.append(self.tokenFactory.checkItem(status, checkItemContent))
 
 
     def isCheckItemOrBullet(self):
@@ -247,7 +404,7 @@ class mdTokenizer:
             text = self.eatChars()
 
             self.closeBlock()
-            self.document.append({"type": tokType.NUMBULLET, "content": text})
+            self.document.append(self.tokenFactory.numBullet(text))
 
         # Case of a regular bullet
         else:
@@ -260,125 +417,435 @@ class mdTokenizer:
             text = self.eatChars()
 
             self.closeBlock()
-            self.document.append({"type": tokType.BULLET, "content": text})
+            self.document.append(self.tokenFactory.bullet(text))
 
     def isHR(self, char):
-        """ Count the occurence of a certain type of character on a line of 
-            text. Used to detect horizontal line rules."""
-        count = 1
-        pos = 1
-        while self.peekNext(pos) == char:
-            count += 1
-            pos += 1
-        if self.peekNext(pos) == "\n" and count >= 3 and self.blankFlag == True:
-            return True
-        else:
+        """ Check if the current line is a horizontal rule made of the
+            provided character. Used to detect horizontal line rules."""
+        if self.blankFlag != True or self.currChar != char:
             return False
+        return self.lineKinds[self.lineOf(self.currIndex)] & LINE_HR != 0
 
     def insertHR(self):
         """ Insert a horizontal rule token into the token stream """
-        print("Insert hr")
         while self.currChar != "\n":
             self.getNext()
 
         self.getNext()
 
         self.closeBlock()
-        self.document.append({"type": tokType.HR})
+        self.document.append(self.tokenFactory.hr())
+
+    def indexLines(self):
+        """ Build the line table for self.text. It holds the start offset of
+            every line along with bits classifying it as blank, as a heading
+            underline or as a horizontal rule candidate. Built once so that
+            lookahead never has to rescan the text """
+        self.lineStarts = array("q", [0])
+        self.lineStarts.extend(match.end() for match in newlineExp.finditer(self.text))
+        self.lineKinds = array("B", bytes(len(self.lineStarts)))
+        self.currLine = 0
+
+        for lineExp, kind in (
+            (blankLineExp, LINE_BLANK),
+            (underlineExp, LINE_UNDERLINE),
+            (hrLineExp, LINE_HR),
+        ):
+            for match in lineExp.finditer(self.text):
+                self.lineKinds[bisect_right(self.lineStarts, match.start()) - 1] |= kind
+
+    def lineOf(self, index):
+        """ Return the line table index of the line holding the given position.
+            Positions only move forward so this is amortized constant time """
+        lineStarts = self.lineStarts
+        lastLine = len(lineStarts) - 1
+        while self.currLine < lastLine and lineStarts[self.currLine + 1] <= index:
+            self.currLine += 1
+        return self.currLine
 
     def getNextLine(self):
         """ Returns the start and end positions of the next line """
-        # starting position of next line
-        startPos = 1
-        # End position of next line. Represents \n
-        endPos = 0
-        # Find the beginning of next string
-        while self.peekNext(startPos) != "\n":
-            startPos += 1
+        nextLine = self.lineOf(self.currIndex) + 1
+        if nextLine >= len(self.lineStarts):
+            return (self.EOF, self.EOF)
+        elif nextLine + 1 >= len(self.lineStarts):
+            return (self.lineStarts[nextLine], self.EOF)
+        return (self.lineStarts[nextLine], self.lineStarts[nextLine + 1])
 
-        # At this point, startPos points to the index of \n
-        startPos += 1
+    def isUnderlinedHeading(self):
+        """ Check if the next line is an underlined heading """
+        currLine = self.lineOf(self.currIndex)
+        # A blank line can not be turned into a heading
+        if self.lineKinds[currLine] & LINE_BLANK:
+            return False
+        return (
+            currLine + 1 < len(self.lineKinds)
+            and self.lineKinds[currLine + 1] & LINE_UNDERLINE != 0
+        )
 
-        endPos = startPos
-        startPos += self.currIndex
+    def fillWindow(self):
+        """ Read lines from the source until enough lookahead is buffered
+            after the current position. Only used when streaming """
+        while (
+            not self.exhausted
+            and self.text.count("\n", self.currIndex) < self.lookaheadLines
+        ):
+            line = self.src.readline()
+            if line == "":
+                self.exhausted = True
+            else:
+                self.text += line
 
-        # Find the end of next string
-        while self.peekNext(endPos) != "\n":
-            endPos += 1
+        self.EOF = len(self.text)
 
-        endPos += self.currIndex
-        # Skip over the \n
-        endPos += 1
-        return (startPos, endPos)
+    def slideWindow(self):
+        """ Drop the lines which have already been consumed from the window
+            and read in more lookahead. Only used when streaming """
+        # Keep the line holding the current position so peekPrev still works
+        cut = self.text.rfind("\n", 0, self.currIndex) + 1
+        if cut != 0:
+            self.text = self.text[cut:]
+            self.currIndex -= cut
+            self.windowStart += cut
+        self.fillWindow()
+        self.indexLines()
+
+    def tokenizeLine(self):
+        """ Apply the tokenizing rule for the line starting at the current
+            position. The rule is looked up in charRules by the first
+            character of the line. Any finished block is added to the document """
+        indent = self.skipWhiteSpaceNewLine()
+        # Indented code block. Only starts right after a blank line, so the
+        # current block holds the blank line besides the indent token, which
+        # is taken back since the indentation belongs to the code
+        if indent >= 4 and self.currChar != "\n" and self.blankFlag and len(self.currBlock) > 1:
+            self.currBlock.pop()
+            self.tokenizeIndentedCode(self.currIndex - indent)
+            return
+        char = self.currChar
+        rule = self.charRules.leading.get(char)
+        if rule is not None and rule(self) is not False:
+            return
+        # Underlined heading
+        if self.isUnderlinedHeading():
+            self.tokenizeUnmarkedHeading()
+            return
+        rule = self.charRules.rules.get(char)
+        if rule is None and char.isdigit():
+            # Digits outside of ASCII
+            rule = self.charRules.rules.get("0")
+        # Case of plain text
+        if rule is None or rule(self) is False:
+            self.tokenizeText()
+
+    def tokenizeRuleOrBullet(self):
+        """ Char engine rule for the lines starting with -, +, * or _ which
+            are either a horizontal rule or a bullet """
+        char = self.currChar
+        if self.isHR(char) == True:
+            self.insertHR()
+            if char == "-":
+                self.blankFlag = False
+        elif char != "_" and self.peekNext() == " ":
+            # Either a bullet or checklist item
+            if char == "-" and self.isCheckItemOrBullet() == tokType.CHECKMARK:
+                self.tokenizeCheckItem()
+            else:
+                self.tokenizeBullet()
+        else:
+            return False
 
-    def isUnderlinedHeading(self):
-        """ Check if the next line is an underlined heading """
-        start, end = self.getNextLine()
-        string = self.text[start:end]
-        searchExp = re.compile("^(-{3,}|={3,})\n")
-        output = searchExp.fullmatch(string)
+    def tokenizeNumBullet(self):
+        """ Char engine rule for the lines starting with a digit """
+        if self.isNumBullet() != True:
+            return False
+        self.tokenizeBullet()
+
+    def eatLineFrom(self, index):
+        """ Consume the text from index up to the end of its line, skipping
+            any whitespace in front of it. Used by the line engine in place of
+            skipWhiteSpace and eatChars """
+        self.currChar = "\n"
+        if index >= self.EOF:
+            self.currIndex = index
+            return ""
+
+        end = self.text.find("\n", index)
+        if end == -1:
+            end = self.EOF
+        self.currIndex = end
+        return self.text[index:end].lstrip(" ")
+
+    def tokenizeWholeLine(self):
+        """ Line engine counterpart of tokenizeLine. The rule is picked from
+            wholeLineRules and looks at the whole line with str methods and
+            precompiled expressions instead of stepping through it with getNext """
+        text = self.text
+        start = self.currIndex
+        end = text.find("\n", start)
+        if end == -1:
+            end = self.EOF
+
+        # Indentation in front of the line
+        line = text[start:end]
+        body = line.lstrip(" ")
+        indent = len(line) - len(body)
+        # Indented code block, see tokenizeLine
+        if indent >= 4 and body and self.blankFlag and len(self.currBlock) != 0:
+            self.tokenizeIndentedCode(start)
+            return
+        if indent != 0:
+            self.currBlock.append(self.tokenFactory.indent(indent))
+        pos = start + indent
+        self.currIndex = pos
+        self.currChar = body[0] if body else "\n"
+        firstChar = self.currChar
+        # The line without its indentation and its bounds, for the rules
+        self.currBody = body
+        self.currBounds = (start, end, end)
+
+        rule = self.wholeLineRules.leading.get(firstChar)
+        if rule is not None and rule(self) is not False:
+            return
+        # Underlined heading
+        if self.isUnderlinedHeading():
+            # The underline itself is skipped
+            underlineEnd = text.find("\n", end + 1)
+            self.currIndex = self.EOF if underlineEnd == -1 else underlineEnd
+            self.currChar = "\n"
+            self.closeBlock()
+            self.document.append(self.tokenFactory.underlinedHeading(body))
+            return
+        rule = self.wholeLineRules.rules.get(firstChar)
+        if rule is None and firstChar.isdigit():
+            # Digits outside of ASCII
+            rule = self.wholeLineRules.rules.get("0")
+        # Case of plain text
+        if rule is None or rule(self) is False:
+            self.blankFlag = False
+            self.currIndex = end
+            self.currChar = "\n"
+            self.currBlock.append(self.tokenFactory.plain(body))
 
-        return output
+    def wholeMarkedHeading(self):
+        """ Line engine rule for a standard heading starting with # """
+        body = self.currBody
+        hashCount = len(body) - len(body.lstrip("#"))
+        headingText = self.eatLineFrom(self.currIndex + hashCount)
+        self.closeBlock()
+        self.document.append(self.tokenFactory.markedHeading(min(hashCount, 6), headingText))
+
+    def wholeRuleOrBullet(self):
+        """ Line engine rule for the lines starting with -, +, * or _ which
+            are either a horizontal rule, a bullet or a checklist item """
+        firstChar = self.currChar
+        if self.isHR(firstChar) == True:
+            self.currIndex = self.currBounds[1]
+            self.currChar = "\n"
+            self.insertHR()
+            if firstChar == "-":
+                self.blankFlag = False
+            return
+        body = self.currBody
+        if firstChar == "_" or body[1:2] != " ":
+            return False
+
+        pos = self.currIndex
+        if firstChar == "-" and body[2:3] == "[":
+            status = True if self.text[pos + 3 : pos + 4] == "x" else None
+            # Skip over "- [", the status and the closing ]
+            checkItemContent = self.eatLineFrom(pos + 5)
+            self.closeBlock()
+            self.document.append(self.tokenFactory.checkItem(status, checkItemContent))
+        else:
+            bulletText = self.eatLineFrom(pos + 1)
+            self.closeBlock()
+            self.document.append(self.tokenFactory.bullet(bulletText))
+
+    def wholeNumBullet(self):
+        """ Line engine rule for the lines starting with a digit """
+        if self.isNumBullet() != True:
+            return False
+        body = self.currBody
+        digitCount = 1
+        while body[digitCount : digitCount + 1].isdigit():
+            digitCount += 1
+        bulletText = self.eatLineFrom(self.currIndex + digitCount + 1)
+        self.closeBlock()
+        self.document.append(self.tokenFactory.numBullet(bulletText))
+
+    def wholeBlankLine(self):
+        """ Line engine rule for an empty line """
+        self.blankFlag = True
+        self.currBlock.append(self.tokenFactory.blank())
+
+    def readMore(self):
+        """ Read about as much of the source as the window already holds.
+            Used by the rules for code blocks, which can run past the
+            lookahead. Returns False once the whole source has been read """
+        if self.exhausted:
+            return False
+        lines = []
+        readChars = 0
+        # Doubling the window keeps the copies linear in the size of a block
+        while readChars < max(len(self.text), 1 << 12):
+            line = self.src.readline()
+            if line == "":
+                self.exhausted = True
+                break
+            lines.append(line)
+            readChars += len(line)
+        self.text += "".join(lines)
+        self.EOF = len(self.text)
+        return True
+
+    def searchAhead(self, expression, start):
+        """ Search the text from start with a compiled expression, reading in
+            more of the source while a match could change with what follows """
+        while True:
+            match = expression.search(self.text, start)
+            if (match is not None and match.end() < self.EOF) or not self.readMore():
+                return match
+
+    def fenceEnd(self, fence, start):
+        """ findFenceClose over the text and whatever the source still holds """
+        while True:
+            closer = findFenceClose(self.text, fence, start)
+            if closer is not None:
+                return closer
+            # The window always ends on a complete line
+            start = self.EOF
+            if not self.readMore():
+                return None
+
+    def tokenizeFencedCode(self):
+        """ Rule for the lines starting with ``` or ~~~, which open a fenced
+            code block running up to the line closing the fence, or to the
+            end of the text if there is none. The body is taken as a single
+            slice of the text without looking for any markup in it """
+        text = self.text
+        opener = fenceOpenExp.match(text, self.currIndex)
+        if opener is None:
+            return False
+        fence, info = opener.groups()
+        # Backticks followed by more of them on the line are inline code
+        if fence[0] == "`" and "`" in info:
+            return False
+
+        bodyStart = opener.end() + 1
+        closer = self.fenceEnd(fence, bodyStart)
+        text = self.text
+        if closer is None:
+            end = bodyEnd = self.EOF
+            if bodyEnd > bodyStart and text[bodyEnd - 1] == "\n":
+                bodyEnd -= 1
+        else:
+            closeStart, end = closer
+            bodyEnd = max(bodyStart, closeStart - 1)
+        self.currIndex = end
+        self.currChar = "\n"
+        info = info.split()
+        self.closeBlock()
+        self.document.append(
+            self.tokenFactory.codeBlock(info[0] if info else None, text[bodyStart:bodyEnd])
+        )
+        self.blankFlag = True
+
+    def tokenizeIndentedCode(self, start):
+        """ Rule for a line indented by four spaces or more after a blank line,
+            which starts an indented code block at start. The block holds the
+            lines which follow it up to the last one indented as much """
+        match = self.searchAhead(codeEndExp, start)
+        end = self.EOF if match is None else match.start()
+        self.currIndex = end
+        self.currChar = "\n"
+        self.closeBlock()
+        self.document.append(
+            self.tokenFactory.codeBlock(None, dedentExp.sub("", self.text[start:end]))
+        )
+        self.blankFlag = True
 
     def tokenize(self):
         """ General driver of the entire tokenizer. 
             It applies the tokenizing rules based on the context detected
             by the first character of the stream which has not yet been consumed """
+        if self.streaming:
+            self.document = list(self.iterTokens())
+            return
+
         while self.currIndex + 1 < self.EOF:
             if self.currChar == "\n":
                 self.getNext()
-            self.skipWhiteSpaceNewLine()
-            # Standard heading starting with #
-            if self.currChar == "#":
-                self.tokenizeMarkedHeading()
-            # Underlined heading
-            elif self.isUnderlinedHeading():
-                self.tokenizeUnmarkedHeading()
-            elif self.currChar == "_":
-                if self.isHR("_") == True:
-                    self.insertHR()
-            # Either a bullet or checklist item
-            elif self.currChar == '-' and self.isHR('-') == True:
-                self.insertHR()
-                self.blankFlag = False
-            elif self.currChar == '-' and self.peekNext(1) == ' ':
-                # Check the type of the current line
-                # If it is not a checkmark or a bullet, it is treated as
-                # plaintext
-                tokenType = self.isCheckItemOrBullet()
-                if tokenType == tokType.CHECKMARK:
-                    self.tokenizeCheckItem()
-                elif tokenType == tokType.BULLET:
-                    self.tokenizeBullet()
-            # Bullet starting with a +
-            elif self.currChar == "+" and self.peekNext() == " ":
-                self.tokenizeBullet()
-            # Bullet starting with a *
-            elif self.currChar == "*":
-                if self.isHR("*") == True:
-                    self.insertHR()
-                elif self.peekNext() == " ":
-                    self.tokenizeBullet()
-            # Numbered Bullets
-            elif str.isdigit(self.currChar) and self.isNumBullet() == True:
-                self.tokenizeBullet()
-            # Case of plain text
-            else:
-                self.tokenizeText()
+            self.tokenizeLine()
+
+        self.closeBlock()
+        # Add an EOF token to signify end of file
+        self.document.append(self.tokenFactory.eof())
+
+    def tokenizeParallel(self, jobCount=None):
+        """ Version of tokenize which cuts the text into chunks at safe points
+            and tokenizes them in jobCount worker processes, see
+            mdownParallel. Gives the same document as tokenize(). A source
+            which is not held in memory as a whole is tokenized serially """
+        if self.streaming or not isinstance(self.text, str) or self.currIndex != 0:
+            self.tokenize()
+            return
+        # Imported here since mdownParallel imports this module
+        from mdownParallel import tokenizeParallel
+
+        self.document = tokenizeParallel(
+            self.text, jobCount, self.engine, self.tokenFactory is compactTokens
+        )
+        self.currIndex = self.EOF
+
+    def iterTokens(self, everyLine=False):
+        """ Generator version of tokenize. Every entry of the document structure
+            is yielded as soon as it is finished instead of once the whole
+            file has been processed. Combined with streaming=True, only a few
+            lines of the source are held in memory at any time. With everyLine,
+            None is also yielded after every line so that the caller can look
+            at the block which is still being filled """
+        while True:
+            if self.streaming:
+                self.slideWindow()
+            if self.currIndex + 1 >= self.EOF:
+                break
+            if self.currChar == "\n":
+                self.getNext()
+            self.tokenizeLine()
+
+            # Hand over everything which was finished by the current line
+            if len(self.document) != 0:
+                yield from self.document
+                self.document = []
+            if everyLine:
+                yield None
 
-    
         self.closeBlock()
         # Add an EOF token to signify end of file
-        self.document.append({"type": "EOF"})
+        self.document.append(self.tokenFactory.eof())
+        yield from self.document
+        self.document = []
+
+    def tokenizeTree(self):
+        """ Version of tokenize which also builds the nested tree of lists and
+            block quotes, see mdownTree, in the same pass. Every entry is fed
+            to the tree as soon as it is finished. The flat structure is
+            still left in self.document. Returns the tree """
+        builder = treeBuilder()
+        document = []
+        for entry in self.iterTokens():
+            document.append(entry)
+            builder.feed(entry)
+        self.document = document
+        self.tree = builder.finish()
+        return self.tree
 
     def returnTokenList(self):
         """ Return the list of tokens which outlines the entire structure of the document"""
         return self.document
 
+    def returnTree(self):
+        """ Return the nested container tree built by tokenizeTree """
+        return self.tree
 
-# temp test
-if __name__ == "__main__":
- src = open("test.md", "r")
- tok = mdTokenizer(src)
- tok.tokenize()
- print(tok.returnTokenList())
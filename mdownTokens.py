@@ -0,0 +1,388 @@
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#     Copyright (C) 2019 Yavor Konstantinov
+#
+
+from tokenType import tokType
+import re
+
+# Characters which can change how a line of text is converted: emphasis and
+# strike through delimiters, inline code and escapes. A line without any of
+# them is converted to HTML by escaping it. Brackets and parentheses only
+# split runs of plain text so they are left out
+inlineSpecialExp = re.compile(r"[*_`~\\]")
+inlineSpecialBytesExp = re.compile(rb"[*_`~\\]")
+
+
+class Token:
+    """ Compact token which only stores the fields it needs in __slots__.
+        Fields can still be read with token["field"] so anything written
+        against the dict tokens keeps working """
+
+    __slots__ = ("type",)
+
+    # Fields only kept to speed up the converter, which are left out of the
+    # dict representation so that it stays the one of the dict tokens
+    internalFields = ()
+
+    def __init__(self, tokenType):
+        self.type = tokenType
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __eq__(self, other):
+        if isinstance(other, (Token, dict)):
+            return self.asDict() == dict(other.items())
+        return NotImplemented
+
+    def __repr__(self):
+        return "Token({0})".format(self.asDict())
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def keys(self):
+        """ Return the names of the fields held by the token """
+        fields = []
+        for cls in reversed(type(self).__mro__):
+            fields.extend(getattr(cls, "__slots__", ()))
+        return [field for field in fields if field not in self.internalFields]
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self.keys()]
+
+    def asDict(self):
+        """ Return the dict representation of the token """
+        return dict(self.items())
+
+
+class TextToken(Token):
+    """ Token holding a line of text. Used for plain text, underlined
+        headings and bullets """
+
+    __slots__ = ("content",)
+
+    def __init__(self, tokenType, content):
+        self.type = tokenType
+        self.content = content
+
+
+class PlainToken(TextToken):
+    """ Token for a line of plain text. markup tells if the line holds any
+        character of inlineSpecialExp. It is looked up unless already known
+        and is not part of the dict representation """
+
+    __slots__ = ("markup",)
+    internalFields = ("markup",)
+
+    def __init__(self, content, markup=None):
+        self.type = tokType.PLAIN
+        self.content = content
+        if markup is None:
+            markup = inlineSpecialExp.search(content) is not None
+        self.markup = markup
+
+
+class HeadingToken(Token):
+    """ Token for a heading starting with # """
+
+    __slots__ = ("size", "content")
+
+    def __init__(self, size, content):
+        self.type = tokType.MHEADING
+        self.size = size
+        self.content = content
+
+
+class CheckToken(Token):
+    """ Token for a checklist item """
+
+    __slots__ = ("status", "content")
+
+    def __init__(self, status, content):
+        self.type = tokType.CHECKMARK
+        self.status = status
+        self.content = content
+
+
+class CodeToken(Token):
+    """ Token for a fenced or indented code block. lang is the first word
+        of the info string of a fence, None if there is none """
+
+    __slots__ = ("lang", "content")
+
+    def __init__(self, lang, content):
+        self.type = tokType.CBLOCK
+        self.lang = lang
+        self.content = content
+
+
+class IndentToken(Token):
+    """ Token for the indentation in front of a line """
+
+    __slots__ = ("count",)
+
+    def __init__(self, count):
+        self.type = tokType.INDENT
+        self.count = count
+
+
+class SpanToken(Token):
+    """ Token whose content is left in the source buffer as a pair of byte
+        offsets. The content is only decoded when it is read """
+
+    __slots__ = ("source", "start", "end")
+
+    @property
+    def content(self):
+        return self.source.decodeSpan(self.start, self.end)
+
+    def keys(self):
+        fields = [key for key in Token.keys(self) if key not in SpanToken.__slots__]
+        fields.append("content")
+        return fields
+
+
+class SpanTextToken(SpanToken):
+    """ Span counterpart of TextToken """
+
+    __slots__ = ()
+
+    def __init__(self, tokenType, source, start, end):
+        self.type = tokenType
+        self.source = source
+        self.start = start
+        self.end = end
+
+
+class SpanPlainToken(SpanToken):
+    """ Span counterpart of PlainToken """
+
+    __slots__ = ("markup",)
+    internalFields = ("markup",)
+
+    def __init__(self, source, start, end, markup):
+        self.type = tokType.PLAIN
+        self.source = source
+        self.start = start
+        self.end = end
+        self.markup = markup
+
+
+class SpanHeadingToken(SpanToken):
+    """ Span counterpart of HeadingToken """
+
+    __slots__ = ("size",)
+
+    def __init__(self, size, source, start, end):
+        self.type = tokType.MHEADING
+        self.size = size
+        self.source = source
+        self.start = start
+        self.end = end
+
+
+class SpanCheckToken(SpanToken):
+    """ Span counterpart of CheckToken """
+
+    __slots__ = ("status",)
+
+    def __init__(self, status, source, start, end):
+        self.type = tokType.CHECKMARK
+        self.status = status
+        self.source = source
+        self.start = start
+        self.end = end
+
+
+class SpanCodeToken(SpanToken):
+    """ Span counterpart of CodeToken. The span covers the lines of the
+        block, which are only joined up and dedented when read """
+
+    __slots__ = ("lang", "indented")
+
+    def __init__(self, lang, source, start, end, indented):
+        self.type = tokType.CBLOCK
+        self.lang = lang
+        self.source = source
+        self.start = start
+        self.end = end
+        self.indented = indented
+
+    @property
+    def content(self):
+        return self.source.decodeCode(self.start, self.end, self.indented)
+
+    def keys(self):
+        return [key for key in SpanToken.keys(self) if key != "indented"]
+
+
+# Tokens without a payload are shared instead of being created every time
+EOL_TOKEN = Token(tokType.EOL)
+BLANK_TOKEN = Token(tokType.BLANK)
+HR_TOKEN = Token(tokType.HR)
+EOF_TOKEN = Token("EOF")
+
+
+class dictTokens:
+    """ Token factory used by mdTokenizer which builds every token as a
+        plain dict. This is the default representation """
+
+    @staticmethod
+    def indent(count):
+        return {"type": tokType.INDENT, "count": count}
+
+    @staticmethod
+    def eol():
+        return {"type": tokType.EOL}
+
+    @staticmethod
+    def blank():
+        return {"type": tokType.BLANK}
+
+    @staticmethod
+    def plain(content):
+        return {"type": tokType.PLAIN, "content": content}
+
+    @staticmethod
+    def markedHeading(size, content):
+        return {"type": tokType.MHEADING, "size": size, "content": content}
+
+    @staticmethod
+    def underlinedHeading(content):
+        return {"type": tokType.UHEADING, "content": content}
+
+    @staticmethod
+    def bullet(content):
+        return {"type": tokType.BULLET, "content": content}
+
+    @staticmethod
+    def numBullet(content):
+        return {"type": tokType.NUMBULLET, "content": content}
+
+    @staticmethod
+    def checkItem(status, content):
+        return {"type": tokType.CHECKMARK, "status": status, "content": content}
+
+    @staticmethod
+    def codeBlock(lang, content):
+        return {"type": tokType.CBLOCK, "lang": lang, "content": content}
+
+    @staticmethod
+    def hr():
+        return {"type": tokType.HR}
+
+    @staticmethod
+    def eof():
+        return {"type": "EOF"}
+
+
+class compactTokens:
+    """ Token factory used by mdTokenizer which builds __slots__ tokens and
+        shares the tokens which carry no payload """
+
+    indent = IndentToken
+
+    @staticmethod
+    def eol():
+        return EOL_TOKEN
+
+    @staticmethod
+    def blank():
+        return BLANK_TOKEN
+
+    plain = PlainToken
+
+    markedHeading = HeadingToken
+
+    @staticmethod
+    def underlinedHeading(content):
+        return TextToken(tokType.UHEADING, content)
+
+    @staticmethod
+    def bullet(content):
+        return TextToken(tokType.BULLET, content)
+
+    @staticmethod
+    def numBullet(content):
+        return TextToken(tokType.NUMBULLET, content)
+
+    checkItem = CheckToken
+
+    codeBlock = CodeToken
+
+    @staticmethod
+    def hr():
+        return HR_TOKEN
+
+    @staticmethod
+    def eof():
+        return EOF_TOKEN
+
+
+class spanTokens(compactTokens):
+    """ Token factory used by mdMappedTokenizer which keeps the content of
+        tokens in the source buffer. Content is passed as a (start, end) pair
+        of offsets and decoded through source.decodeSpan when it is read """
+
+    def __init__(self, source):
+        self.source = source
+
+    def plain(self, span):
+        start, end = span
+        markup = inlineSpecialBytesExp.search(self.source.text, start, end) is not None
+        return SpanPlainToken(self.source, start, end, markup)
+
+    def markedHeading(self, size, span):
+        return SpanHeadingToken(size, self.source, *span)
+
+    def underlinedHeading(self, span):
+        return SpanTextToken(tokType.UHEADING, self.source, *span)
+
+    def bullet(self, span):
+        return SpanTextToken(tokType.BULLET, self.source, *span)
+
+    def numBullet(self, span):
+        return SpanTextToken(tokType.NUMBULLET, self.source, *span)
+
+    def checkItem(self, status, span):
+        return SpanCheckToken(status, self.source, *span)
+
+    def codeBlock(self, lang, span):
+        # The span of a code block also tells if it has to be dedented
+        return SpanCodeToken(lang, self.source, *span)
+
+
+def documentAsDicts(document):
+    """ Return a copy of a document structure where every compact token has
+        been replaced by its dict representation """
+    converted = []
+    for entry in document:
+        if isinstance(entry, list):
+            converted.append(
+                [tok.asDict() if isinstance(tok, Token) else tok for tok in entry]
+            )
+        elif isinstance(entry, Token):
+            converted.append(entry.asDict())
+        else:
+            converted.append(entry)
+    return converted
@@ -0,0 +1,225 @@
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#     Copyright (C) 2019 Yavor Konstantinov
+#
+
+
+from tokenType import tokType
+from mdownTokens import dictTokens, compactTokens
+import re
+
+# Quote markers at the start of a plain text line. "> > text" and ">> text"
+# are both quotes two levels deep
+quoteMarkerExp = re.compile(r"(?:> ?)+")
+
+# Document tokens which start a list item
+ITEM_TYPES = {tokType.BULLET, tokType.NUMBULLET, tokType.CHECKMARK}
+
+# Number of columns past the indentation of a list item which content has to
+# be indented by to be nested under the item
+NESTING_INDENT = 2
+
+
+class containerNode:
+    """ Node of the container tree: a list, a list item or a block quote.
+        children holds, in order, the document entries and the containers
+        nested in the node. token is the bullet token of a list item """
+
+    __slots__ = ("type", "token", "indent", "ordered", "children")
+
+    def __init__(self, nodeType, token=None, indent=0, ordered=False):
+        self.type = nodeType
+        self.token = token
+        # Indentation of the line which opened the container
+        self.indent = indent
+        # Tells if a list is a numbered list
+        self.ordered = ordered
+        self.children = []
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+
+    def __repr__(self):
+        return "containerNode({0}, {1})".format(
+            getattr(self.type, "name", self.type), self.children
+        )
+
+
+class treeBuilder:
+    """ Builds the nested container tree of a document in a single pass over
+        the entries of its flat structure, as they come out of the tokenizer.
+        The containers which are still open are kept on a stack, innermost
+        last, along with the indentation of the line which opened them. A
+        line closes the containers it is not nested in by popping them off
+        the stack. Every container is pushed and popped once, so the whole
+        pass stays linear however deep the nesting goes.
+
+        Lists nest by the INDENT token in front of their items. Plain text
+        lines starting with > are block quotes, whose markers are stripped
+        from the text. The text of a quote is not tokenized again so a quote
+        only holds plain text and nested quotes. The leaves of the tree are
+        the entries of the document, with blocks split up between the
+        containers their lines belong to and without their INDENT tokens """
+
+    def __init__(self):
+        # Top of the tree. Holds the entries which are not in any container
+        self.root = containerNode(None)
+        # Containers which are still open. The root is never closed
+        self.stack = [self.root]
+        # Number of quotes at the top of the stack. Quotes cannot hold lists
+        # so they always sit above the open lists
+        self.quoteDepth = 0
+        # Indentation of the line being fed, from the INDENT token in front
+        # of it. The INDENT token of a heading or bullet line closes the
+        # block before it so it comes in at the end of that block
+        self.indent = 0
+
+    def takeIndent(self):
+        """ Return the indentation of the current line and reset it """
+        indent = self.indent
+        self.indent = 0
+        return indent
+
+    def addLine(self, token):
+        """ Add a line of a block to the innermost open container. Lines in
+            a row are kept in the same block """
+        children = self.stack[-1].children
+        if len(children) != 0 and isinstance(children[-1], list):
+            children[-1].append(token)
+        else:
+            children.append([token])
+
+    def openContainer(self, node):
+        self.stack[-1].children.append(node)
+        self.stack.append(node)
+
+    def closeQuotes(self, depth):
+        """ Close the quotes nested deeper than depth """
+        while self.quoteDepth > depth:
+            self.stack.pop()
+            self.quoteDepth -= 1
+
+    def openQuotes(self, depth, indent):
+        """ Open quotes until depth of them are open """
+        while self.quoteDepth < depth:
+            self.openContainer(containerNode(tokType.BLOCKQUOTE, indent=indent))
+            self.quoteDepth += 1
+
+    def closeLists(self, indent):
+        """ Close the list items, and their lists, which a line with the given
+            indentation is not nested under """
+        stack = self.stack
+        while (
+            stack[-1].type == tokType.LISTITEM
+            and indent < stack[-1].indent + NESTING_INDENT
+        ):
+            # An item is always right above its list
+            del stack[-2:]
+
+    def addItem(self, token, indent):
+        """ Add a list item, opening a list for it unless it continues the
+            innermost open list """
+        stack = self.stack
+        ordered = token["type"] == tokType.NUMBULLET
+        # Close the lists nested deeper than the item
+        while stack[-1].type == tokType.LISTITEM and stack[-2].indent > indent:
+            del stack[-2:]
+
+        item = containerNode(tokType.LISTITEM, token, indent)
+        if (
+            stack[-1].type == tokType.LISTITEM
+            and indent < stack[-1].indent + NESTING_INDENT
+        ):
+            # Next item of the same list, unless the kind of list changes
+            stack.pop()
+            if stack[-1].ordered == ordered:
+                self.openContainer(item)
+                return
+            stack.pop()
+
+        self.openContainer(containerNode(tokType.LIST, indent=indent, ordered=ordered))
+        self.openContainer(item)
+
+    def feedLine(self, token):
+        """ Add a token of a block """
+        tokenType = token["type"]
+        if tokenType == tokType.INDENT:
+            self.indent = token["count"]
+            return
+
+        indent = self.takeIndent()
+        if tokenType == tokType.PLAIN:
+            content = token["content"]
+            marker = quoteMarkerExp.match(content)
+            if marker is None:
+                self.closeQuotes(0)
+                self.closeLists(indent)
+                self.addLine(token)
+                return
+
+            depth = marker.group().count(">")
+            self.closeQuotes(depth)
+            self.closeLists(indent)
+            self.openQuotes(depth, indent)
+            content = content[marker.end() :]
+            factory = dictTokens if isinstance(token, dict) else compactTokens
+            # A line holding only quote markers separates paragraphs
+            if content.strip() == "":
+                self.addLine(factory.blank())
+            else:
+                self.addLine(factory.plain(content))
+        elif tokenType == tokType.BLANK:
+            # A blank line ends the quotes but not the lists, whose items can
+            # go on after it
+            self.closeQuotes(0)
+            self.addLine(token)
+        else:
+            self.addLine(token)
+
+    def feed(self, entry):
+        """ Add the next entry of the document structure to the tree """
+        if isinstance(entry, list):
+            for token in entry:
+                self.feedLine(token)
+            return
+
+        indent = self.takeIndent()
+        self.closeQuotes(0)
+        tokenType = entry["type"]
+        if tokenType in ITEM_TYPES:
+            self.addItem(entry, indent)
+            return
+        if tokenType == "EOF":
+            # Everything is closed at the end of the document
+            del self.stack[1:]
+        else:
+            self.closeLists(indent)
+        self.stack[-1].children.append(entry)
+
+    def finish(self):
+        """ Return the tree, as the list of the entries and containers at
+            its top level """
+        return self.root.children
+
+
+def buildTree(document):
+    """ Build the container tree of a finished document structure """
+    builder = treeBuilder()
+    for entry in document:
+        builder.feed(entry)
+    return builder.finish()
@@ -0,0 +1,317 @@
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#     Copyright (C) 2019 Yavor Konstantinov
+#
+
+from mdownMapped import (
+    mdMappedTokenizer,
+    hashRunExp,
+    hrLineBytesExp,
+    underlineBytesExp,
+)
+from array import array
+from bisect import bisect_left
+
+# NumPy is optional. Without it mdVectorTokenizer runs the byte engine of
+# mdMappedTokenizer line by line. It is only imported once a tokenizer is
+# created since importing it takes longer than converting a small file
+numpy = None
+numpyMissing = False
+
+
+def loadNumpy():
+    """ Import NumPy on first use. Returns None if it is not installed """
+    global numpy, numpyMissing
+    if numpy is None and not numpyMissing:
+        try:
+            import numpy as numpyModule
+        except ImportError:
+            numpyMissing = True
+        else:
+            numpy = numpyModule
+    return numpy
+
+# Class of the first non-space character of a line, held in the low bits of
+# the kind of every line
+FIRST_PLAIN = 0
+FIRST_BLANK = 1
+FIRST_HASH = 2
+FIRST_BULLET = 3
+FIRST_CHECK = 4
+FIRST_DIGIT = 5
+# Lines starting with a character given its own rule through
+# mdTokenizer.wholeLineRules. They are left to the byte engine
+FIRST_CUSTOM = 6
+# Lines starting with ``` or ~~~, which may open a fenced code block. Left
+# to the byte engine as well
+FIRST_FENCE = 7
+FIRST_MASK = 7
+
+# Flags held in the high bits of the kind of a line
+KIND_HR = 8
+KIND_UNDERLINED = 16
+
+# Number of bytes compared against b"\n" at once. Bounds the size of the
+# temporary boolean array on very large files
+SCAN_BYTES = 1 << 24
+
+
+class mdVectorTokenizer(mdMappedTokenizer):
+    """ Tokenizer over a bytes-like buffer which classifies every line of the
+        document at once with NumPy. Newlines, indentation widths, the class
+        of the first character of every line and the horizontal rule and
+        heading underline lines are found with array operations, leaving a
+        thin loop which only assembles the tokens. Produces the same document
+        as the line engine. Without NumPy it falls back to the byte engine of
+        mdMappedTokenizer """
+
+    def __init__(self, buffer, encoding="utf-8", compact=False, spans=False):
+        mdMappedTokenizer.__init__(self, buffer, encoding, compact, spans)
+        self.engine = "vector"
+        if loadNumpy() is not None:
+            self.classifyLines()
+
+    def classifyLines(self):
+        """ Build the line table: the newline ending every line, the end of
+            the line without its "\\r", the position of its first non-space
+            character and its kind """
+        text = self.text
+        data = numpy.frombuffer(text, dtype=numpy.uint8)
+        size = len(data)
+
+        # Position of every newline
+        newlines = [numpy.zeros(0, dtype=numpy.int64)]
+        for offset in range(0, size, SCAN_BYTES):
+            chunk = data[offset : offset + SCAN_BYTES]
+            newlines.append(numpy.flatnonzero(chunk == 10).astype(numpy.int64) + offset)
+        newlines = numpy.concatenate(newlines)
+        starts = numpy.concatenate(([0], newlines + 1))
+        ends = numpy.append(newlines, size)
+
+        # End of every line without its "\r"
+        contentEnds = ends.copy()
+        if size != 0:
+            contentEnds -= (ends > 0) & (data[numpy.maximum(ends - 1, 0)] == 13)
+
+        # Skip the indentation of every line at once. Only the lines still
+        # on a space take part in each step
+        first = starts.copy()
+        active = numpy.flatnonzero(first < contentEnds)
+        active = active[data[first[active]] == 32]
+        while len(active) != 0:
+            first[active] += 1
+            active = active[first[active] < contentEnds[active]]
+            active = active[data[first[active]] == 32]
+
+        def byteAt(offset):
+            """ Byte offset characters after the first non-space character of
+                every line, 0 past the end of the line """
+            index = first + offset
+            inside = index < contentEnds
+            found = numpy.zeros(len(first), dtype=numpy.uint8)
+            found[inside] = data[index[inside]]
+            return found
+
+        firstByte = byteAt(0)
+        secondByte = byteAt(1)
+        thirdByte = byteAt(2)
+
+        # Class of the first character. Later assignments take precedence
+        kinds = numpy.full(len(first), FIRST_PLAIN, dtype=numpy.uint8)
+        kinds[first >= contentEnds] = FIRST_BLANK
+        kinds[firstByte == ord("#")] = FIRST_HASH
+        # Anything outside of ASCII may still be a digit to str.isdigit
+        kinds[((firstByte >= ord("0")) & (firstByte <= ord("9"))) | (firstByte >= 128)] = FIRST_DIGIT
+        bullets = numpy.isin(firstByte, (ord("-"), ord("+"), ord("*"))) & (secondByte == 32)
+        kinds[bullets] = FIRST_BULLET
+        kinds[bullets & (firstByte == ord("-")) & (thirdByte == ord("["))] = FIRST_CHECK
+        fences = numpy.isin(firstByte, (ord("`"), ord("~")))
+        kinds[fences & (secondByte == firstByte) & (thirdByte == firstByte)] = FIRST_FENCE
+        for char in self.wholeLineRules.custom:
+            if char == "\n":
+                kinds[first >= contentEnds] = FIRST_CUSTOM
+            elif char < "\x80":
+                kinds[(firstByte == ord(char)) & (first < contentEnds)] = FIRST_CUSTOM
+                if char.isdigit():
+                    kinds[firstByte >= 128] = FIRST_CUSTOM
+
+        # Horizontal rules start with three of the same character. The few
+        # lines which do are checked in full
+        rules = (
+            numpy.isin(firstByte, (ord("-"), ord("_"), ord("*")))
+            & (secondByte == firstByte)
+            & (thirdByte == firstByte)
+        )
+        for line in numpy.flatnonzero(rules).tolist():
+            if hrLineBytesExp.fullmatch(text, int(starts[line]), int(contentEnds[line])):
+                kinds[line] |= KIND_HR
+
+        # Underlines start right at the beginning of the line, are at least
+        # three characters long and have to be followed by a newline. The
+        # line above them is flagged
+        if size != 0:
+            lineStart = data[numpy.minimum(starts, size - 1)]
+            underlines = (
+                (starts < contentEnds)
+                & ((lineStart == ord("-")) | (lineStart == ord("=")))
+                & (contentEnds - starts >= 3)
+                & (ends < size)
+            )
+            underlines[0] = False
+            for line in numpy.flatnonzero(underlines).tolist():
+                if underlineBytesExp.fullmatch(text, int(starts[line]), int(contentEnds[line])):
+                    kinds[line - 1] |= KIND_UNDERLINED
+
+        # Plain arrays are much faster than NumPy ones to index one at a time
+        self.lineEnds = array("q", ends.tobytes())
+        self.lineContentEnds = array("q", contentEnds.tobytes())
+        self.lineFirst = array("q", first.tobytes())
+        self.lineKinds = array("B", kinds.tobytes())
+
+    def tokenize(self):
+        """ Tokenize the whole buffer from the line table """
+        if numpy is None:
+            mdMappedTokenizer.tokenize(self)
+            return
+        self.document = list(self.iterTokens())
+
+    def iterTokens(self, everyLine=False):
+        """ Assemble the tokens of every line from the line table, yielding
+            every entry of the document structure once it is finished. Steps
+            from line to line exactly the way the tokenize() driver does.
+            everyLine works as in mdTokenizer.iterTokens """
+        if numpy is None:
+            yield from mdMappedTokenizer.iterTokens(self, everyLine)
+            return
+
+        text = self.text
+        size = self.EOF
+        factory = self.tokenFactory
+        content = self.content
+        lineEnds = self.lineEnds
+        lineContentEnds = self.lineContentEnds
+        lineFirst = self.lineFirst
+        lineKinds = self.lineKinds
+
+        # Current position and the line holding it
+        pos = self.currIndex
+        line = 0
+        while pos + 1 < size:
+            if text[pos] == 10:
+                # Step over the newline, and the "\r" of a "\r\n" after it
+                pos += 1
+                if pos + 1 < size and text[pos] == 13 and text[pos + 1] == 10:
+                    pos += 1
+                line += 1
+
+            end = lineEnds[line]
+            contentEnd = lineContentEnds[line]
+            first = lineFirst[line]
+            kind = lineKinds[line]
+            firstClass = kind & FIRST_MASK
+
+            # Registered rules and code blocks are left to the byte engine.
+            # Indented code starts after a blank line, as in tokenizeLine
+            indentedCode = (
+                first - pos >= 4
+                and first < contentEnd
+                and self.blankFlag
+                and len(self.currBlock) != 0
+            )
+            if firstClass >= FIRST_CUSTOM or indentedCode:
+                self.currIndex = pos
+                self.tokenizeLine()
+                pos = self.currIndex
+                line = bisect_left(lineEnds, pos)
+                if len(self.document) != 0:
+                    yield from self.document
+                    self.document = []
+                if everyLine:
+                    yield None
+                continue
+
+            if first > pos:
+                self.currBlock.append(factory.indent(first - pos))
+
+            # Standard heading starting with #
+            if firstClass == FIRST_HASH:
+                hashCount = hashRunExp.match(text, first, contentEnd).end() - first
+                headingText = self.eatLineFrom(first + hashCount)
+                pos = self.currIndex
+                self.closeBlock()
+                self.document.append(factory.markedHeading(min(hashCount, 6), headingText))
+            # Underlined heading, the underline itself is skipped
+            elif kind & KIND_UNDERLINED and firstClass != FIRST_BLANK:
+                self.closeBlock()
+                self.document.append(factory.underlinedHeading(content(first, contentEnd)))
+                line += 1
+                pos = lineEnds[line]
+            # Horizontal rules
+            elif kind & KIND_HR and self.blankFlag == True:
+                self.closeBlock()
+                self.document.append(factory.hr())
+                if text[first] == 45:
+                    self.blankFlag = False
+                # Move to the start of the next line the way insertHR does
+                self.currIndex = end
+                self.getNext()
+                pos = self.currIndex
+                line += 1
+            # Bullet
+            elif firstClass == FIRST_BULLET:
+                bulletText = self.eatLineFrom(first + 1)
+                pos = self.currIndex
+                self.closeBlock()
+                self.document.append(factory.bullet(bulletText))
+            # Checklist item. Its content may start past the end of a short line
+            elif firstClass == FIRST_CHECK:
+                status = True if text[first + 3 : first + 4] == b"x" else None
+                checkItemContent = self.eatLineFrom(self.skipChars(first, 5))
+                pos = self.currIndex
+                if pos > end:
+                    line = bisect_left(lineEnds, pos)
+                self.closeBlock()
+                self.document.append(factory.checkItem(status, checkItemContent))
+            # Numbered Bullets
+            elif firstClass == FIRST_DIGIT and self.numBulletDigits(first, contentEnd) is not None:
+                bulletText = self.eatLineFrom(self.numBulletDigits(first, contentEnd) + 1)
+                pos = self.currIndex
+                self.closeBlock()
+                self.document.append(factory.numBullet(bulletText))
+            # Case of an empty line
+            elif firstClass == FIRST_BLANK:
+                self.blankFlag = True
+                pos = end
+                self.currBlock.append(factory.blank())
+            # Case of plain text
+            else:
+                self.blankFlag = False
+                pos = end
+                self.currBlock.append(factory.plain(content(first, contentEnd)))
+
+            # Hand over everything which was finished by the current line
+            if len(self.document) != 0:
+                yield from self.document
+                self.document = []
+            if everyLine:
+                yield None
+
+        self.currIndex = pos
+        self.currChar = "\n"
+        self.closeBlock()
+        # Add an EOF token to signify end of file
+        self.document.append(factory.eof())
+        yield from self.document
+        self.document = []
@@ -0,0 +1,81 @@
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#     Copyright (C) 2019 Yavor Konstantinov
+#
+
+
+""" Run from the root of the repository with python -m unittest """
+
+from benchmarks.corpus import generateCorpus
+from mdownAsync import renderMarkdown, renderText, defaultRenderers, INLINE_LIMIT
+import asyncio
+import gc
+import threading
+import time
+import unittest
+
+
+def collectRenderers():
+    """ Collect garbage until the renderers of finished loops are gone. A
+        worker thread may still be giving back the slot of its last
+        conversion right after the loop returns """
+    for _ in range(100):
+        gc.collect()
+        if len(defaultRenderers) == 0:
+            break
+        time.sleep(0.02)
+    return len(defaultRenderers)
+
+
+class renderMarkdownTest(unittest.TestCase):
+    def testLoopsDoNotLeakRenderersOrThreads(self):
+        text = generateCorpus(INLINE_LIMIT * 4, "mixed", 1)
+        expected = renderText(text)
+
+        async def renderMany():
+            return await asyncio.gather(*[renderMarkdown(text) for _ in range(8)])
+
+        threadCounts = []
+        for _ in range(5):
+            self.assertEqual(asyncio.run(renderMany()), [expected] * 8)
+            # The renderer of a loop goes away along with the loop
+            self.assertEqual(collectRenderers(), 0)
+            threadCounts.append(threading.active_count())
+        # Every loop shares the same thread pool
+        self.assertEqual(threadCounts[1:], threadCounts[:-1])
+
+    def testSlotsComeBackAfterTimeouts(self):
+        text = generateCorpus(INLINE_LIMIT * 16, "mixed", 2)
+
+        async def flood():
+            results = await asyncio.gather(
+                *[renderMarkdown(text, timeout=0.001) for _ in range(10)],
+                return_exceptions=True,
+            )
+            self.assertTrue(all(isinstance(result, TimeoutError) for result in results))
+            # Slots are given back once the conversions really finish
+            renderer = defaultRenderers[asyncio.get_running_loop()]
+            for _ in range(200):
+                if renderer.semaphore.free == renderer.maxInFlight:
+                    break
+                await asyncio.sleep(0.05)
+            self.assertEqual(renderer.semaphore.free, renderer.maxInFlight)
+            self.assertEqual(await renderMarkdown(text), renderText(text))
+
+        asyncio.run(flood())
+
+
+if __name__ == "__main__":
+    unittest.main()
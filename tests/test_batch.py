@@ -0,0 +1,97 @@
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#     Copyright (C) 2019 Yavor Konstantinov
+#
+
+from yamd2html import chunkJobs, convertBatch, findMarkdownFiles, outputPathFor
+import os
+import tempfile
+import unittest
+
+# Markdown files of the input tree, by their path below the root
+FILES = {
+    "index.md": "# Index\n",
+    "guide/intro.md": "Some *text*\n",
+    "guide/deep/notes.md": "- item\n",
+    "other/readme.md": "plain\n",
+}
+
+
+class batchTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.directory.name, "docs")
+        self.output = os.path.join(self.directory.name, "site")
+        for name, text in FILES.items():
+            path = os.path.join(self.root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as inputFile:
+                inputFile.write(text)
+        # Not a markdown file, left alone
+        with open(os.path.join(self.root, "guide", "image.png"), "w") as inputFile:
+            inputFile.write("png")
+        # A markdown file which can not be read
+        self.badPath = os.path.join(self.root, "guide", "broken.md")
+        os.symlink(os.path.join(self.root, "missing"), self.badPath)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def jobs(self):
+        return [
+            (path, outputPathFor(root, path, self.output))
+            for root, path in findMarkdownFiles([self.root])
+        ]
+
+    def checkOutput(self):
+        for name in FILES:
+            htmlPath = os.path.join(self.output, os.path.splitext(name)[0] + ".html")
+            self.assertTrue(os.path.isfile(htmlPath), htmlPath)
+        self.assertEqual(
+            sorted(
+                os.path.relpath(os.path.join(dirPath, fileName), self.output)
+                for dirPath, dirNames, fileNames in os.walk(self.output)
+                for fileName in fileNames
+            ),
+            sorted(os.path.splitext(name)[0] + ".html" for name in FILES),
+        )
+
+    def testMirrorsTreeAndReportsBadFile(self):
+        # Tiny chunks so two jobs go through the worker pool
+        for jobCount in (1, 2):
+            failures, hits, misses = convertBatch(self.jobs(), jobCount, chunkBytes=8)
+            self.assertEqual([path for path, error in failures], [self.badPath])
+            self.assertIn("FileNotFoundError", failures[0][1])
+            self.checkOutput()
+
+    def testOutputPathFor(self):
+        path = os.path.join("docs", "guide", "intro.md")
+        self.assertEqual(outputPathFor("docs", path, None), os.path.join("docs", "guide", "intro.html"))
+        self.assertEqual(outputPathFor("docs", path, "site"), os.path.join("site", "guide", "intro.html"))
+
+    def testChunkJobs(self):
+        jobs = self.jobs()
+        # Every job lands in exactly one chunk, in order
+        for chunkBytes in (1, 8, 16, 1 << 20):
+            chunks = list(chunkJobs(jobs, chunkBytes))
+            self.assertEqual([job for chunk in chunks for job in chunk], jobs)
+            self.assertNotIn([], chunks)
+        self.assertEqual(len(list(chunkJobs(jobs, 1 << 20))), 1)
+        # Files of at least chunkBytes close their chunk
+        self.assertEqual(len(list(chunkJobs(jobs, 1))), len(jobs) - 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
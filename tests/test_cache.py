@@ -0,0 +1,115 @@
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#     Copyright (C) 2019 Yavor Konstantinov
+#
+
+from htmlCache import OUTPUT_MODULES, conversionCache
+from yamd2html import convertFile
+from unittest import mock
+import htmlCache
+import os
+import shutil
+import tempfile
+import unittest
+
+SOURCE = "# Title\n\nSome **bold** text\n"
+
+
+class cacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cacheDir = os.path.join(self.directory.name, "cache")
+        self.inputPath = self.path("input.md")
+        with open(self.inputPath, "w") as inputFile:
+            inputFile.write(SOURCE)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def read(self, path):
+        with open(path, "rb") as inputFile:
+            return inputFile.read()
+
+    def testMissThenHit(self):
+        cache = conversionCache(self.cacheDir)
+        convertFile(self.inputPath, self.path("first.html"), cache=cache)
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+        convertFile(self.inputPath, self.path("second.html"), cache=cache)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        convertFile(self.inputPath, self.path("uncached.html"))
+        expected = self.read(self.path("uncached.html"))
+        self.assertEqual(self.read(self.path("first.html")), expected)
+        self.assertEqual(self.read(self.path("second.html")), expected)
+
+    def testKeyDependsOnInputAndEngine(self):
+        cache = conversionCache(self.cacheDir)
+        key = cache.keyFor(b"text", "char")
+        self.assertEqual(cache.keyFor(b"text", "char"), key)
+        self.assertNotEqual(cache.keyFor(b"text", "line"), key)
+        self.assertNotEqual(cache.keyFor(b"other", "char"), key)
+
+    def testKeyDependsOnOutputModulesOnly(self):
+        # A copy of the modules stands in for the source tree
+        moduleDir = self.path("modules")
+        os.mkdir(moduleDir)
+        sourceDir = os.path.dirname(os.path.abspath(htmlCache.__file__))
+        for fileName in OUTPUT_MODULES + ("yamdClient.py",):
+            shutil.copy(os.path.join(sourceDir, fileName), moduleDir)
+
+        def keyOf():
+            with mock.patch.object(htmlCache, "__file__", os.path.join(moduleDir, "htmlCache.py")):
+                return conversionCache(self.cacheDir).keyFor(b"text")
+
+        key = keyOf()
+        with open(os.path.join(moduleDir, "yamdClient.py"), "a") as moduleFile:
+            moduleFile.write("\n# Unrelated change\n")
+        self.assertEqual(keyOf(), key)
+        with open(os.path.join(moduleDir, "HtmlConverter.py"), "a") as moduleFile:
+            moduleFile.write("\n# Converter change\n")
+        self.assertNotEqual(keyOf(), key)
+
+    def testEvictRemovesLeastRecentlyUsed(self):
+        cache = conversionCache(self.cacheDir)
+        entries = []
+        for index in range(5):
+            entry = cache.store(cache.keyFor(str(index).encode()), "x" * 100)
+            # Older entries were used longer ago
+            os.utime(entry, (1000 + index, 1000 + index))
+            entries.append(entry)
+
+        self.assertEqual(conversionCache(self.cacheDir).evict(), 0)
+        self.assertEqual(conversionCache(self.cacheDir, 250).evict(), 3)
+        self.assertEqual([os.path.exists(entry) for entry in entries], [False] * 3 + [True] * 2)
+        self.assertEqual(conversionCache(self.cacheDir, 250).evict(), 0)
+
+    def testHardlinkAndFallbackToCopy(self):
+        cache = conversionCache(self.cacheDir, hardlink=True)
+        entry = cache.store(cache.keyFor(b"text"), "<p>text</p>\n")
+
+        cache.placeFile(entry, self.path("linked.html"))
+        self.assertTrue(os.path.samefile(entry, self.path("linked.html")))
+
+        with mock.patch("os.link", side_effect=OSError("cross-device link")):
+            cache.placeFile(entry, self.path("copied.html"))
+        self.assertFalse(os.path.samefile(entry, self.path("copied.html")))
+        self.assertEqual(self.read(self.path("copied.html")), self.read(entry))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#     Copyright (C) 2019 Yavor Konstantinov
+#
+
+from mdownDaemon import renderDaemon
+from yamdClient import requestRender
+import os
+import signal
+import tempfile
+import threading
+import unittest
+
+
+class daemonTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.socketPath = os.path.join(self.directory.name, "yamd2html.sock")
+        self.server = renderDaemon(self.socketPath, jobCount=2)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        self.directory.cleanup()
+
+    def render(self, content):
+        return requestRender({"content": content}, self.socketPath)
+
+    def testRendersContent(self):
+        self.assertEqual(self.render("# Title\n"), {"ok": True, "html": "<h1>Title</h1>\n"})
+
+    def testKilledWorkerIsReplaced(self):
+        self.assertTrue(self.render("warm up\n")["ok"])
+        brokenPool = self.server.pool
+        for pid in list(brokenPool._processes):
+            os.kill(pid, signal.SIGKILL)
+
+        response = self.render("# After\n")
+        self.assertEqual(response, {"ok": True, "html": "<h1>After</h1>\n"})
+        # The request was served by a new pool, which keeps serving
+        self.assertIsNot(self.server.pool, brokenPool)
+        self.assertNotEqual(len(self.server.pool._processes), 0)
+        self.assertTrue(self.render("again\n")["ok"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#     Copyright (C) 2019 Yavor Konstantinov
+#
+
+from benchmarks.corpus import generateCorpus
+from mdownDocument import mdDocument
+from mdownMapped import mdMappedTokenizer
+from mdownStructure import mdTokenizer
+import io
+import unittest
+
+# Paragraphs separated by blank lines and nothing else, so the tokenizer
+# keeps all of them in a single block
+PROSE = "".join("paragraph {0} starts here\nand goes on\n\n".format(index) for index in range(20000))
+
+
+class documentTest(unittest.TestCase):
+    def testFirstParagraphStopsAfterIt(self):
+        for engine in ("char", "line"):
+            document = mdDocument(PROSE, engine)
+            self.assertEqual(document.firstParagraph(), "paragraph 0 starts here\nand goes on")
+            self.assertFalse(document.isComplete())
+            # Only the lines up to the blank one after the paragraph were read
+            self.assertLess(document.tokenizer.windowStart + document.tokenizer.currIndex, 100)
+
+    def testFirstParagraphOfMappedSource(self):
+        document = mdDocument(mdMappedTokenizer(PROSE.encode()))
+        self.assertEqual(document.firstParagraph(), "paragraph 0 starts here\nand goes on")
+        self.assertLess(document.tokenizer.currIndex, 100)
+
+    def testFirstParagraphAfterOtherEntries(self):
+        cases = {
+            "": None,
+            "# heading\n": None,
+            "# heading\n\n- bullet\ntext": "text",
+            "text\nmore": "text\nmore",
+            "  \n\nfirst\n\nsecond": "first",
+            "- bullet\n\n    code\n\npara\n": "para",
+        }
+        for text, paragraph in cases.items():
+            self.assertEqual(mdDocument(text).firstParagraph(), paragraph, repr(text))
+
+    def testEntriesMatchTokenize(self):
+        text = generateCorpus(64 << 10, "mixed", 7)
+        tokenizer = mdTokenizer(io.StringIO(text), engine="line")
+        tokenizer.tokenize()
+        document = mdDocument(text)
+        self.assertIsNotNone(document.firstHeading())
+        self.assertEqual(document[3], tokenizer.document[3])
+        self.assertEqual(list(document), tokenizer.document)
+        self.assertEqual(len(document), len(tokenizer.document))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,269 @@
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#     Copyright (C) 2019 Yavor Konstantinov
+#
+
+from tokenType import tokType
+from benchmarks.corpus import CONSTRUCTS, generateCorpus
+from HtmlConverter import HTMLConverter
+from mdownMapped import mdMappedTokenizer
+from mdownMarkup import markupCursor, scanInline
+from mdownSerial import dumps, loads
+from mdownStructure import mdTokenizer
+from mdownTokens import documentAsDicts
+from mdownVector import mdVectorTokenizer
+import io
+import mdownMapped
+import mmap
+import random
+import tempfile
+import unittest
+
+# Lines the random documents are made of, with the ones each rule has to
+# tell apart from plain text and the code blocks which hide other lines
+PIECES = [
+    "# Head",
+    "## Sub head",
+    "####### seven",
+    "#nospace",
+    "plain text line",
+    "another *line* with **bold**",
+    "",
+    "",
+    "",
+    "   ",
+    "---",
+    "===",
+    "***",
+    "___",
+    "----- ",
+    "-- -",
+    "- bullet",
+    "-not bullet",
+    "+ plus",
+    "* star",
+    "1. one",
+    "12. twelve",
+    "3.no",
+    "٣. eastern",
+    "- [x] done",
+    "- [ ] todo",
+    "- [",
+    "- [x",
+    "  indented",
+    "    - nested",
+    "text with trailing  ",
+    "> quote",
+    "café crème",
+    "```",
+    "```py",
+    "```` x y",
+    "~~~",
+    "  ```",
+    "    ```",
+    "```a`b",
+    "    code line",
+    "      # indented hash",
+    "    ---",
+]
+
+# Characters the inline lines are made of
+INLINE_PIECES = ["*", "**", "_", "__", "`", "~~", "~", "\\", "\\*", "[", "]", "(", ")", "!", "a", "bc", " ", "x y", "é"]
+
+SOURCE = """# Title *one*
+
+Some **bold** and _italic_ text with `code` and ~~gone~~.
+Second line & <tag>
+
+Underlined
+==========
+
+- first
+- second
+1. one
+2. two
+- [x] done
+- [ ] todo
+
+---
+
+```py
+x = "**not bold**"
+```
+
+    indented code
+
+See [the docs][Docs], [docs][] and ![logo][img] or [inline](http://x.y).
+Unknown [nope][zzz] stays text.
+
+[docs]: http://example.com/docs "Docs"
+[IMG]: <logo.png>
+"""
+
+EXPECTED_HTML = """<h1>Title <em>one</em></h1>
+<p>Some <strong>bold</strong> and <em>italic</em> text with <code>code</code> and <del>gone</del>.
+Second line &amp; &lt;tag&gt;</p>
+<h1>Underlined</h1>
+<ul>
+<li>first</li>
+<li>second</li>
+</ul>
+<ol>
+<li>one</li>
+<li>two</li>
+</ol>
+<ul>
+<li><input type="checkbox" disabled checked> done</li>
+<li><input type="checkbox" disabled> todo</li>
+</ul>
+<hr>
+<pre><code class="language-py">x = "**not bold**"</code></pre>
+<pre><code>indented code</code></pre>
+<p>See <a href="http://example.com/docs">the docs</a>, <a href="http://example.com/docs">docs</a> and <img src="logo.png" alt="logo" width="200" height="200"> or <a href="http://x.y">inline</a>.
+Unknown [nope][zzz] stays text.</p>
+"""
+
+
+def randomText(rng):
+    text = "\n".join(rng.choice(PIECES) for _ in range(rng.randint(0, 30)))
+    if rng.random() < 0.8:
+        text += "\n"
+    if rng.random() < 0.2:
+        text = "\n" + text
+    return text
+
+
+def tokenizeText(text, **options):
+    tokenizer = mdTokenizer(io.StringIO(text), **options)
+    tokenizer.tokenize()
+    return tokenizer.returnTokenList()
+
+
+def tokenizeBytes(engine, data, **options):
+    tokenizer = engine(data, **options)
+    tokenizer.tokenize()
+    return tokenizer.returnTokenList()
+
+
+class enginesTest(unittest.TestCase):
+    def checkEngines(self, text):
+        """ Compare every engine and token kind with the char engine """
+        expected = documentAsDicts(tokenizeText(text, engine="char"))
+        documents = {
+            "line": tokenizeText(text, engine="line"),
+            "char streaming": tokenizeText(text, engine="char", streaming=True),
+            "line streaming": tokenizeText(text, engine="line", streaming=True),
+            "compact": tokenizeText(text, engine="line", compact=True),
+        }
+        for newline in ("\n", "\r\n"):
+            data = text.replace("\n", newline).encode()
+            for options in ({}, {"compact": True}, {"spans": True}):
+                name = "{0!r} {1}".format(newline, sorted(options))
+                documents["mmap " + name] = tokenizeBytes(mdMappedTokenizer, data, **options)
+                documents["vector " + name] = tokenizeBytes(mdVectorTokenizer, data, **options)
+        for name, document in documents.items():
+            self.assertEqual(documentAsDicts(document), expected, "{0}: {1!r}".format(name, text))
+
+    def testRandomDocumentsMatchCharEngine(self):
+        rng = random.Random(11)
+        for _ in range(300):
+            self.checkEngines(randomText(rng))
+
+    def testCorpusProfilesMatchCharEngine(self):
+        for seed, profile in enumerate(("mixed",) + CONSTRUCTS):
+            self.checkEngines(generateCorpus(8 << 10, profile, seed))
+
+    def testPlainTokensKeepTheirDictShape(self):
+        text = "plain line\nwith **markup**\n"
+        for document in (
+            tokenizeText(text, engine="char"),
+            tokenizeText(text, engine="line"),
+            documentAsDicts(tokenizeText(text, engine="line", compact=True)),
+            documentAsDicts(tokenizeBytes(mdVectorTokenizer, text.encode(), spans=True)),
+        ):
+            self.assertEqual(
+                document[0],
+                [
+                    {"type": tokType.PLAIN, "content": "plain line"},
+                    {"type": tokType.PLAIN, "content": "with **markup**"},
+                ],
+            )
+
+    def testMappedTokenizeReleasesPages(self):
+        text = generateCorpus(256 << 10, "mixed", 9)
+        releaseBytes = mdownMapped.RELEASE_BYTES
+        mdownMapped.RELEASE_BYTES = mmap.PAGESIZE
+        try:
+            with tempfile.TemporaryFile() as inputFile:
+                inputFile.write(text.encode())
+                inputFile.flush()
+                tokenizer = mdMappedTokenizer(mdownMapped.mapFile(inputFile))
+                tokenizer.tokenize()
+                document = tokenizer.returnTokenList()
+                tokenizer.close()
+        finally:
+            mdownMapped.RELEASE_BYTES = releaseBytes
+        self.assertGreater(tokenizer.released, len(text) // 2)
+        self.assertEqual(document, tokenizeText(text, engine="line"))
+
+    def testByteEnginesSetTheTokenizerAttributes(self):
+        expected = mdTokenizer(io.StringIO("text\n"))
+        for engine, name in ((mdMappedTokenizer, "mmap"), (mdVectorTokenizer, "vector")):
+            tokenizer = engine(b"text\n")
+            self.assertEqual(tokenizer.engine, name)
+            self.assertIsNone(tokenizer.tree)
+            for attribute in vars(expected):
+                if attribute not in ("lineStarts", "lineKinds"):
+                    self.assertTrue(hasattr(tokenizer, attribute), (name, attribute))
+
+    def testScanInlineMatchesEatCharsMarkup(self):
+        rng = random.Random(12)
+        for _ in range(3000):
+            line = "".join(rng.choice(INLINE_PIECES) for _ in range(rng.randint(0, 15)))
+            self.assertEqual(scanInline(line), markupCursor(line).eatCharsMarkup(), repr(line))
+
+    def testSerialRoundTrip(self):
+        rng = random.Random(13)
+        for _ in range(200):
+            text = randomText(rng)
+            for compact in (False, True):
+                document = tokenizeText(text, engine="line", compact=compact)
+                self.assertEqual(
+                    documentAsDicts(loads(dumps(document))), documentAsDicts(document), repr(text)
+                )
+
+    def testConverterOutput(self):
+        for engine in ("char", "line"):
+            self.assertEqual(
+                HTMLConverter(tokenizeText(SOURCE, engine=engine)).render(), EXPECTED_HTML
+            )
+        for tokenizer in (mdMappedTokenizer, mdVectorTokenizer):
+            document = tokenizeBytes(tokenizer, SOURCE.encode(), compact=True)
+            self.assertEqual(HTMLConverter(document).render(), EXPECTED_HTML)
+
+    def testEnginesConvertAlike(self):
+        rng = random.Random(14)
+        for _ in range(200):
+            text = randomText(rng)
+            expected = HTMLConverter(tokenizeText(text, engine="char")).render()
+            self.assertEqual(
+                HTMLConverter(tokenizeBytes(mdVectorTokenizer, text.encode())).render(),
+                expected,
+                repr(text),
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#     Copyright (C) 2019 Yavor Konstantinov
+#
+
+
+from benchmarks.corpus import generateCorpus
+from mdownIncremental import mdIncrementalTokenizer
+from mdownStructure import mdTokenizer
+import io
+import random
+import unittest
+
+# Text inserted by the random edits. Covers the lines which change how the
+# lines around them are tokenized
+INSERTS = ["", "x", "\n", "\n\n", "# ", "---\n", "===", "- ", "- [x] y\n", "```\n", "    code\n", "1. "]
+
+
+def tokenizeText(text, engine):
+    tokenizer = mdTokenizer(io.StringIO(text), engine=engine)
+    tokenizer.tokenize()
+    return tokenizer.returnTokenList()
+
+
+class incrementalTest(unittest.TestCase):
+    def checkEdits(self, text, engine, seed, editCount):
+        rng = random.Random(seed)
+        incremental = mdIncrementalTokenizer(text, engine)
+        pos = len(text) // 2
+        for _ in range(editCount):
+            # Edits mostly stay close to each other, as when typing
+            if rng.random() < 0.2:
+                pos = rng.randint(0, len(text))
+            pos = min(max(pos + rng.randint(-40, 40), 0), len(text))
+            removed = rng.randint(0, min(8, len(text) - pos))
+            inserted = rng.choice(INSERTS)
+            before = list(incremental.document)
+
+            index, removedEntries, insertedEntries = incremental.applyEdit(
+                pos, removed, inserted
+            )
+            text = text[:pos] + inserted + text[pos + removed :]
+            expected = tokenizeText(text, engine)
+            self.assertEqual(incremental.text, text)
+            self.assertEqual(incremental.document, expected)
+            # Entries outside of the reported range were left alone
+            self.assertEqual(before[:index], expected[:index])
+            self.assertEqual(
+                before[index + removedEntries :], expected[index + insertedEntries :]
+            )
+
+    def testLargeDocumentMatchesFullTokenize(self):
+        text = generateCorpus(200 << 10, "mixed", 3)
+        self.checkEdits(text, "line", 3, 40)
+
+    def testSmallDocumentsWithBothEngines(self):
+        for seed in range(40):
+            text = generateCorpus(2 << 10, "mixed", seed)
+            for engine in ("char", "line"):
+                self.checkEdits(text, engine, seed, 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#     Copyright (C) 2019 Yavor Konstantinov
+#
+
+from tokenType import tokType
+from mdownMarkup import collectReferences, scanInline
+from mdownStructure import mdTokenizer
+import io
+import unittest
+
+# Definitions the links of the tests are resolved against
+DEFINITIONS = (
+    "[Home Page]: /home \"Start\"\n"
+    "[docs]: </docs>\n"
+    "[docs]: /second\n"
+)
+
+
+def referencesOf(text):
+    """ Collect the reference definitions of a tokenized document """
+    tokenizer = mdTokenizer(io.StringIO(text))
+    tokenizer.tokenize()
+    return collectReferences(tokenizer.returnTokenList())
+
+
+def kinds(tokens):
+    return [token["type"] for token in tokens]
+
+
+class linksTest(unittest.TestCase):
+    def setUp(self):
+        self.references = referencesOf(DEFINITIONS)
+
+    def testCollectReferences(self):
+        # Labels are case folded and the first definition wins
+        self.assertEqual(self.references, {
+            "home page": ("/home", "Start"),
+            "docs": ("/docs", ""),
+        })
+
+    def testDefinitionsInCodeAreIgnored(self):
+        references = referencesOf(
+            "```\n[fenced]: /fenced\n```\n\n    [indented]: /indented\n\n[kept]: /kept\n"
+        )
+        self.assertEqual(references, {"kept": ("/kept", "")})
+
+    def testInlineLink(self):
+        tokens = scanInline("see [a](/b \"c\") now", self.references)
+        self.assertEqual(tokens, [
+            {"type": tokType.PLAIN, "content": "see "},
+            {"type": tokType.LINK, "title": "a", "path": "/b"},
+            {"type": tokType.PLAIN, "content": " now"},
+        ])
+
+    def testReferenceLinks(self):
+        for text in ("[Home Page]", "[HOME   page]", "[x][home page]", "[Home Page][]"):
+            tokens = scanInline(text, self.references)
+            self.assertEqual(kinds(tokens), [tokType.LINK], text)
+            self.assertEqual(tokens[0]["path"], "/home", text)
+        image = scanInline("![pic][DOCS]", self.references)
+        self.assertEqual(image, [
+            {"type": tokType.IMAGE, "desc": "pic", "url": "/docs", "title": ""},
+        ])
+
+    def testUndefinedLabel(self):
+        for text in ("[nowhere]", "[x][nowhere]", "![x][nowhere]"):
+            tokens = scanInline(text, self.references)
+            self.assertNotIn(tokType.LINK, kinds(tokens), text)
+            self.assertNotIn(tokType.IMAGE, kinds(tokens), text)
+            self.assertEqual("".join(token["content"] for token in tokens), text)
+        # Without any references only inline links are matched
+        self.assertEqual(kinds(scanInline("[docs]", None)), [tokType.PLAIN])
+
+    def testUnmatchedBracket(self):
+        # Brackets without a link stay as plain text
+        for text in ("[open", "[a](/b", "[x]", "x] [y"):
+            tokens = scanInline(text, {})
+            self.assertEqual(set(kinds(tokens)), {tokType.PLAIN}, text)
+            self.assertEqual("".join(token["content"] for token in tokens), text)
+        # The link after an unmatched [ is still found
+        tokens = scanInline("a [b [c](/d)", {})
+        self.assertEqual([token.get("content") for token in tokens[:-1]], ["a ", "[b "])
+        self.assertEqual(tokens[-1], {"type": tokType.LINK, "title": "c", "path": "/d"})
+
+    def testEscapedImage(self):
+        # An odd run of backslashes escapes the !, an even one does not
+        cases = [
+            ("![x](y)", [], tokType.IMAGE),
+            ("\\![x](y)", ["!"], tokType.LINK),
+            ("\\\\![x](y)", ["\\"], tokType.IMAGE),
+            ("\\\\\\![x](y)", ["\\!"], tokType.LINK),
+            ("a\\\\![x](y)", ["a\\"], tokType.IMAGE),
+        ]
+        for text, plain, kind in cases:
+            tokens = scanInline(text, {})
+            self.assertEqual(kinds(tokens[:-1]), [tokType.PLAIN] * len(plain), text)
+            self.assertEqual([token["content"] for token in tokens[:-1]], plain, text)
+            self.assertEqual(tokens[-1]["type"], kind, text)
+
+
+if __name__ == "__main__":
+    unittest.main()
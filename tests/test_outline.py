@@ -0,0 +1,108 @@
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#     Copyright (C) 2019 Yavor Konstantinov
+#
+
+from tokenType import tokType
+from benchmarks.corpus import CONSTRUCTS, generateCorpus
+from mdownOutline import outlineByTokenizer, outlineFile, scanOutline
+from mdownStructure import mdTokenizer
+import io
+import os
+import tempfile
+import unittest
+
+# Documents around the lines scanOutline special cases: indented code,
+# underlines and a rule right before a lone # at the end of the file
+SAMPLES = [
+    "# a\n    # code\nTitle\n=====\n---\n#",
+    "para\n\n    # code\n    Title\n    ===\nafter\n",
+    "para\n---\n",
+    "Title\n===\nSub\n---\n\n---\n",
+    "- item\n---\n# after\n",
+    "x\n\n---\n#",
+    "---\n#",
+    "***\n# star\n___\n",
+    "```\n# fenced\nTitle\n===\n```\n## out\n",
+    "~~~\n# open fence\n",
+    "  # indented head\n\t# tab\n####### seven\n#no space\n",
+    "Text é\n===\n# é\n",
+    "",
+    "#",
+    "\n\n\n",
+]
+
+
+def tokenizerHeadings(data):
+    """ Level and text of every heading the line tokenizer finds """
+    tokenizer = mdTokenizer(io.TextIOWrapper(io.BytesIO(data), newline=None), engine="line")
+    tokenizer.tokenize()
+    return [
+        (entry.get("size", 1), entry["content"])
+        for entry in tokenizer.returnTokenList()
+        if not isinstance(entry, list)
+        and entry["type"] in (tokType.MHEADING, tokType.UHEADING)
+    ]
+
+
+class outlineTest(unittest.TestCase):
+    def checkOutline(self, data):
+        outline = scanOutline(data)
+        self.assertEqual(outline, outlineByTokenizer(data), data)
+        self.assertEqual(
+            [(level, text) for level, text, offset, line in outline],
+            tokenizerHeadings(data),
+            data,
+        )
+        for level, text, offset, line in outline:
+            # Offsets are at the start of a line, counted from 1
+            self.assertTrue(offset == 0 or data[offset - 1 : offset] == b"\n", data)
+            self.assertEqual(data.count(b"\n", 0, offset) + 1, line, data)
+        return outline
+
+    def testSamples(self):
+        for text in SAMPLES:
+            for newline in ("\n", "\r\n"):
+                self.checkOutline(text.replace("\n", newline).encode("utf-8"))
+
+    def testSpecialCases(self):
+        self.assertEqual(
+            self.checkOutline(b"# a\n    # code\nTitle\n=====\n---\n#"),
+            [(1, "a", 0, 1), (1, "code", 4, 2), (1, "Title", 15, 3), (1, "", 31, 6)],
+        )
+        self.assertEqual(self.checkOutline(b"para\n\n    # code\n"), [])
+        self.assertEqual(self.checkOutline(b"x\n\n---\n#"), [])
+        self.assertEqual(
+            self.checkOutline(b"Title\r\n---\r\n#\r\n"),
+            [(1, "Title", 0, 1), (1, "", 12, 3)],
+        )
+
+    def testCorpus(self):
+        for profile in CONSTRUCTS + ("mixed",):
+            text = generateCorpus(20000, profile, seed=3)
+            for newline in ("\n", "\r\n"):
+                self.checkOutline(text.replace("\n", newline).encode("utf-8"))
+
+    def testOutlineFile(self):
+        data = generateCorpus(20000, "mixed", seed=5).replace("\n", "\r\n").encode("utf-8")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "doc.md")
+            with open(path, "wb") as outputFile:
+                outputFile.write(data)
+            self.assertEqual(outlineFile(path), scanOutline(data))
+
+
+if __name__ == "__main__":
+    unittest.main()
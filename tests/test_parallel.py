@@ -0,0 +1,149 @@
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#     Copyright (C) 2019 Yavor Konstantinov
+#
+
+from benchmarks.corpus import generateCorpus
+from concurrent.futures import ThreadPoolExecutor
+from HtmlConverter import HTMLConverter
+from mdownMarkup import collectReferences
+from mdownStructure import mdTokenizer
+from mdownTokens import documentAsDicts
+import mdownParallel
+import io
+import random
+import unittest
+
+# Lines the random documents are made of. Covers the lines which change how
+# the lines after them are tokenized: code fences, indented ones included,
+# checklist items short enough to swallow the next line, underlines, rules
+# and reference link definitions
+PIECES = [
+    "# heading",
+    "long plain text line",
+    "another plain line with **bold**",
+    "",
+    "",
+    "",
+    "   ",
+    "---",
+    "===",
+    "***",
+    "- bullet item",
+    "1. numbered item",
+    "- [x] done item",
+    "- [",
+    "- [x",
+    "  - [ ",
+    "```",
+    "```py",
+    "~~~",
+    "````",
+    "  ```",
+    "    ```",
+    "```a`b",
+    "    code line here",
+    "    - [x",
+    "[a]: http://a \"title\"",
+    "  [B]: <b.png>",
+    "    [c]: code",
+    "see [x][a] and [B][]",
+    "![image][b] long text",
+]
+
+
+def randomText(rng):
+    text = "\n".join(rng.choice(PIECES) for _ in range(rng.randint(0, 60)))
+    return text + "\n" if rng.random() < 0.5 else text
+
+
+def tokenizeText(text, engine):
+    tokenizer = mdTokenizer(io.StringIO(text), engine=engine)
+    tokenizer.tokenize()
+    return tokenizer.returnTokenList()
+
+
+class parallelTest(unittest.TestCase):
+    def setUp(self):
+        # Cut even the smallest documents into chunks
+        self.chunkSizes = (mdownParallel.CHUNK_CHARS, mdownParallel.MIN_CHUNK_CHARS)
+        mdownParallel.CHUNK_CHARS = 64
+        mdownParallel.MIN_CHUNK_CHARS = 1
+        self.executor = ThreadPoolExecutor(4)
+
+    def tearDown(self):
+        self.executor.shutdown()
+        mdownParallel.CHUNK_CHARS, mdownParallel.MIN_CHUNK_CHARS = self.chunkSizes
+
+    def testTokenizeMatchesSerial(self):
+        rng = random.Random(1)
+        for _ in range(300):
+            text = randomText(rng)
+            for engine in ("char", "line"):
+                for compact in (False, True):
+                    expected = tokenizeText(text, engine)
+                    document = mdownParallel.tokenizeParallel(
+                        text, 4, engine, compact, self.executor
+                    )
+                    self.assertEqual(
+                        documentAsDicts(document), documentAsDicts(expected), repr(text)
+                    )
+
+    def testConvertMatchesSerial(self):
+        rng = random.Random(2)
+        for _ in range(300):
+            text = randomText(rng)
+            expected = HTMLConverter(tokenizeText(text, "line")).render()
+            self.assertEqual(
+                mdownParallel.convertParallel(text, 4, "line", self.executor),
+                expected,
+                repr(text),
+            )
+            self.assertEqual(mdownParallel.convertParallel(text, 1), expected, repr(text))
+
+    def testLargeCorpusMatchesSerial(self):
+        mdownParallel.CHUNK_CHARS = 16 << 10
+        text = generateCorpus(256 << 10, "mixed", 5)
+        document = tokenizeText(text, "line")
+        self.assertEqual(
+            mdownParallel.tokenizeParallel(text, 4, "line", False, self.executor), document
+        )
+        self.assertEqual(
+            mdownParallel.convertParallel(text, 4, "line", self.executor),
+            HTMLConverter(document).render(),
+        )
+
+    def testReferencesCollectedFromText(self):
+        rng = random.Random(3)
+        for _ in range(300):
+            text = randomText(rng)
+            references = {}
+            regions, limit = mdownParallel.fencedRegions(text, references)
+            if limit == len(text):
+                self.assertEqual(
+                    references, collectReferences(tokenizeText(text, "line")), repr(text)
+                )
+
+    def testSplitsPastIndentedAndSwallowedFences(self):
+        # Neither fence opens a code block, which used to stop any cut
+        text = "plain text line\n\n    ```\n    code\n\n- [\n```\n\n"
+        text += "another plain line\n\n" * 50
+        regions, limit = mdownParallel.fencedRegions(text)
+        self.assertEqual((regions, limit), ([], len(text)))
+        self.assertGreater(len(mdownParallel.splitText(text, 8)), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
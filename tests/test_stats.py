@@ -0,0 +1,80 @@
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#     Copyright (C) 2019 Yavor Konstantinov
+#
+
+from HtmlConverter import HTMLConverter
+from mdownMapped import mdMappedTokenizer
+from mdownStats import statsCollector
+from mdownStructure import mdTokenizer
+from mdownVector import mdVectorTokenizer
+import io
+import unittest
+
+SOURCE = "# Title\n\nsome **bold** text\n\n---\n\n```\ncode\n```\n\npara\n\n    indented\n"
+
+
+def tokenizeWith(engine, stats):
+    """ Tokenize SOURCE with an instrumented tokenizer of the given engine """
+    if engine == "mmap":
+        tokenizer = mdMappedTokenizer(SOURCE.encode())
+    elif engine == "vector":
+        tokenizer = mdVectorTokenizer(SOURCE.encode())
+    else:
+        tokenizer = mdTokenizer(io.StringIO(SOURCE), engine=engine)
+    stats.instrumentTokenizer(tokenizer)
+    tokenizer.tokenize()
+    tokens = tokenizer.returnTokenList()
+    stats.countTokens(tokens)
+    return tokens
+
+
+class statsTest(unittest.TestCase):
+    def testEveryEngineCountsTheWholeSource(self):
+        for engine in ("char", "line", "mmap", "vector"):
+            stats = statsCollector()
+            tokenizeWith(engine, stats)
+            self.assertEqual(stats.chars, len(SOURCE), engine)
+            self.assertEqual(stats.calls["tokenizer.tokenize"], 1, engine)
+
+    def testVectorEngineCountsTheLinesItDelegates(self):
+        stats = statsCollector()
+        tokenizeWith("vector", stats)
+        # The fenced and the indented code block go through the byte engine
+        self.assertEqual(stats.calls["tokenizer.tokenizeLine"], 2)
+
+    def testTraceWritesTokensAndConvertedTokens(self):
+        trace = io.StringIO()
+        stats = statsCollector(trace)
+        tokens = tokenizeWith("char", stats)
+        converter = stats.instrumentConverter(HTMLConverter(tokens, io.StringIO()))
+        converter.convertTokens()
+        lines = trace.getvalue().splitlines()
+        self.assertIn("Insert hr", lines)
+        self.assertIn("got rbold", lines)
+        self.assertIn(str(tokens), lines)
+        self.assertIn(str(tokens[0]), lines)
+
+    def testNoTraceWithoutTraceFile(self):
+        stats = statsCollector()
+        tokens = tokenizeWith("char", stats)
+        output = io.StringIO()
+        stats.instrumentConverter(HTMLConverter(tokens, output)).convertTokens()
+        self.assertIsNone(stats.trace)
+        self.assertEqual(stats.calls["converter.HR"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,166 @@
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#     Copyright (C) 2019 Yavor Konstantinov
+#
+
+from tokenType import tokType
+from HtmlConverter import HTMLConverter
+from mdownMapped import mdMappedTokenizer
+from mdownStructure import mdTokenizer
+from mdownTree import buildTree, containerNode
+from mdownVector import mdVectorTokenizer
+import io
+import sys
+import unittest
+
+# Levels of nesting the request asks the tree to handle
+DEPTH = 50
+
+
+def treeOf(text, engine="char"):
+    """ Tokenize text into its container tree with the given engine """
+    if engine == "mmap":
+        tokenizer = mdMappedTokenizer(text.encode("utf-8"))
+    elif engine == "vector":
+        tokenizer = mdVectorTokenizer(text.encode("utf-8"))
+    else:
+        tokenizer = mdTokenizer(io.StringIO(text), engine=engine)
+    return tokenizer.tokenizeTree()
+
+
+def containerPath(tree):
+    """ Types of the containers on the way down to the deepest one, always
+        following the last container of a node. Walks with a loop so it
+        does not recurse either """
+    path = []
+    children = tree
+    while True:
+        nodes = [node for node in children if isinstance(node, containerNode)]
+        if len(nodes) == 0:
+            return path
+        path.append(nodes[-1].type)
+        children = nodes[-1].children
+
+
+def texts(node):
+    """ Contents of the plain tokens held directly by a container """
+    return [
+        token["content"]
+        for child in node.children
+        if isinstance(child, list)
+        for token in child
+        if token["type"] == tokType.PLAIN
+    ]
+
+
+class treeTest(unittest.TestCase):
+    def render(self, tree):
+        return HTMLConverter(tree).render(nested=True)
+
+    def renderShallow(self, tree):
+        """ Render with a recursion limit barely above the current call
+            depth, which a recursive walk of the tree would run into """
+        limit = sys.getrecursionlimit()
+        frame = sys._getframe()
+        depth = 0
+        while frame is not None:
+            depth += 1
+            frame = frame.f_back
+        sys.setrecursionlimit(depth + 30)
+        try:
+            return self.render(tree)
+        finally:
+            sys.setrecursionlimit(limit)
+
+    def testDeepLists(self):
+        text = "".join("  " * level + "- item{0}\n".format(level) for level in range(DEPTH))
+        tree = treeOf(text)
+        self.assertEqual(containerPath(tree), [tokType.LIST, tokType.LISTITEM] * DEPTH)
+        html = self.renderShallow(tree)
+        self.assertEqual(html.count("<ul>"), DEPTH)
+        self.assertEqual(html.count("</ul>"), DEPTH)
+        self.assertEqual(html.count("<li>"), DEPTH)
+        self.assertIn("<li>item{0}</li>".format(DEPTH - 1), html)
+
+    def testDeepQuotes(self):
+        for text in (">" * DEPTH + " deep\n", "> " * DEPTH + "deep\n"):
+            tree = treeOf(text)
+            self.assertEqual(containerPath(tree), [tokType.BLOCKQUOTE] * DEPTH)
+            html = self.renderShallow(tree)
+            self.assertEqual(html.count("<blockquote>"), DEPTH)
+            self.assertEqual(html.count("</blockquote>"), DEPTH)
+            self.assertIn("<p>deep</p>", html)
+
+    def testVeryDeepNesting(self):
+        # Far past the default recursion limit
+        depth = sys.getrecursionlimit() * 2
+        tree = treeOf(">" * depth + " deep\n")
+        self.assertEqual(len(containerPath(tree)), depth)
+        self.assertEqual(self.render(tree).count("<blockquote>"), depth)
+
+    def testQuotesInsideLists(self):
+        text = "- a\n  > q\n  > > r\n  - b\n> top\nplain\n"
+        tree = treeOf(text)
+        self.assertEqual([getattr(node, "type", None) for node in tree], [
+            tokType.LIST, tokType.BLOCKQUOTE, None, None,
+        ])
+        item = tree[0].children[0]
+        quote, innerList = item.children
+        self.assertEqual(quote.type, tokType.BLOCKQUOTE)
+        self.assertEqual(texts(quote), ["q"])
+        self.assertEqual(texts(quote.children[1]), ["r"])
+        self.assertEqual(innerList.type, tokType.LIST)
+        self.assertEqual(texts(tree[1]), ["top"])
+        self.assertEqual(tree[2][0]["content"], "plain")
+        self.assertEqual(self.render(tree), (
+            "<ul>\n<li>a\n<blockquote>\n<p>q</p>\n<blockquote>\n<p>r</p>\n"
+            "</blockquote>\n</blockquote>\n<ul>\n<li>b</li>\n</ul>\n</li>\n"
+            "</ul>\n<blockquote>\n<p>top</p>\n</blockquote>\n<p>plain</p>\n"
+        ))
+
+    def testQuoteLevelsGoBackUp(self):
+        tree = treeOf("> x\n> > y\n> back\nafter\n")
+        quote = tree[0]
+        self.assertEqual(texts(quote), ["x", "back"])
+        self.assertEqual(texts(quote.children[1]), ["y"])
+        self.assertEqual(tree[1][0]["content"], "after")
+
+    def testListItemsAndLevels(self):
+        tree = treeOf("- a\n  - b\n    more\n- c\n1. one\n")
+        bullets, numbers = tree[0], tree[1]
+        self.assertFalse(bullets.ordered)
+        self.assertTrue(numbers.ordered)
+        self.assertEqual(len(bullets.children), 2)
+        nested = bullets.children[0].children[0]
+        self.assertEqual(nested.type, tokType.LIST)
+        self.assertEqual(texts(nested.children[0]), ["more"])
+
+    def testEnginesAgree(self):
+        text = (
+            "".join("  " * level + "- item{0}\n".format(level) for level in range(DEPTH))
+            + "\n" + ">" * DEPTH + " deep\n"
+            + "- a\n  > q\n  > > r\n  - b\n> top\nplain\n"
+        )
+        expected = self.render(treeOf(text))
+        for engine in ("line", "mmap", "vector"):
+            self.assertEqual(self.render(treeOf(text, engine)), expected, engine)
+        # Building the tree after tokenizing gives the same tree
+        tokenizer = mdTokenizer(io.StringIO(text))
+        tokenizer.tokenize()
+        self.assertEqual(self.render(buildTree(tokenizer.returnTokenList())), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -46,3 +46,7 @@ class tokType(Enum):
     NUMBULLET = auto()
     # Crossed out text
     CROSS = auto()
+    # List of bullets or numbered bullets, see mdownTree
+    LIST = auto()
+    # Item of a list along with everything nested under it
+    LISTITEM = auto()
@@ -15,12 +15,32 @@
 #     Copyright (C) 2019 Yavor Konstantinov
 #
 
-from mdownParser import mdTokenizer
+from mdownStructure import mdTokenizer
+from mdownMapped import mdMappedTokenizer, mapFile
+from mdownVector import mdVectorTokenizer
 from HtmlConverter import HTMLConverter
-from sys import exit
+from htmlCache import conversionCache
+from mdownStats import statsCollector
+from mdownOutline import outlineFile
+from mdownParallel import convertParallel
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from sys import exit, stderr
 import argparse
+import glob
+import io
+import json
 import os
 
+# Files are handed to the worker processes in chunks of about this many bytes
+# so that small files do not each pay for a round trip to a worker
+CHUNK_BYTES = 1 << 20
+
+# A single file at least this large is converted by several worker processes
+PARALLEL_BYTES = 16 << 20
+
+# Engines which tokenize the raw bytes of the input file
+BYTE_ENGINES = {"mmap": mdMappedTokenizer, "vector": mdVectorTokenizer}
+
 
 def checkArgPath(args):
     """ Checks whether or not the provided file paths exists. If needed, 
@@ -31,13 +51,14 @@ def checkArgPath(args):
         if args.output is not None:
             # Case of providing a valid output file
             if os.path.isfile(args.output) is True:
-                outputFileHandle = open(args.output, "w")
+                outputFileHandle = open(args.output, "w", encoding="utf-8")
             # Case of outptut file not existing. Create any new directories
             # along the way
             else:
                 outputPath, outputFile = os.path.split(args.output)
-                os.makedirs(outputPath)
-                outputFileHandle = open(args.output, "w")
+                if outputPath != "":
+                    os.makedirs(outputPath, exist_ok=True)
+                outputFileHandle = open(args.output, "w", encoding="utf-8")
 
         # If the output file is not provided, one is created in the same folder
         # with the same name
@@ -46,7 +67,9 @@ def checkArgPath(args):
             inputHead, inputTail = os.path.split(args.path)
             inputTail = inputTail.split(".")[0]
             inputTail += ".html"
-            outputFileHandle = open(os.path.join(inputHead, inputTail), "w+")
+            outputFileHandle = open(
+                os.path.join(inputHead, inputTail), "w+", encoding="utf-8"
+            )
 
         # Open the input file
         inputFileHandle = open(args.path)
@@ -57,33 +80,388 @@ def checkArgPath(args):
             """The provided path to the input file does not exist. Please
                 double check that you provided it correctly!"""
         )
-        sys.exit(1)
+        exit(1)
+
+
+def tokenizeFile(source, engine="char", stats=None):
+    """ Tokenize an open markdown file and return its token list. The mmap
+        and vector engines map the file into memory and scan it as bytes
+        instead of reading it. They also accept the raw bytes of a file as
+        source """
+    if engine in BYTE_ENGINES:
+        buffer = source if isinstance(source, bytes) else mapFile(source)
+        tokenizer = BYTE_ENGINES[engine](buffer)
+    else:
+        tokenizer = mdTokenizer(source, engine=engine)
+    if stats is not None:
+        stats.instrumentTokenizer(tokenizer)
+    tokenizer.tokenize()
+    if engine in BYTE_ENGINES:
+        tokenizer.close()
+
+    tokens = tokenizer.returnTokenList()
+    if stats is not None:
+        stats.countTokens(tokens)
+    return tokens
+
+
+def convertFile(inputPath, outputPath, engine="char", cache=None, stats=None):
+    """ Convert the markdown file at inputPath to an HTML file at outputPath.
+        With a cache, the HTML is taken from it when the input has already
+        been converted and added to it otherwise. With a statsCollector, the
+        tokenizer and the converter are instrumented """
+    if cache is not None:
+        with open(inputPath, "rb") as inputFile:
+            inputBytes = inputFile.read()
+        key = cache.keyFor(inputBytes, engine)
+        if cache.fetch(key, outputPath):
+            return
+        if engine in BYTE_ENGINES:
+            tokens = tokenizeFile(inputBytes, engine, stats)
+        else:
+            # Decode the same way open() would have
+            tokens = tokenizeFile(io.TextIOWrapper(io.BytesIO(inputBytes)), engine, stats)
+    else:
+        with open(inputPath, "rb" if engine in BYTE_ENGINES else "r") as inputFile:
+            tokens = tokenizeFile(inputFile, engine, stats)
+
+    if cache is not None:
+        converter = HTMLConverter(tokens)
+        if stats is not None:
+            stats.instrumentConverter(converter)
+        cache.placeFile(cache.store(key, converter.render()), outputPath)
+        return
+
+    outputDir = os.path.dirname(outputPath)
+    if outputDir != "":
+        os.makedirs(outputDir, exist_ok=True)
+    with open(outputPath, "w", encoding="utf-8") as outputFile:
+        converter = HTMLConverter(tokens, outputFile)
+        if stats is not None:
+            stats.instrumentConverter(converter)
+        converter.convertTokens()
+
+
+def convertChunk(jobs, engine, cacheOptions=None, collectStats=False):
+    """ Convert a chunk of (inputPath, outputPath) pairs inside a worker
+        process. cacheOptions is a (directory, hardlink) pair when a cache is
+        used. Returns a list of (inputPath, error) pairs for the files which
+        could not be converted, the cache hit and miss counts and the
+        collected stats(None unless collectStats is set) """
+    cache = None
+    if cacheOptions is not None:
+        cache = conversionCache(cacheOptions[0], hardlink=cacheOptions[1])
+    stats = statsCollector() if collectStats else None
+
+    failures = []
+    for inputPath, outputPath in jobs:
+        try:
+            convertFile(inputPath, outputPath, engine, cache, stats)
+        except Exception as error:
+            failures.append((inputPath, "{0}: {1}".format(type(error).__name__, error)))
+
+    statsData = None if stats is None else stats.asDict()
+    if cache is None:
+        return (failures, 0, 0, statsData)
+    return (failures, cache.hits, cache.misses, statsData)
+
+
+def globRoot(pattern):
+    """ Return the directory part of a glob pattern which comes before the
+        first wildcard. Used as the root of the tree mirrored in the output """
+    parts = []
+    for part in pattern.split(os.sep):
+        if any(char in part for char in "*?["):
+            break
+        parts.append(part)
+    return os.sep.join(parts)
+
+
+def findMarkdownFiles(inputs):
+    """ Expand the provided files, directories and glob patterns into a list
+        of (root, path) pairs for every markdown file. The root is the
+        directory the path is mirrored from """
+    found = []
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            for dirPath, dirNames, fileNames in os.walk(pattern):
+                dirNames.sort()
+                for fileName in sorted(fileNames):
+                    if fileName.endswith(".md"):
+                        found.append((pattern, os.path.join(dirPath, fileName)))
+        elif os.path.isfile(pattern):
+            found.append((os.path.dirname(pattern), pattern))
+        else:
+            root = globRoot(pattern)
+            for path in sorted(glob.glob(pattern, recursive=True)):
+                if path.endswith(".md") and os.path.isfile(path):
+                    found.append((root, path))
+    return found
+
+
+def outputPathFor(root, path, outputDir):
+    """ Return the path of the HTML file for the markdown file at path. With
+        an output directory, the tree below root is mirrored into it """
+    htmlName = os.path.splitext(os.path.relpath(path, root or "."))[0] + ".html"
+    if outputDir is None:
+        return os.path.splitext(path)[0] + ".html"
+    return os.path.join(outputDir, htmlName)
+
+
+def chunkJobs(jobs, chunkBytes=CHUNK_BYTES):
+    """ Group (inputPath, outputPath) pairs into chunks of roughly chunkBytes
+        of input. A file which can not be looked at counts as empty, its
+        conversion reports the error """
+    chunk = []
+    chunkSize = 0
+    for job in jobs:
+        chunk.append(job)
+        try:
+            chunkSize += os.path.getsize(job[0])
+        except OSError:
+            pass
+        if chunkSize >= chunkBytes:
+            yield chunk
+            chunk = []
+            chunkSize = 0
+    if len(chunk) != 0:
+        yield chunk
+
+
+def convertBatch(jobs, jobCount, engine="char", cacheOptions=None, stats=None, chunkBytes=CHUNK_BYTES):
+    """ Convert every (inputPath, outputPath) pair using a pool of worker
+        processes. A failing file is reported without stopping the run.
+        Returns the failures along with the cache hit and miss counts. The
+        stats of every worker are merged into stats when it is provided. Each
+        worker task holds roughly chunkBytes of input """
+    chunks = list(chunkJobs(jobs, chunkBytes))
+    failures = []
+    hits = misses = 0
+
+    def addResult(result):
+        nonlocal hits, misses
+        chunkFailures, chunkHits, chunkMisses, statsData = result
+        failures.extend(chunkFailures)
+        hits += chunkHits
+        misses += chunkMisses
+        if statsData is not None:
+            stats.merge(statsData)
+
+    # Not worth starting worker processes for a single chunk
+    if jobCount == 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            addResult(convertChunk(chunk, engine, cacheOptions, stats is not None))
+        return (failures, hits, misses)
+
+    with ProcessPoolExecutor(max_workers=jobCount) as pool:
+        futures = {
+            pool.submit(convertChunk, chunk, engine, cacheOptions, stats is not None): chunk
+            for chunk in chunks
+        }
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as error:
+                # The worker itself died, every file of the chunk is failed
+                for inputPath, outputPath in futures[future]:
+                    failures.append((inputPath, "{0}: {1}".format(type(error).__name__, error)))
+                continue
+            addResult(result)
+
+    return (failures, hits, misses)
+
+
+def printStats(stats, statsFormat):
+    """ Print the collected stats as a report or as JSON """
+    if statsFormat == "json":
+        print(stats.toJson())
+    else:
+        print(stats.report())
+
+
+def printOutlines(inputs, tocFormat):
+    """ Print the headings of every markdown file found in inputs, as text
+        lines of the form path:line: heading or as JSON. Returns the number
+        of files which could not be read """
+    outlines = {}
+    failures = 0
+    for root, path in findMarkdownFiles(inputs):
+        try:
+            outlines[path] = outlineFile(path)
+        except (OSError, UnicodeDecodeError) as error:
+            print("Failed to read {0}: {1}".format(path, error), file=stderr)
+            failures += 1
+
+    if tocFormat == "json":
+        print(
+            json.dumps(
+                {
+                    path: [
+                        {"level": level, "text": text, "offset": offset, "line": line}
+                        for level, text, offset, line in outline
+                    ]
+                    for path, outline in outlines.items()
+                },
+                indent=2,
+            )
+        )
+    else:
+        for path, outline in outlines.items():
+            for level, text, offset, line in outline:
+                print("{0}:{1}: {2}{3}".format(path, line, "  " * (level - 1), text))
+    return failures
 
 
 def main():
     parser = argparse.ArgumentParser(
         description="Convert the provided file from Markdown to HTML"
     )
-    parser.add_argument("path", help="The path to the file to be converted")
+    parser.add_argument(
+        "path",
+        nargs="*",
+        help="The path to the file to be converted. Several files, directories or glob patterns can be provided to convert every .md file they contain",
+    )
     parser.add_argument(
         "-o",
         "--output",
-        help="The path for the output file. If it is not provided, an HTML file will be created in the same folder with the same file name but ending with a .html file extension.",
+        help="The path for the output file. If it is not provided, an HTML file will be created in the same folder with the same file name but ending with a .html file extension. When converting several files, this is the directory the input tree is mirrored into.",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of worker processes used when converting several files or a single large one",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["char", "line"] + sorted(BYTE_ENGINES),
+        default="char",
+        help="The tokenizer engine to use. mmap runs the line engine over the memory mapped bytes of the file, vector classifies all of its lines at once with NumPy",
+    )
+    parser.add_argument(
+        "--cache",
+        metavar="DIR",
+        help="Directory of a conversion cache. Files whose content was already converted are copied from it instead of being converted again",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        metavar="MB",
+        help="Trim the least recently used entries of the cache down to this size at the end of the run",
+    )
+    parser.add_argument(
+        "--cache-hardlink",
+        action="store_true",
+        help="Hardlink files out of the cache instead of copying them",
+    )
+    parser.add_argument(
+        "--stats",
+        nargs="?",
+        const="text",
+        choices=["text", "json"],
+        help="Print call counts and timings of the tokenizer rules and converter passes, as a report or as JSON",
+    )
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help="Write the tokens, and every token as it is converted, to stderr for debugging",
+    )
+    parser.add_argument(
+        "--toc",
+        nargs="?",
+        const="text",
+        choices=["text", "json"],
+        help="Print the headings of the provided files, with their level, line and offset, instead of converting them",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Run a render daemon which keeps the converter loaded and converts the files sent by yamdClient.py",
+    )
+    parser.add_argument(
+        "--socket",
+        metavar="PATH",
+        help="Unix socket the daemon listens on. Defaults to one in $XDG_RUNTIME_DIR, or in a private directory of the user in the temporary directory",
     )
     args = parser.parse_args()
+    stats = None
+    if args.stats is not None or args.trace:
+        stats = statsCollector(stderr if args.trace else None)
+
+    if args.daemon:
+        # Imported here since the daemon module imports this one
+        from mdownDaemon import serve
+
+        try:
+            serve(args.socket, args.jobs, args.engine)
+        except OSError as error:
+            print("Could not start the daemon: {0}".format(error), file=stderr)
+            exit(1)
+        return
+    if len(args.path) == 0:
+        parser.error("the following arguments are required: path")
+    if args.toc is not None:
+        exit(1 if printOutlines(args.path, args.toc) != 0 else 0)
+
+    batchMode = len(args.path) > 1 or not os.path.isfile(args.path[0])
+    if batchMode or args.cache is not None:
+        if batchMode:
+            # Directories, glob patterns and multiple files
+            jobs = [
+                (path, outputPathFor(root, path, args.output))
+                for root, path in findMarkdownFiles(args.path)
+            ]
+        else:
+            jobs = [(args.path[0], args.output or outputPathFor("", args.path[0], None))]
+
+        cacheOptions = None
+        if args.cache is not None:
+            cacheOptions = (args.cache, args.cache_hardlink)
+        failures, hits, misses = convertBatch(
+            jobs, args.jobs, args.engine, cacheOptions, stats
+        )
+
+        for inputPath, error in sorted(failures):
+            print("Failed to convert {0}: {1}".format(inputPath, error), file=stderr)
+        print("Converted {0} of {1} files".format(len(jobs) - len(failures), len(jobs)))
+        if args.cache is not None:
+            maxBytes = None if args.cache_size is None else args.cache_size << 20
+            evicted = conversionCache(args.cache, maxBytes).evict()
+            print("Cache: {0} hits, {1} misses, {2} evicted".format(hits, misses, evicted))
+        if args.stats is not None:
+            printStats(stats, args.stats)
+        exit(1 if len(failures) != 0 else 0)
+    args.path = args.path[0]
 
     # File handles for input and output file
     inputFile, outputFile = checkArgPath(args)
 
-    tokenizer = mdTokenizer(inputFile)
-    tokenizer.tokenize()
+    # A large file is converted in chunks by several worker processes
+    if (
+        args.jobs != 1
+        and stats is None
+        and args.engine not in BYTE_ENGINES
+        and os.path.getsize(args.path) >= PARALLEL_BYTES
+    ):
+        outputFile.write(convertParallel(inputFile.read(), args.jobs, args.engine))
+        inputFile.close()
+        outputFile.close()
+        return
+
     # List of tokens extracted from the markdown input file provided
-    tokens = tokenizer.returnTokenList()
-    print(tokens)
+    tokens = tokenizeFile(inputFile, args.engine, stats)
+    inputFile.close()
 
     converter = HTMLConverter(tokens, outputFile)
+    if stats is not None:
+        stats.instrumentConverter(converter)
     # Convert the tokens and output to an HTML file
     converter.convertTokens()
+    outputFile.close()
+
+    if args.stats is not None:
+        printStats(stats, args.stats)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,170 @@
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License as published by
+#     the Free Software Foundation, either version 3 of the License, or
+#     (at your option) any later version.
+
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#     GNU General Public License for more details.
+
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+#     Copyright (C) 2019 Yavor Konstantinov
+#
+
+""" Tiny client of the render daemon started with yamd2html.py --daemon.
+    Only imports what it needs to talk to the daemon so that it starts fast.
+    When no daemon is running, the file is converted in this process:
+
+        python yamdClient.py INPUT [OUTPUT] [--socket PATH] [--engine ENGINE]
+
+    INPUT may be - to convert the markdown read from stdin. Without an
+    OUTPUT, the HTML is written next to INPUT, or to stdout for stdin """
+
+import json
+import os
+import socket
+import stat
+import struct
+import sys
+
+USAGE = "usage: yamdClient.py INPUT [OUTPUT] [--socket PATH] [--engine ENGINE]"
+
+
+def privateSocketDir():
+    """ Directory holding the daemon socket when none is given. The runtime
+        directory of the user if there is one, otherwise a directory of the
+        user in the temporary directory which the daemon creates with mode
+        0700. tempfile is not used as importing it costs more than the rest
+        of the client """
+    runtimeDir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtimeDir:
+        return runtimeDir
+    tempDir = os.environ.get("TMPDIR") or "/tmp"
+    return os.path.join(tempDir, "yamd2html-{0}".format(os.getuid()))
+
+
+def defaultSocketPath():
+    """ Path of the daemon socket when none is given. Taken from the
+        YAMD2HTML_SOCKET environment variable, otherwise one per user in
+        privateSocketDir() """
+    path = os.environ.get("YAMD2HTML_SOCKET")
+    if path:
+        return path
+    return os.path.join(privateSocketDir(), "yamd2html.sock")
+
+
+def checkSocketOwner(socketPath):
+    """ Raise PermissionError unless socketPath is a socket owned by the
+        current user. Anything else may have been put there by another user
+        to receive the documents sent to the daemon """
+    info = os.lstat(socketPath)
+    if not stat.S_ISSOCK(info.st_mode) or info.st_uid != os.getuid():
+        raise PermissionError(
+            "{0} is not a socket owned by the current user".format(socketPath)
+        )
+
+
+def checkPeerOwner(client, socketPath):
+    """ Raise PermissionError unless the process at the other end of a
+        connected socket runs as the current user. Only checked where the
+        platform tells, the owner of the socket file is checked everywhere """
+    if not hasattr(socket, "SO_PEERCRED"):
+        return
+    credentials = client.getsockopt(
+        socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")
+    )
+    pid, uid, gid = struct.unpack("3i", credentials)
+    if uid != os.getuid():
+        raise PermissionError(
+            "The daemon on {0} is not run by the current user".format(socketPath)
+        )
+
+
+def requestRender(request, socketPath=None):
+    """ Send a conversion request to the daemon and return its response.
+        Returns None if no daemon is listening on the socket. Raises
+        PermissionError if the socket, or the daemon listening on it, does
+        not belong to the current user. Nothing is sent to it then """
+    socketPath = socketPath or defaultSocketPath()
+    try:
+        checkSocketOwner(socketPath)
+    except FileNotFoundError:
+        return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            client.connect(socketPath)
+        except (FileNotFoundError, ConnectionRefusedError):
+            return None
+        checkPeerOwner(client, socketPath)
+        client.sendall(json.dumps(request).encode() + b"\n")
+        with client.makefile("rb") as reply:
+            line = reply.readline()
+    finally:
+        client.close()
+    if line == b"":
+        # The daemon went away before answering
+        return None
+    return json.loads(line)
+
+
+def render(request, socketPath=None):
+    """ Have the daemon convert a request, or convert it in this process if
+        no daemon is running """
+    response = requestRender(request, socketPath)
+    if response is None:
+        from mdownDaemon import renderRequest
+
+        response = renderRequest(request)
+    return response
+
+
+def main(argv):
+    positional = []
+    options = {"--socket": None, "--engine": None}
+    index = 0
+    while index < len(argv):
+        if argv[index] in options and index + 1 < len(argv):
+            options[argv[index]] = argv[index + 1]
+            index += 2
+        elif argv[index].startswith("--") or len(positional) == 2:
+            print(USAGE, file=sys.stderr)
+            return 2
+        else:
+            positional.append(argv[index])
+            index += 1
+    if len(positional) == 0:
+        print(USAGE, file=sys.stderr)
+        return 2
+
+    # Paths are sent as absolute ones since the daemon runs in its own
+    # working directory
+    request = {}
+    if positional[0] == "-":
+        request["content"] = sys.stdin.read()
+    else:
+        request["input"] = os.path.abspath(positional[0])
+    if len(positional) == 2:
+        request["output"] = os.path.abspath(positional[1])
+    if options["--engine"] is not None:
+        request["engine"] = options["--engine"]
+
+    try:
+        response = render(request, options["--socket"])
+    except PermissionError as error:
+        print(error, file=sys.stderr)
+        return 1
+    if not response["ok"]:
+        print(response["error"], file=sys.stderr)
+        return 1
+    if "html" in response:
+        sys.stdout.write(response["html"])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))